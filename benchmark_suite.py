@@ -0,0 +1,134 @@
+import sys
+import json
+import argparse
+import platform
+import timeit
+import numpy as np
+import cv2
+import benchmarks
+
+#benchmarks of the suite: name -> function returning a list of (size, seconds) pairs, lower is better
+SUITE = [
+	('fit_error', benchmarks.benchmark_fit_error),
+	('select_ellipses', benchmarks.benchmark_select_ellipses),
+	('closest_points_on_ellipse', benchmarks.benchmark_closest_point),
+	('get_best_correspondence', benchmarks.benchmark_best_correspondence),
+	('transition', benchmarks.benchmark_correspondence),
+	('get_red', benchmarks.benchmark_get_red),
+	('get_filled_binary', benchmarks.benchmark_filled_binary),
+	('track_ellipses', benchmarks.benchmark_end_to_end),
+]
+VERSION = 1
+
+def run_suite(names=None, suite=SUITE):
+	"""
+	Runs the benchmarks of the suite
+
+	Args:
+		names: optional names of the benchmarks to run, all of them if None
+		suite: list of (name, benchmark function), see SUITE
+	Returns:
+		map of benchmark names to lists of (size, seconds) pairs
+	"""
+	unknown_names = set(names or ()) - set(name for name, function in suite)
+	if unknown_names:
+		raise ValueError("unknown benchmarks: %s" % ", ".join(sorted(unknown_names)))
+	return dict((name, function()) for name, function in suite if names is None or name in names)
+
+def save_results(filename, results):
+	"""
+	Writes results of run_suite as json, with the versions of the libraries they were measured with
+	"""
+	data = {
+		'version': VERSION,
+		'python': platform.python_version(),
+		'numpy': np.__version__,
+		'opencv': cv2.__version__,
+		'results': dict((name, [[size, seconds] for size, seconds in pairs]) for name, pairs in results.items()),
+	}
+	with open(filename, 'w') as f:
+		json.dump(data, f, indent=1, sort_keys=True)
+
+def load_results(filename):
+	"""
+	Returns results written by save_results, as map of benchmark names to lists of (size, seconds) pairs
+	"""
+	with open(filename) as f:
+		data = json.load(f)
+	if data.get('version') != VERSION:
+		raise ValueError("unsupported benchmark results version %s" % data.get('version'))
+	return dict((name, [(size, seconds) for size, seconds in pairs]) for name, pairs in data['results'].items())
+
+def compare_results(results, baseline, threshold=20., min_difference=1e-5):
+	"""
+	Compares results against a baseline, size by size
+
+	Args:
+		results: map of benchmark names to lists of (size, seconds) pairs, see run_suite
+		baseline: results to compare to; benchmarks and sizes missing from either side are skipped
+		threshold: percentage by which a timing may exceed its baseline before it counts as a regression
+		min_difference: seconds by which a timing must exceed its baseline to count as a regression, so that
+			jitter on the fastest timings is not reported
+	Returns:
+		list of (name, size, baseline seconds, seconds, percentage slower) of every timing compared, and list of
+		the ones that are regressions
+	"""
+	comparisons = []
+	regressions = []
+	for name in sorted(results):
+		#sizes become strings or lists in json, so they are compared as strings
+		baseline_seconds = dict((str(size), seconds) for size, seconds in baseline.get(name, ()))
+		for size, seconds in results[name]:
+			if str(size) not in baseline_seconds: continue
+			old_seconds = baseline_seconds[str(size)]
+			slowdown = 100.*(seconds - old_seconds)/old_seconds if old_seconds > 0 else float('inf')
+			comparison = (name, size, old_seconds, seconds, slowdown)
+			comparisons.append(comparison)
+			if slowdown > threshold and seconds - old_seconds > min_difference:
+				regressions.append(comparison)
+	return comparisons, regressions
+
+def print_comparisons(comparisons, regressions):
+	"""
+	Prints a table of the timings compared by compare_results, marking the regressions
+	"""
+	for comparison in comparisons:
+		name, size, old_seconds, seconds, slowdown = comparison
+		print "%-26s %10s %12.3f ms %12.3f ms %+8.1f%%%s" % (name, size, old_seconds*1000, seconds*1000, slowdown,
+			"  REGRESSION" if comparison in regressions else "")
+
+def main(argv=None):
+	"""
+	Runs the suite from the command line, e.g.
+
+		python benchmark_suite.py --output results.json --baseline baseline.json --threshold 20
+
+	Returns:
+		exit status: 1 if any timing regressed past the threshold, 0 otherwise
+	"""
+	parser = argparse.ArgumentParser(description="Times the hot paths and compares them against a baseline")
+	parser.add_argument('--output', help="json file to write the results to")
+	parser.add_argument('--baseline', help="json file of results to compare against")
+	parser.add_argument('--threshold', type=float, default=20., help="percentage slower than the baseline that fails")
+	parser.add_argument('--only', nargs='+', metavar='NAME', help="benchmarks to run, out of: %s" % ", ".join(name for name, f in SUITE))
+	args = parser.parse_args(argv)
+
+	start = timeit.default_timer()
+	results = run_suite(args.only)
+	print "ran %d benchmarks in %.1f s" % (len(results), timeit.default_timer() - start)
+	if args.output:
+		save_results(args.output, results)
+	if not args.baseline:
+		for name in sorted(results):
+			benchmarks.print_results(name, results[name])
+		return 0
+
+	comparisons, regressions = compare_results(results, load_results(args.baseline), args.threshold)
+	print_comparisons(comparisons, regressions)
+	if regressions:
+		print "%d of %d timings are more than %g%% slower than the baseline" % (len(regressions), len(comparisons), args.threshold)
+		return 1
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
\ No newline at end of file
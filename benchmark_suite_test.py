@@ -0,0 +1,53 @@
+import unittest
+import os
+import shutil
+import tempfile
+import benchmark_suite
+
+class Benchmark_Suite_Test(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.suite = [('fast', lambda: [(10, .001), ('640x480', .002)]), ('slow', lambda: [(10, .5)])]
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_run_suite(self):
+		self.assertEqual({'fast': [(10, .001), ('640x480', .002)], 'slow': [(10, .5)]}, benchmark_suite.run_suite(suite=self.suite))
+		self.assertEqual(['slow'], list(benchmark_suite.run_suite(['slow'], self.suite)))
+		self.assertRaises(ValueError, benchmark_suite.run_suite, ['missing'], self.suite)
+
+	def test_save_and_load_results(self):
+		results = benchmark_suite.run_suite(suite=self.suite)
+		filename = os.path.join(self.directory, 'results.json')
+		benchmark_suite.save_results(filename, results)
+		self.assertEqual(results, benchmark_suite.load_results(filename))
+
+	def test_compare_results(self):
+		baseline = {'fast': [(10, .001), ('640x480', .002)], 'slow': [(10, .5)], 'removed': [(1, 1.)]}
+		results = {'fast': [(10, .0011), ('640x480', .003)], 'slow': [(10, .4)], 'added': [(1, 1.)]}
+		comparisons, regressions = benchmark_suite.compare_results(results, baseline, threshold=20)
+		self.assertEqual(['fast', 'fast', 'slow'], [c[0] for c in comparisons])
+		self.assertEqual(1, len(regressions))
+		name, size, old_seconds, seconds, slowdown = regressions[0]
+		self.assertEqual(('fast', '640x480', .002, .003), (name, size, old_seconds, seconds))
+		self.assertAlmostEqual(50, slowdown)
+		self.assertEqual(2, len(benchmark_suite.compare_results(results, baseline, threshold=5)[1]))
+
+	def test_compare_results_ignores_tiny_differences(self):
+		comparisons, regressions = benchmark_suite.compare_results({'fast': [(10, 2e-6)]}, {'fast': [(10, 1e-6)]})
+		self.assertEqual(1, len(comparisons))
+		self.assertEqual([], regressions)
+
+	def test_main_fails_on_regression(self):
+		filename = os.path.join(self.directory, 'results.json')
+		self.assertEqual(0, benchmark_suite.main(['--only', 'closest_points_on_ellipse', '--output', filename]))
+		results = benchmark_suite.load_results(filename)
+		self.assertEqual(['closest_points_on_ellipse'], list(results))
+		self.assertEqual(0, benchmark_suite.main(['--only', 'closest_points_on_ellipse', '--baseline', filename, '--threshold', '1000']))
+		faster = dict((name, [(size, seconds/100) for size, seconds in pairs]) for name, pairs in results.items())
+		benchmark_suite.save_results(filename, faster)
+		self.assertEqual(1, benchmark_suite.main(['--only', 'closest_points_on_ellipse', '--baseline', filename]))
+
+if __name__ == '__main__':
+	unittest.main()
\ No newline at end of file
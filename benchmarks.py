@@ -0,0 +1,531 @@
+import os
+import random
+import shutil
+import tempfile
+import timeit
+import cv2
+import numpy as np
+import correspondence_tracking as ct
+import fingertip_tracking as ft
+import offline_tracking as ot
+import parameter_sweep
+import color_classifier
+import temporal_segmentation
+from synthetic_video import SyntheticVideo
+from ellipse import ellipse_difference, ellipse_difference_matrix, fit_error, distance_from_point_to_ellipse, closest_points_on_ellipse
+
+def random_ellipse(rng, width=640, height=480):
+	"""
+	Returns a random ellipse lying in a width x height frame
+	"""
+	center = (rng.uniform(0,width), rng.uniform(0,height))
+	axes = (rng.uniform(10,40), rng.uniform(10,40))
+	angle = rng.uniform(0,180)
+	return (center,axes,angle)
+
+def perturb_ellipse(ellipse, rng, step=5):
+	"""
+	Returns ellipse moved, scaled and rotated by a small random amount, as between two frames
+	"""
+	(cx,cy), (major,minor), angle = ellipse
+	center = (cx + rng.uniform(-step,step), cy + rng.uniform(-step,step))
+	axes = (major*rng.uniform(.95,1.05), minor*rng.uniform(.95,1.05))
+	return (center,axes,angle + rng.uniform(-step,step))
+
+def benchmark_correspondence(object_counts=(2,5,10,25,50,100,200,400), repeats=3, seed=0, matrix_function=ellipse_difference_matrix,
+		max_distance=None, frame_size=(640,480)):
+	"""
+	Times ct.transition between two frames of randomly moving ellipses
+
+	Args:
+		object_counts: numbers of ellipses per frame to time
+		repeats: number of timings per object count, the fastest is kept
+		seed: seed for the random ellipses
+		matrix_function: batched cost function passed to ct.transition, None to score pairs one at a time
+		max_distance: optional gating distance passed to ct.transition
+		frame_size: (width, height) of the frame the ellipses are scattered over
+	Returns:
+		list of (object count, seconds per frame)
+	"""
+	rng = random.Random(seed)
+	results = []
+	for count in object_counts:
+		old_ellipses = [random_ellipse(rng, *frame_size) for i in range(count)]
+		new_ellipses = [perturb_ellipse(e, rng) for e in old_ellipses]
+		original_map = dict(zip(old_ellipses, range(count)))
+
+		timer = timeit.Timer(lambda: ct.transition(original_map, new_ellipses, ellipse_difference, matrix_function, lambda e: e[0], max_distance))
+		results.append((count, min(timer.repeat(repeats, 1))))
+	return results
+
+def benchmark_best_correspondence(object_counts=(2,5,10,25,50,100,200), repeats=3, seed=0, frame_size=(640,480)):
+	"""
+	Times ct.get_best_correspondence with ellipse_difference_matrix between two frames of randomly moving ellipses
+
+	Args:
+		object_counts: numbers of ellipses per frame to time
+		repeats: number of timings per object count, the fastest is kept
+		seed: seed for the random ellipses
+		frame_size: (width, height) of the frame the ellipses are scattered over
+	Returns:
+		list of (object count, seconds per call)
+	"""
+	rng = random.Random(seed)
+	results = []
+	for count in object_counts:
+		old_ellipses = [random_ellipse(rng, *frame_size) for i in range(count)]
+		new_ellipses = [perturb_ellipse(e, rng) for e in old_ellipses]
+		f = lambda: ct.get_best_correspondence(old_ellipses, new_ellipses, ellipse_difference, ellipse_difference_matrix)
+		results.append((count, min(timeit.Timer(f).repeat(repeats, 1))))
+	return results
+
+def benchmark_anytime_correspondence(object_counts=(25,100,400), deadlines=(1,5,20), seed=0, frame_size=(200,200)):
+	"""
+	Measures ct.get_anytime_correspondence between two frames of ellipses crowded into a small frame
+
+	Args:
+		object_counts: numbers of ellipses per frame
+		deadlines: deadlines in milliseconds to solve each frame pair with
+		seed: seed for the random ellipses
+		frame_size: (width, height) of the frame the ellipses are scattered over
+	Returns:
+		list of (object count, deadline, seconds used, optimality gap, whether proven optimal)
+	"""
+	rng = random.Random(seed)
+	results = []
+	for count in object_counts:
+		old_ellipses = [random_ellipse(rng, *frame_size) for i in range(count)]
+		new_ellipses = [perturb_ellipse(e, rng) for e in old_ellipses]
+		for deadline in deadlines:
+			pairs, metrics = ct.get_anytime_correspondence(old_ellipses, new_ellipses, ellipse_difference, deadline,
+				ellipse_difference_matrix)
+			results.append((count, deadline, metrics['time'], metrics['gap'], metrics['optimal']))
+	return results
+
+def random_contour(ellipse, length, rng, noise=1.5):
+	"""
+	Returns a contour of length noisy integer points around ellipse, shaped like the output of cv2.findContours
+	"""
+	(cx,cy), (major,minor), angle = ellipse
+	t = np.linspace(0, 2*np.pi, length, endpoint=False)
+	rad = np.radians(angle)
+	x = major/2.*np.cos(t)
+	y = minor/2.*np.sin(t)
+	pnts = np.column_stack((cx + x*np.cos(rad) - y*np.sin(rad), cy + x*np.sin(rad) + y*np.cos(rad)))
+	pnts += np.array([[rng.uniform(-noise,noise), rng.uniform(-noise,noise)] for i in range(length)])
+	return np.round(pnts).astype(np.int32).reshape(-1,1,2)
+
+def benchmark_fit_error(contour_lengths=(10,50,100,500,1000,5000), repeats=3, seed=0, vectorized=True):
+	"""
+	Times fit_error on a noisy contour around a random ellipse
+
+	Args:
+		contour_lengths: numbers of contour points to time
+		repeats: number of timings per contour length, the fastest is kept
+		seed: seed for the random ellipse and contour
+		vectorized: whether to time fit_error or a loop of distance_from_point_to_ellipse over the points
+	Returns:
+		list of (contour length, seconds per call)
+	"""
+	rng = random.Random(seed)
+	results = []
+	for length in contour_lengths:
+		ellipse = random_ellipse(rng)
+		contour = random_contour(ellipse, length, rng)
+		if vectorized:
+			f = lambda: fit_error(ellipse, contour)
+		else:
+			f = lambda: sum(distance_from_point_to_ellipse(tuple(pnt[0]), ellipse) for pnt in contour)
+		results.append((length, min(timeit.Timer(f).repeat(repeats, 1))))
+	return results
+
+def benchmark_closest_point(point_counts=(10,100,1000,10000), repeats=3, seed=0):
+	"""
+	Times closest_points_on_ellipse on points scattered around a random ellipse
+
+	Args:
+		point_counts: numbers of points to time
+		repeats: number of timings per point count, the fastest is kept
+		seed: seed for the random ellipse and points
+	Returns:
+		list of (point count, seconds per call)
+	"""
+	rng = random.Random(seed)
+	results = []
+	for count in point_counts:
+		ellipse = random_ellipse(rng)
+		(cx,cy), axes, angle = ellipse
+		pnts = np.array([(cx + rng.uniform(-50,50), cy + rng.uniform(-50,50)) for i in range(count)])
+		f = lambda: closest_points_on_ellipse(pnts, ellipse)
+		results.append((count, min(timeit.Timer(f).repeat(repeats, 1))))
+	return results
+
+def get_red_two_masks(img, lower_red_bounds=(0,2), upper_red_bounds=(170,180)):
+	"""
+	Reference red extraction with one inRange mask per hue band, as get_red was originally written
+	"""
+	img_hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+	mask0 = ft.hsv_mask(img_hsv, *lower_red_bounds)
+	mask1 = ft.hsv_mask(img_hsv, *upper_red_bounds)
+	mask = mask0 + mask1
+	return cv2.bitwise_and(img, img, mask=mask)
+
+def benchmark_get_red(resolutions=((480,640),(720,1280),(1080,1920),(2160,3840)), repeats=10, seed=0, buffered=True):
+	"""
+	Times red extraction on random frames
+
+	Args:
+		resolutions: (height, width) of the frames to time
+		repeats: number of timings per resolution, the fastest is kept
+		seed: seed for the random frames
+		buffered: whether to time ft.get_red with preallocated buffers or get_red_two_masks
+	Returns:
+		list of (resolution, seconds per frame)
+	"""
+	rng = np.random.RandomState(seed)
+	results = []
+	for height, width in resolutions:
+		img = rng.randint(0, 256, (height,width,3)).astype(np.uint8)
+		if buffered:
+			out = np.empty_like(img)
+			mask_out = np.empty((height,width), np.uint8)
+			hsv_out = np.empty_like(img)
+			band_out = np.empty((height,width), np.uint8)
+			f = lambda: ft.get_red(img, out=out, mask_out=mask_out, hsv_out=hsv_out, band_out=band_out)
+		else:
+			f = lambda: get_red_two_masks(img)
+		results.append(("%dx%d" % (width,height), min(timeit.Timer(f).repeat(repeats, 1))))
+	return results
+
+def benchmark_filled_binary(resolutions=((480,640),(720,1280),(1080,1920),(2160,3840)), repeats=10, seed=0):
+	"""
+	Times ft.get_filled_binary, into a preallocated image, on the thresholded red part of frames of red ellipses
+
+	Args:
+		resolutions: (height, width) of the frames to time
+		repeats: number of timings per resolution, the fastest is kept
+		seed: seed for the random frames
+	Returns:
+		list of (resolution, seconds per frame)
+	"""
+	rng = random.Random(seed)
+	results = []
+	for height, width in resolutions:
+		binary_img = ft.get_red_mask(random_frame(height, width, rng))
+		out = np.empty_like(binary_img)
+		f = lambda: ft.get_filled_binary(binary_img, out=out)
+		results.append(("%dx%d" % (width,height), min(timeit.Timer(f).repeat(repeats, 1))))
+	return results
+
+def random_frame(height, width, rng, count=5):
+	"""
+	Returns a frame of count red ellipses on a green background
+	"""
+	frame = np.zeros((height,width,3), np.uint8)
+	frame[:] = (40,120,40)
+	scale = height/480.
+	for i in range(count):
+		center = (rng.uniform(0,width), rng.uniform(0,height))
+		axes = (rng.uniform(20,60)*scale, rng.uniform(20,60)*scale)
+		cv2.ellipse(frame, (center,axes,rng.uniform(0,180)), (0,0,255), -1)
+	return frame
+
+def benchmark_detection(resolutions=((480,640),(720,1280),(1080,1920)), repeats=5, seed=0, in_place=True, pyramid_levels=0):
+	"""
+	Times ft.detect_ellipses on frames of red ellipses
+
+	Args:
+		resolutions: (height, width) of the frames to time
+		repeats: number of timings per resolution, the fastest is kept
+		seed: seed for the random frames
+		in_place: whether to detect in a ft.FrameContext or with the functional api
+		pyramid_levels: number of times frames are halved for a coarse search first, see ft.detect_ellipses_pyramid
+	Returns:
+		list of (resolution, seconds per frame)
+	"""
+	rng = random.Random(seed)
+	results = []
+	for height, width in resolutions:
+		frame = random_frame(height, width, rng)
+		context = ft.FrameContext(pyramid_levels=pyramid_levels) if in_place else None
+		f = lambda: ft.detect_ellipses(frame, context, pyramid_levels)
+		results.append(("%dx%d" % (width,height), min(timeit.Timer(f).repeat(repeats, 1))))
+	return results
+
+def moving_frames(count, height, width, seed=0, objects=5):
+	"""
+	Returns list of count frames of red ellipses moving across a green background
+	"""
+	rng = random.Random(seed)
+	scale = height/480.
+	ellipses = [random_ellipse(rng, width, height) for i in range(objects)]
+	ellipses = [(c, (a0*scale, a1*scale), t) for c, (a0,a1), t in ellipses]
+	frames = []
+	for i in range(count):
+		frame = np.zeros((height,width,3), np.uint8)
+		frame[:] = (40,120,40)
+		for ellipse in ellipses:
+			cv2.ellipse(frame, ellipse, (0,0,255), -1)
+		frames.append(frame)
+		ellipses = [perturb_ellipse(e, rng, 3*scale) for e in ellipses]
+	return frames
+
+def benchmark_roi(resolutions=((480,640),(1080,1920),(2160,3840)), frame_count=20, margin=20, rescan_interval=10):
+	"""
+	Measures tracking speed with ft.track_ellipses against ft.track_ellipses_roi on moving ellipses
+
+	Args:
+		resolutions: (height, width) of the frames to time
+		frame_count: number of frames per resolution
+		margin: margin passed to track_ellipses_roi
+		rescan_interval: rescan_interval passed to track_ellipses_roi
+	Returns:
+		list of (resolution, full frame seconds per frame, region of interest seconds per frame)
+	"""
+	results = []
+	for height, width in resolutions:
+		frames = moving_frames(frame_count, height, width)
+		start = timeit.default_timer()
+		for result in ft.track_ellipses(frames): pass
+		full = (timeit.default_timer() - start)/frame_count
+		start = timeit.default_timer()
+		for result in ft.track_ellipses_roi(frames, margin, rescan_interval=rescan_interval): pass
+		roi = (timeit.default_timer() - start)/frame_count
+		results.append(("%dx%d" % (width,height), full, roi))
+	return results
+
+def benchmark_incremental_segmentation(resolutions=((480,640),(1080,1920)), frame_count=40, noise=2., seed=0):
+	"""
+	Measures detection speed in a ft.FrameContext against a temporal_segmentation.IncrementalSegmenter, on
+	synthetic video from a fixed camera (see synthetic_video.SyntheticVideo) with pixel noise
+
+	Args:
+		resolutions: (height, width) of the frames to time
+		frame_count: number of frames per resolution
+		noise: standard deviation of the pixel noise
+		seed: seed for the synthetic video
+	Returns:
+		list of (resolution, whole frame seconds per frame, incremental seconds per frame)
+	"""
+	results = []
+	for height, width in resolutions:
+		frames, ground_truth = SyntheticVideo(count=3, frame_count=frame_count, resolution=(height,width), seed=seed,
+			noise=noise).get_frames()
+		timings = []
+		for context in (ft.FrameContext(), temporal_segmentation.IncrementalSegmenter()):
+			start = timeit.default_timer()
+			for frame in frames:
+				context.get_ellipses(frame)
+			timings.append((timeit.default_timer() - start)/frame_count)
+		results.append(("%dx%d" % (width,height),) + tuple(timings))
+	return results
+
+def benchmark_color_classifier(resolutions=((480,640),(1080,1920)), color_counts=(1,2,4), repeats=5, seed=0):
+	"""
+	Measures getting the binary image of every marker color of a frame with get_red_mask (one hsv conversion and
+	two hue bands per color) against one color_classifier.ColorClassifier labeling and one comparison per color
+
+	Args:
+		resolutions: (height, width) of the frames to time
+		color_counts: numbers of colors to time
+		repeats: number of times each is run, the fastest is kept
+		seed: seed for the synthetic video
+	Returns:
+		list of ((resolution, number of colors), get_red_mask seconds, classifier seconds)
+	"""
+	hues = [(0,2), (100,130), (20,35), (140,160)]
+	results = []
+	for height, width in resolutions:
+		frame = SyntheticVideo(count=5, frame_count=1, resolution=(height,width), seed=seed, noise=2.).render(0)[0]
+		for count in color_counts:
+			colors = [(str(i), [((lower,50,50),(upper,255,255))]) for i, (lower, upper) in enumerate(hues[:count])]
+			classifier = color_classifier.ColorClassifier(colors)
+			def hsv_masks():
+				for lower, upper in hues[:count]:
+					ft.get_red_mask(frame, (lower,upper), (181,181))
+			def classifier_masks():
+				labels = classifier.classify(frame)
+				for name in classifier.names:
+					classifier.get_binary(labels, name)
+			results.append((("%dx%d" % (width,height), count), min(timeit.repeat(hsv_masks, number=1, repeat=repeats)),
+				min(timeit.repeat(classifier_masks, number=1, repeat=repeats))))
+	return results
+
+def benchmark_pipeline(video_filename="output.avi", process_counts=(1,2,4), queue_size=8):
+	"""
+	Measures tracking throughput on a recorded video (e.g. from helper.record_video), serially and with
+	ft.follow_ellipses_parallel, checking that every run gives the same per-frame dictionaries
+
+	Args:
+		video_filename: video to track ellipses through
+		process_counts: numbers of detection processes to time follow_ellipses_parallel with
+		queue_size: queue_size passed to follow_ellipses_parallel
+	Returns:
+		list of (number of detection processes or 'serial', seconds per frame)
+	"""
+	start = timeit.default_timer()
+	serial_dictionaries = [d for i, d in ft.track_ellipses(video_filename)]
+	frame_count = max(len(serial_dictionaries), 1)
+	results = [('serial', (timeit.default_timer() - start)/frame_count)]
+
+	for processes in process_counts:
+		start = timeit.default_timer()
+		dictionaries = ft.follow_ellipses_parallel(cv2.VideoCapture(video_filename), processes, queue_size)
+		results.append((processes, (timeit.default_timer() - start)/frame_count))
+		assert dictionaries == serial_dictionaries
+	return results
+
+def benchmark_offline(frame_count=100, resolution=(480,640), process_counts=(0,2,4)):
+	"""
+	Measures offline tracking (ot.track_offline) against frame by frame tracking (ft.track_ellipses) on moving ellipses
+
+	Args:
+		frame_count: number of frames
+		resolution: (height, width) of the frames
+		process_counts: numbers of processes to time track_offline with, 0 for none
+	Returns:
+		list of (number of processes or 'online', seconds per frame)
+	"""
+	frames = moving_frames(frame_count, *resolution)
+	start = timeit.default_timer()
+	for result in ft.track_ellipses(frames): pass
+	results = [('online', (timeit.default_timer() - start)/frame_count)]
+	for processes in process_counts:
+		start = timeit.default_timer()
+		ot.track_offline(frames, processes)
+		results.append((processes, (timeit.default_timer() - start)/frame_count))
+	return results
+
+def cluttered_binary(height, width, rng, level=.8, count=5):
+	"""
+	Returns a filled binary image (see ft.get_filled_binary) of count ellipses among irregular blobs covering
+	about 1 - level of the image
+	"""
+	binary_img = ft.get_red_mask(random_frame(height, width, random.Random(rng.randint(1 << 30)), count))
+	field = cv2.GaussianBlur(rng.rand(height, width).astype(np.float32), (0,0), 2)
+	binary_img[field > np.percentile(field, 100*level)] = 255
+	return ft.get_filled_binary(binary_img)
+
+def benchmark_select_ellipses(clutter_levels=(.97,.9,.8,.6), repeats=5, seed=0, resolution=(480,640), approximate=False,
+		min_circularity=0):
+	"""
+	Times ft.select_ellipses on the contours of frames with more and more clutter (see cluttered_binary)
+
+	Args:
+		clutter_levels: levels passed to cluttered_binary, lower is more clutter
+		repeats: number of timings per level, the fastest is kept
+		seed: seed for the random frames
+		resolution: (height, width) of the frames
+		approximate: whether to rank the candidates on distance fields, see ft.select_ellipses
+		min_circularity: minimum circularity of the contours fitted, see ft.prefilter_contours
+	Returns:
+		list of (number of contours, seconds per call)
+	"""
+	rng = np.random.RandomState(seed)
+	results = []
+	for level in clutter_levels:
+		contours = ft.get_contours_binary(cluttered_binary(resolution[0], resolution[1], rng, level))
+		f = lambda: ft.select_ellipses(contours, approximate=approximate, min_circularity=min_circularity)
+		results.append((len(contours), min(timeit.Timer(f).repeat(repeats, 1))))
+	return results
+
+def benchmark_end_to_end(resolutions=((480,640),(720,1280)), frame_count=100, seed=0):
+	"""
+	Measures tracking speed of ft.track_ellipses, the loop of ft.follow_ellipses without the display, on
+	pre-rendered synthetic video (see synthetic_video.SyntheticVideo)
+
+	Args:
+		resolutions: (height, width) of the frames to time
+		frame_count: number of frames per resolution
+		seed: seed of the videos
+	Returns:
+		list of (resolution, seconds per frame)
+	"""
+	results = []
+	for height, width in resolutions:
+		frames, ground_truth = SyntheticVideo(frame_count=frame_count, resolution=(height,width), seed=seed, noise=10).get_frames()
+		start = timeit.default_timer()
+		for result in ft.track_ellipses(frames): pass
+		results.append(("%dx%d" % (width,height), (timeit.default_timer() - start)/frame_count))
+	return results
+
+def benchmark_accuracy(conditions=((5,0,0),(5,20,0),(5,20,3),(15,20,3)), frame_count=100, resolution=(480,640), seed=0):
+	"""
+	Scores ft.track_ellipses against the ground truth of synthetic videos (see synthetic_video.SyntheticVideo)
+
+	Args:
+		conditions: (number of ellipses, noise, number of occluders) of every video
+		frame_count: number of frames per video
+		resolution: (height, width) of the frames
+		seed: seed of the videos
+	Returns:
+		list of (conditions, scores of parameter_sweep.count_id_switches, seconds per frame)
+	"""
+	results = []
+	for count, noise, occluders in conditions:
+		video = SyntheticVideo(count, frame_count, resolution, seed, noise=noise, occluders=occluders)
+		frames, ground_truth = video.get_frames()
+		start = timeit.default_timer()
+		ellipse_dicts = [d for i, d in ft.track_ellipses(frames)]
+		seconds = (timeit.default_timer() - start)/frame_count
+		results.append(((count, noise, occluders), parameter_sweep.count_id_switches(ellipse_dicts, ground_truth), seconds))
+	return results
+
+def print_results(title, results):
+	"""
+	Prints (size, seconds) pairs as a table in milliseconds
+	"""
+	print title
+	for size, seconds in results:
+		print "%10s %12.3f ms" % (size, seconds*1000)
+
+if __name__ == '__main__':
+	print_results("transition, pairwise ellipse_difference (objects per frame)", benchmark_correspondence(matrix_function=None))
+	print_results("transition, ellipse_difference_matrix (objects per frame)", benchmark_correspondence())
+	print_results("transition, many small markers (objects per frame)",
+		benchmark_correspondence((100,400), frame_size=(4000,4000)))
+	print_results("transition, many small markers, gated at 20 pixels (objects per frame)",
+		benchmark_correspondence((100,400,1000,2000,10000), max_distance=20, frame_size=(4000,4000)))
+	print_results("get_best_correspondence, ellipse_difference_matrix (objects per frame)", benchmark_best_correspondence())
+	print "anytime correspondence, crowded frame"
+	for count, deadline, seconds, gap, optimal in benchmark_anytime_correspondence():
+		print "%10s objects, deadline %4d ms: %8.3f ms, gap %.4f%s" % (count, deadline, seconds*1000, gap, ", optimal" if optimal else "")
+	print_results("per-point distance_from_point_to_ellipse (contour length)", benchmark_fit_error(vectorized=False))
+	print_results("fit_error (contour length)", benchmark_fit_error())
+	print_results("closest_points_on_ellipse (points)", benchmark_closest_point())
+	print_results("get_red as originally written (resolution)", benchmark_get_red(buffered=False))
+	print_results("get_red with preallocated buffers (resolution)", benchmark_get_red())
+	print_results("get_filled_binary (resolution)", benchmark_filled_binary())
+	print_results("select_ellipses on cluttered frames (contours)", benchmark_select_ellipses())
+	print_results("select_ellipses ranked on distance fields, cluttered frames (contours)", benchmark_select_ellipses(approximate=True))
+	print_results("select_ellipses prefiltering contours, cluttered frames (contours)", benchmark_select_ellipses(min_circularity=.1))
+	print_results("detect_ellipses (resolution)", benchmark_detection(in_place=False))
+	print_results("detect_ellipses in a FrameContext (resolution)", benchmark_detection())
+	for levels in (1, 2, 3):
+		print_results("detect_ellipses, %d pyramid levels (resolution)" % levels,
+			benchmark_detection(((480,640),(1080,1920),(2160,3840)), pyramid_levels=levels))
+	roi_results = benchmark_roi()
+	print_results("track_ellipses, full frame (resolution)", [(r, full) for r, full, roi in roi_results])
+	print_results("track_ellipses_roi (resolution)", [(r, roi) for r, full, roi in roi_results])
+	segmentation_results = benchmark_incremental_segmentation()
+	print_results("detection in a FrameContext, fixed camera (resolution)", [(r, whole) for r, whole, incremental in segmentation_results])
+	print_results("detection in an IncrementalSegmenter, fixed camera (resolution)", [(r, incremental) for r, whole, incremental in segmentation_results])
+	color_results = benchmark_color_classifier()
+	print_results("get_red_mask per color (resolution, colors)", [(r, hsv) for r, hsv, classifier in color_results])
+	print_results("ColorClassifier, all colors (resolution, colors)", [(r, classifier) for r, hsv, classifier in color_results])
+	print_results("track_ellipses on synthetic video (resolution)", benchmark_end_to_end())
+	print_results("offline tracking, 640x480 (processes)", benchmark_offline())
+	print "tracking accuracy on synthetic video, 640x480"
+	for (count, noise, occluders), scores, seconds in benchmark_accuracy():
+		print "%3d ellipses, noise %2d, %d occluders: %4d id switches, %4d misses, %4d false positives, %8.3f ms" % (
+			count, noise, occluders, scores['id_switches'], scores['misses'], scores['false_positives'], seconds*1000)
+	if os.path.exists("output.avi"):
+		print_results("tracking output.avi (detection processes)", benchmark_pipeline("output.avi"))
+	else:
+		directory = tempfile.mkdtemp()
+		try:
+			SyntheticVideo(frame_count=200, noise=10).write(os.path.join(directory, "synthetic.avi"))
+			print_results("tracking synthetic video, 640x480 (detection processes)",
+				benchmark_pipeline(os.path.join(directory, "synthetic.avi")))
+		finally:
+			shutil.rmtree(directory)
@@ -0,0 +1,144 @@
+import os
+import hashlib
+import tempfile
+import cv2
+import numpy as np
+import fingertip_tracking as ft
+
+#bump when compile_table changes, so that tables compiled by older code are not used
+TABLE_VERSION = 1
+
+#hsv ranges of get_red_mask
+RED = [((0,50,50),(2,255,255)), ((170,50,50),(180,255,255))]
+
+def compile_table(ranges, bits=6):
+	"""
+	Returns lookup table of the labels of bgr colors, quantized to bits per channel
+
+	Every cell of the table covers 2**(8 - bits) values of each channel, and is labeled by the hsv color of its
+	center: 1 + the index of the first list of ranges it is in, or 0 if it is in none
+
+	Args:
+		ranges: list of lists of (lower, upper) hsv bounds (inclusive, hue from 0 to 180, as cv2.inRange), one list per label
+		bits: number of most significant bits of each channel the table is indexed by
+	Returns:
+		n x n x n x 1 float32 array (n = 2**bits) of labels indexed by quantized blue, green and red, in the layout
+		cv2.calcBackProject takes
+	"""
+	n = 1 << bits
+	step = 256 >> bits
+	#centers of all cells as an image, n*n rows (blue, green) of n columns (red)
+	b, g, r = np.meshgrid(np.arange(n), np.arange(n), np.arange(n), indexing='ij')
+	colors = (np.stack((b,g,r), axis=-1).reshape(n*n, n, 3)*step + step//2).astype(np.uint8)
+	hsv_img = cv2.cvtColor(colors, cv2.COLOR_BGR2HSV)
+	table = np.zeros((n*n,n), np.float32)
+	#later labels first, so earlier ones overwrite them where ranges overlap
+	for label in range(len(ranges), 0, -1):
+		for lower, upper in ranges[label - 1]:
+			table[cv2.inRange(hsv_img, tuple(lower), tuple(upper)) > 0] = label
+	return table.reshape(n, n, n, 1)
+
+class ColorClassifier(object):
+	"""
+	Labels the pixels of frames by color, with named hsv ranges compiled once into a lookup table over quantized
+	bgr colors (see compile_table), so no frame is converted to hsv
+
+	A frame is labeled with a single cv2.calcBackProject through the table, however many colors there are; the
+	binary image of each color is then one comparison of the labels, so every color added costs little more
+	than finding its contours. Colors are quantized to bits per channel, so pixels near the edge of a range may
+	be labeled as the other side of it (about 1 in 5000 pixels of noisy frames for red at 6 bits).
+
+	With cache_dir, compiled tables are stored there keyed by their ranges and bits, and loaded rather than
+	compiled again; tables that cannot be read are compiled again
+	"""
+	def __init__(self, colors=(('red', RED),), bits=6, cache_dir=None, kernel_size=3, iterations=3):
+		"""
+		Args:
+			colors: list of (name, list of (lower, upper) hsv bounds) of the colors to label, see compile_table;
+				where ranges overlap, the color listed first wins
+			bits: number of most significant bits of each channel colors are told apart by, up to 7
+			cache_dir: optional directory to keep compiled tables in, created if missing
+			kernel_size: size of kernel used for opening and dilation, see ft.get_filled_binary
+			iterations: number of times opening and dilation are applied
+		"""
+		if not 0 < len(colors) < 256:
+			raise ValueError("can label 1 to 255 colors, got %d" % len(colors))
+		if not 0 < bits < 8:
+			raise ValueError("bits must be from 1 to 7, got %d" % bits)
+		self.names = [name for name, ranges in colors]
+		self.ranges = [[(tuple(int(v) for v in lower), tuple(int(v) for v in upper)) for lower, upper in ranges]
+			for name, ranges in colors]
+		self.labels = dict((name, label) for label, name in enumerate(self.names, 1))
+		self.bits = bits
+		self.cache_dir = cache_dir
+		self.kernel_size = kernel_size
+		self.iterations = iterations
+		self.table = self.load_table() if cache_dir is not None else compile_table(self.ranges, bits)
+		#calcBackProject takes the table as 4 dimensional (a 3 dimensional array would be passed as 2 dimensions of
+		#n channels), the 4th indexed by a blank image
+		self.blank = None
+
+	def get_key(self):
+		"""
+		Returns the key of the table of the ranges and bits
+		"""
+		return hashlib.sha1("%d %d %r" % (TABLE_VERSION, self.bits, self.ranges)).hexdigest()
+
+	def load_table(self):
+		"""
+		Returns the table stored in cache_dir, compiling and storing it if it is missing or cannot be read
+		"""
+		filename = os.path.join(self.cache_dir, self.get_key() + '.npy')
+		n = 1 << self.bits
+		try:
+			table = np.load(filename)
+			if table.shape == (n,n,n,1) and table.dtype == np.float32:
+				return table
+		except (IOError, ValueError):
+			#missing, or truncated or corrupt
+			pass
+		table = compile_table(self.ranges, self.bits)
+		if not os.path.isdir(self.cache_dir):
+			os.makedirs(self.cache_dir)
+		#write to a temporary file first, so that no one loads a partly written table
+		descriptor, temporary_filename = tempfile.mkstemp(suffix='.npy', dir=self.cache_dir)
+		with os.fdopen(descriptor, 'wb') as f:
+			np.save(f, table)
+		os.rename(temporary_filename, filename)
+		return table
+
+	def classify(self, frame, out=None):
+		"""
+		Returns single channel uint8 image (out, if given) of the label of every pixel of a bgr frame: 1 + the index
+		of its color in colors, or 0 if it is of none
+		"""
+		if self.blank is None or self.blank.shape != frame.shape[:2]:
+			self.blank = np.zeros(frame.shape[:2], np.uint8)
+		return cv2.calcBackProject([frame, self.blank], [0,1,2,3], self.table, [0,256]*4, 1, dst=out)
+
+	def get_binary(self, labels, name, out=None):
+		"""
+		Returns binary image (out, if given) that is black on the pixels labeled as color name and white elsewhere,
+		as get_thresholded_hsv
+		"""
+		return cv2.compare(labels, self.labels[name], cv2.CMP_NE, dst=out)
+
+	def get_ellipses(self, frame, min_radius=0, fill=True):
+		"""
+		Returns map of the names of the colors to the lists of ellipses on the parts of frame of that color, as
+		ft.get_ellipses_binary finds them
+
+		Args:
+			frame: bgr image
+			min_radius: minimum radius of ellipse to consider
+			fill: whether or not to apply opening and dilation before getting contours, see ft.get_filled_binary
+		"""
+		labels = self.classify(frame)
+		binary_img = None
+		ellipses = {}
+		for name in self.names:
+			binary_img = self.get_binary(labels, name, binary_img)
+			if fill:
+				binary_img = ft.get_filled_binary(binary_img, self.kernel_size, self.iterations, binary_img)
+			ellipses[name] = ft.get_ellipses_binary(binary_img, min_radius)
+		return ellipses
\ No newline at end of file
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import cv2
+import fingertip_tracking
+import color_classifier as cc
+from synthetic_video import SyntheticVideo
+
+BLUE = [((100,50,50),(130,255,255))]
+YELLOW = [((20,50,50),(35,255,255))]
+
+class Color_Classifier_Test(unittest.TestCase):
+	def setUp(self):
+		self.video = SyntheticVideo(count=5, frame_count=10, resolution=(240,320), seed=3, occluders=2, noise=5)
+		self.frames, self.ground_truth = self.video.get_frames()
+		self.cache_dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.cache_dir)
+
+	def test_compile_table_labels_cell_centers(self):
+		table = cc.compile_table([cc.RED, BLUE], bits=4)
+		self.assertEqual((16,16,16,1), table.shape)
+		#cells are indexed by blue, green, red and centered 8 values into their 16
+		self.assertEqual(1, table[0,0,15,0])
+		self.assertEqual(2, table[15,0,0,0])
+		self.assertEqual(0, table[0,15,0,0])
+		self.assertEqual(0, table[15,15,15,0])
+
+	def test_first_color_wins(self):
+		frame = np.full((10,10,3), (0,0,255), np.uint8)
+		everything = [((0,0,0),(180,255,255))]
+		classifier = cc.ColorClassifier([('red', cc.RED), ('everything', everything)])
+		np.testing.assert_array_equal(1, classifier.classify(frame))
+		np.testing.assert_array_equal(0, classifier.get_binary(classifier.classify(frame), 'red'))
+		classifier = cc.ColorClassifier([('everything', everything), ('red', cc.RED)])
+		np.testing.assert_array_equal(1, classifier.classify(frame))
+		np.testing.assert_array_equal(255, classifier.get_binary(classifier.classify(frame), 'red'))
+
+	def test_matches_red_mask(self):
+		classifier = cc.ColorClassifier()
+		rng = np.random.RandomState(0)
+		frames = self.frames + [rng.randint(0, 256, (100,100,3)).astype(np.uint8)]
+		for frame in frames:
+			labels = classifier.classify(frame)
+			red_mask = fingertip_tracking.get_red_mask(frame)
+			self.assertTrue(np.mean((labels == 1) == (red_mask > 0)) > .99)
+			self.assertTrue(set(np.unique(labels)) <= set((0,1)))
+
+	def test_matches_hsv_ellipses(self):
+		classifier = cc.ColorClassifier()
+		for frame in self.frames:
+			expected_ellipses = fingertip_tracking.get_ellipses_hsv(fingertip_tracking.get_red(frame))
+			self.assertEqual(expected_ellipses, classifier.get_ellipses(frame)['red'])
+
+	def test_multiple_colors(self):
+		frame = np.zeros((200,300,3), np.uint8)
+		frame[:] = (40,120,40)
+		cv2.ellipse(frame, ((60,100),(40,30),0), (0,0,255), -1)
+		cv2.ellipse(frame, ((150,100),(50,30),30), (255,0,0), -1)
+		cv2.ellipse(frame, ((240,100),(30,50),60), (0,255,255), -1)
+		classifier = cc.ColorClassifier([('red', cc.RED), ('blue', BLUE), ('yellow', YELLOW)])
+		ellipses = classifier.get_ellipses(frame)
+		self.assertEqual(['blue', 'red', 'yellow'], sorted(ellipses))
+		for name, x in (('red', 60), ('blue', 150), ('yellow', 240)):
+			centers = [center for center, axes, angle in ellipses[name]]
+			self.assertTrue(any(abs(cx - x) < 1 and abs(cy - 100) < 1 for cx, cy in centers))
+
+	def test_table_cache(self):
+		classifier = cc.ColorClassifier([('red', cc.RED), ('blue', BLUE)], cache_dir=self.cache_dir)
+		self.assertEqual([classifier.get_key() + '.npy'], os.listdir(self.cache_dir))
+		#a cached table is loaded rather than compiled again
+		np.save(os.path.join(self.cache_dir, classifier.get_key() + '.npy'), np.zeros_like(classifier.table))
+		self.assertFalse(cc.ColorClassifier([('red', cc.RED), ('blue', BLUE)], cache_dir=self.cache_dir).table.any())
+		#other ranges or bits are other tables
+		other = cc.ColorClassifier([('red', cc.RED)], bits=5, cache_dir=self.cache_dir)
+		np.testing.assert_array_equal(cc.compile_table([cc.RED], bits=5), other.table)
+		self.assertEqual(2, len(os.listdir(self.cache_dir)))
+
+	def test_unreadable_table_is_compiled_again(self):
+		classifier = cc.ColorClassifier(cache_dir=self.cache_dir)
+		filename = os.path.join(self.cache_dir, classifier.get_key() + '.npy')
+		with open(filename, 'rb') as f:
+			data = f.read()
+		for corrupt_data in (data[:len(data)//2], 'not an npy file', ''):
+			with open(filename, 'wb') as f:
+				f.write(corrupt_data)
+			np.testing.assert_array_equal(classifier.table, cc.ColorClassifier(cache_dir=self.cache_dir).table)
+			self.assertEqual(len(data), os.path.getsize(filename))
+
+	def test_morphology_settings(self):
+		classifier = cc.ColorClassifier(kernel_size=5, iterations=1)
+		for frame in self.frames[:3]:
+			binary_img = fingertip_tracking.get_thresholded_hsv(fingertip_tracking.get_red(frame))
+			binary_img = fingertip_tracking.get_filled_binary(binary_img, 5, 1)
+			self.assertEqual(fingertip_tracking.get_ellipses_binary(binary_img), classifier.get_ellipses(frame)['red'])
+
+	def test_invalid_arguments(self):
+		self.assertRaises(ValueError, cc.ColorClassifier, [])
+		self.assertRaises(ValueError, cc.ColorClassifier, bits=8)
+
+if __name__ == '__main__':
+	unittest.main()
\ No newline at end of file
@@ -1,7 +1,13 @@
-import itertools
 from math import tanh
+from timeit import default_timer
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+import numpy as np
 
-def transition(original_map,new_objects,evaluation_function):
+def transition(original_map,new_objects,evaluation_function,matrix_function=None,position_function=None,max_distance=None,
+		deadline=None,metrics=None):
 	"""
 	Return map of new objects to ids given old objects and their ids that minimizes correspondence error
 
@@ -9,6 +15,13 @@ def transition(original_map,new_objects,evaluation_function):
 		original_map: current map of objects to ids
 		new_objects: new objects to be transitioned to
 		evaluation_function: error function for objects
+		matrix_function: optional batched version of evaluation_function, see get_cost_matrix
+		position_function: optional function from an object to its (x,y) position; together with max_distance,
+			objects further apart than max_distance are never matched (see get_gated_correspondence)
+		max_distance: maximum distance between the positions of matched objects
+		deadline: optional time limit in milliseconds for finding the correspondence, see
+			get_anytime_correspondence (not used with position_function and max_distance)
+		metrics: optional dictionary that the metrics of get_anytime_correspondence are written to
 	Returns:
 		new map of objects to ids
 	"""
@@ -16,7 +29,16 @@ def transition(original_map,new_objects,evaluation_function):
 	o_length = len(original_objects)
 	n_length = len(new_objects)
 
-	best_correspondence = get_best_correspondence(original_objects,new_objects,evaluation_function)
+	if position_function is not None and max_distance is not None:
+		best_correspondence = get_gated_correspondence(original_objects,new_objects,evaluation_function,
+			position_function,max_distance,matrix_function)
+	elif deadline is not None:
+		best_correspondence, correspondence_metrics = get_anytime_correspondence(original_objects,new_objects,
+			evaluation_function,deadline,matrix_function)
+		if metrics is not None:
+			metrics.update(correspondence_metrics)
+	else:
+		best_correspondence = get_best_correspondence(original_objects,new_objects,evaluation_function,matrix_function)
 	new_map = {}
 
 	if len(original_map.values()) == 0:
@@ -35,31 +57,356 @@ def transition(original_map,new_objects,evaluation_function):
 
 	return new_map
 
-#TODO faster implementation
-def get_best_correspondence(list1,list2,evaluation_function):
+def get_best_correspondence(list1,list2,evaluation_function,matrix_function=None):
 	"""
 	Get best correspondence between two lists (of possibly different size) given an evaluation function
 	Args:
 		list1: list of objects
 		list2: list of same type of objects
 		evaluation_function: function from a pair of objects to an error
+		matrix_function: optional batched version of evaluation_function, see get_cost_matrix
 	Returns:
 		a list of pairings of objects or None that minimizes the evaluation function
 	"""
+	list1, list2 = pad_lists(list1,list2)
+
+	#solve the assignment problem on the cost matrix (Hungarian method, O(n^3)); see get_anytime_correspondence
+	#for a version with a timeout
+	cost_matrix = get_cost_matrix(list1,list2,evaluation_function,matrix_function)
+	rows, cols = linear_sum_assignment(cost_matrix)
+	best_correspondence = [(list1[i],list2[j]) for i,j in sorted(zip(rows,cols), key=lambda (i,j): j)]
+
+	return best_correspondence
+
+def pad_lists(list1,list2):
+	"""
+	Returns copies of list1 and list2, the shorter one extended with None to the length of the longer one
+	"""
+	list1 = list(list1)
+	list2 = list(list2)
 	len_diff = len(list1) - len(list2)
 	if len_diff > 0:
 		list2.extend([None for i in range(len_diff)])
 	elif len_diff < 0:
 		list1.extend([None for i in range(-1*len_diff)])
+	return list1, list2
 
-	# TODO: make this multithreaded so that a timeout can be added
-	possible_pairings = [zip(i,list2) for i in itertools.permutations(list1)]
-	def f(pairing):
-		return calculate_error(pairing,evaluation_function)
-	best_correspondence = min(possible_pairings, key=f)
+def get_anytime_correspondence(list1,list2,evaluation_function,deadline,matrix_function=None):
+	"""
+	Get a correspondence between two lists as in get_best_correspondence, giving up on optimality after deadline
 
-	return best_correspondence
+	Starts from a greedy assignment, improves it by swapping pairs, then runs the Hungarian method until it
+	finishes or time runs out. The Hungarian method keeps a lower bound on the error of any correspondence,
+	so the result is known to be optimal if it finishes or its bound meets the error of the assignment found.
+	The greedy assignment is always returned, even if building the cost matrix alone took longer than deadline
+	Args:
+		list1: list of objects
+		list2: list of same type of objects
+		evaluation_function: function from a pair of objects to an error
+		deadline: time limit in milliseconds
+		matrix_function: optional batched version of evaluation_function, see get_cost_matrix
+	Returns:
+		a list of pairings of objects or None, and a dictionary of metrics: 'error' of the pairings (as in
+		calculate_error), 'lower_bound' on the error of any pairings, relative optimality 'gap' between them,
+		whether the pairings are proven 'optimal', and the 'time' used in seconds
+	"""
+	start = default_timer()
+	end = start + deadline/1000.
+	list1, list2 = pad_lists(list1,list2)
+	n = len(list1)
+	cost_matrix = get_cost_matrix(list1,list2,evaluation_function,matrix_function)
+	rows = np.arange(n)
+
+	assignment = get_greedy_assignment(cost_matrix)
+	assignment = improve_assignment(cost_matrix,assignment,end)
+	error = cost_matrix[rows,assignment].sum()
+	lower_bound = 0.
+	tolerance = 1e-9*max(n,1)
+
+	optimal = error - lower_bound <= tolerance
+	if not optimal:
+		for row_of_col, u, v in hungarian_steps(cost_matrix):
+			lower_bound = max(lower_bound, u.sum() + v.sum())
+			if error - lower_bound <= tolerance:
+				break
+			if default_timer() > end:
+				#complete the rows assigned so far greedily, in case that beats the swapped greedy assignment
+				partial_assignment = complete_assignment(cost_matrix,row_of_col)
+				partial_error = cost_matrix[rows,partial_assignment].sum()
+				if partial_error < error:
+					assignment, error = partial_assignment, partial_error
+				break
+		else:
+			#every row was assigned, the Hungarian method finished
+			assignment[row_of_col] = rows
+			error = cost_matrix[rows,assignment].sum()
+			lower_bound = error
+		optimal = error - lower_bound <= tolerance
+
+	correspondence = [(list1[i],list2[j]) for i,j in sorted(zip(rows,assignment), key=lambda (i,j): j)]
+	metrics = {
+		'error': error,
+		'lower_bound': lower_bound,
+		'gap': max(error - lower_bound, 0.)/error if error > 0 else 0.,
+		'optimal': optimal,
+		'time': default_timer() - start,
+	}
+	return correspondence, metrics
+
+def get_greedy_assignment(cost_matrix):
+	"""
+	Get assignment of rows to columns of a square cost matrix by repeatedly pairing rows and columns that are each
+	other's cheapest free option
+	Args:
+		cost_matrix: n x n array of costs
+	Returns:
+		array of the column assigned to each row
+	"""
+	n = len(cost_matrix)
+	assignment = np.zeros(n, dtype=int)
+	free_rows, free_cols = np.arange(n), np.arange(n)
+	while len(free_rows):
+		free_costs = cost_matrix[np.ix_(free_rows,free_cols)]
+		best_cols = free_costs.argmin(axis=1)
+		best_rows = free_costs.argmin(axis=0)
+		#the first cheapest entry is always mutual, so every round pairs at least one row
+		mutual = best_rows[best_cols] == np.arange(len(free_rows))
+		assignment[free_rows[mutual]] = free_cols[best_cols[mutual]]
+		taken = np.zeros(len(free_cols), dtype=bool)
+		taken[best_cols[mutual]] = True
+		free_rows, free_cols = free_rows[~mutual], free_cols[~taken]
+	return assignment
+
+def complete_assignment(cost_matrix,row_of_col):
+	"""
+	Complete a partial assignment of rows to columns greedily (see get_greedy_assignment)
+	Args:
+		cost_matrix: n x n array of costs
+		row_of_col: array of the row assigned to each column, or -1
+	Returns:
+		array of the column assigned to each row
+	"""
+	assignment = np.zeros(len(row_of_col), dtype=int)
+	assigned_cols = np.flatnonzero(row_of_col >= 0)
+	assignment[row_of_col[assigned_cols]] = assigned_cols
+	free_rows = np.setdiff1d(np.arange(len(row_of_col)), row_of_col[assigned_cols])
+	free_cols = np.flatnonzero(row_of_col < 0)
+	assignment[free_rows] = free_cols[get_greedy_assignment(cost_matrix[np.ix_(free_rows,free_cols)])]
+	return assignment
+
+def improve_assignment(cost_matrix,assignment,end=None):
+	"""
+	Improve an assignment by swapping the columns of the pair of rows that lowers its cost the most, until no swap
+	lowers it
+	Args:
+		cost_matrix: n x n array of costs
+		assignment: array of the column assigned to each row
+		end: optional default_timer time after which to stop
+	Returns:
+		improved assignment
+	"""
+	assignment = np.array(assignment)
+	rows = np.arange(len(assignment))
+	while end is None or default_timer() < end:
+		costs = cost_matrix[rows,assignment]
+		swapped_costs = cost_matrix[:,assignment]
+		gains = costs[:,None] + costs[None,:] - swapped_costs - swapped_costs.T
+		i, k = np.unravel_index(np.argmax(gains), gains.shape)
+		if gains[i,k] <= 1e-12:
+			break
+		assignment[i], assignment[k] = assignment[k], assignment[i]
+	return assignment
+
+def hungarian_steps(cost_matrix):
+	"""
+	Hungarian method on a square cost matrix (shortest augmenting paths with potentials), one step at a time
+
+	Rows are assigned one by one, and the potentials u, v always satisfy u[i] + v[j] <= cost_matrix[i,j], so
+	u.sum() + v.sum() is a lower bound on the cost of any assignment, reaching the minimum once all rows are
+	assigned
+	Args:
+		cost_matrix: n x n array of costs
+	Returns:
+		iterator over (array of the row assigned to each column, or -1, row potentials u, column potentials v),
+		after each step of the search for an augmenting path
+	"""
+	n = len(cost_matrix)
+	#1-based columns and rows, with column 0 and row 0 standing for the row being assigned; the potentials
+	#start from the row minima and the column minima of what is left, the best bound before any search
+	u = np.zeros(n+1)
+	v = np.zeros(n+1)
+	if n:
+		u[1:] = cost_matrix.min(axis=1)
+		v[1:] = (cost_matrix - u[1:,None]).min(axis=0)
+	row_of_col = np.zeros(n+1, dtype=int)
+	way = np.zeros(n+1, dtype=int)
+	for i in range(1, n+1):
+		row_of_col[0] = i
+		j0 = 0
+		min_reduced = np.full(n+1, np.inf)
+		used = np.zeros(n+1, dtype=bool)
+		while True:
+			used[j0] = True
+			i0 = row_of_col[j0]
+			reduced = cost_matrix[i0-1] - u[i0] - v[1:]
+			better = ~used[1:] & (reduced < min_reduced[1:])
+			min_reduced[1:][better] = reduced[better]
+			way[1:][better] = j0
+			j1 = np.argmin(np.where(used[1:], np.inf, min_reduced[1:])) + 1
+			delta = min_reduced[j1]
+			u[row_of_col[used]] += delta
+			v[used] -= delta
+			min_reduced[~used] -= delta
+			j0 = j1
+			if row_of_col[j0] == 0:
+				break
+			yield row_of_col[1:] - 1, u[1:], v[1:]
+		while j0:
+			j1 = way[j0]
+			row_of_col[j0] = row_of_col[j1]
+			j0 = j1
+		yield row_of_col[1:] - 1, u[1:], v[1:]
+
+def get_cost_matrix(list1,list2,evaluation_function,matrix_function=None):
+	"""
+	Get matrix of pairwise errors between two lists, on the same scale as calculate_error
+	Args:
+		list1: list of objects or None
+		list2: list of same type of objects or None
+		evaluation_function: function from a pair of objects to an error
+		matrix_function: optional function from two lists of objects (without None) to the
+			array of their pairwise errors, used instead of calling evaluation_function on every pair
+	Returns:
+		len(list1) x len(list2) array, where entry (i,j) is the tanh of the evaluation function
+		on list1[i] and list2[j], or 1 if either of them is None
+	"""
+	present1 = np.array([o is not None for o in list1], dtype=bool)
+	present2 = np.array([o is not None for o in list2], dtype=bool)
+	cost_matrix = np.ones((len(list1),len(list2)))
+
+	if matrix_function is not None:
+		objects1 = [o for o in list1 if o is not None]
+		objects2 = [o for o in list2 if o is not None]
+		if objects1 and objects2:
+			cost_matrix[np.ix_(present1,present2)] = matrix_function(objects1,objects2)
+	else:
+		for i, object1 in enumerate(list1):
+			if object1 is None: continue
+			for j, object2 in enumerate(list2):
+				if object2 is None: continue
+				cost_matrix[i,j] = evaluation_function(object1,object2)
+
+	#same squashing as calculate_error, padding entries stay at 1
+	present = np.outer(present1,present2)
+	cost_matrix[present] = np.tanh(cost_matrix[present])
+	return cost_matrix
+
+def get_gated_correspondence(list1,list2,evaluation_function,position_function,max_distance,matrix_function=None):
+	"""
+	Get best correspondence between two lists given an evaluation function, where only objects whose positions
+	are within max_distance of each other may be paired
+
+	Candidate pairs are found with a kd-tree over the positions before any error is evaluated, and every
+	connected group of candidates is solved as its own assignment problem, so scattered objects cost close
+	to linear time. Objects of a group may also stay unpaired (paired with None) at the cost of 1 each
+	Args:
+		list1: list of objects
+		list2: list of same type of objects
+		evaluation_function: function from a pair of objects to an error
+		position_function: function from an object to its (x,y) position
+		max_distance: maximum distance between the positions of paired objects
+		matrix_function: optional batched version of evaluation_function, see get_cost_matrix
+	Returns:
+		a list of pairings of objects or None, in which every object appears once, that minimizes the
+		evaluation function over the allowed pairs
+	"""
+	list1 = [o for o in list1 if o is not None]
+	list2 = [o for o in list2 if o is not None]
+	n, m = len(list1), len(list2)
+	if n == 0 or m == 0:
+		return [(o,None) for o in list1] + [(None,o) for o in list2]
+
+	#candidate pairs within max_distance
+	positions1 = np.array([position_function(o) for o in list1], dtype=float).reshape(-1,2)
+	positions2 = np.array([position_function(o) for o in list2], dtype=float).reshape(-1,2)
+	candidates = cKDTree(positions1).sparse_distance_matrix(cKDTree(positions2), max_distance, output_type='ndarray')
+	rows, cols = candidates['i'], candidates['j']
+
+	#connected components of the bipartite candidate graph, with list2 objects numbered after list1 objects
+	graph = coo_matrix((np.ones(len(rows)), (rows, cols + n)), shape=(n+m, n+m))
+	component_count, labels = connected_components(graph, directed=False)
+
+	#group objects and candidate pairs by component, numbering objects within their component
+	labels1, labels2 = labels[:n], labels[n:]
+	groups1, local1 = group_by_label(labels1, component_count)
+	groups2, local2 = group_by_label(labels2, component_count)
+	pair_groups, local_pairs = group_by_label(labels1[rows], component_count)
+
+	correspondence = []
+	for indices1, indices2, pairs in zip(groups1, groups2, pair_groups):
+		if len(indices2) == 0:
+			correspondence.extend((list1[i],None) for i in indices1)
+		elif len(indices1) == 0:
+			correspondence.extend((None,list2[j]) for j in indices2)
+		else:
+			correspondence.extend(get_component_correspondence(
+				[list1[i] for i in indices1], [list2[j] for j in indices2],
+				local1[rows[pairs]], local2[cols[pairs]], evaluation_function, matrix_function))
+	return correspondence
+
+def group_by_label(labels,label_count):
+	"""
+	Group indices of an array of labels by label
+	Args:
+		labels: array of integer labels, between 0 and label_count-1
+		label_count: number of labels
+	Returns:
+		list of label_count arrays, where array k holds the indices with label k in increasing order, and
+		array of the position of each index within its group
+	"""
+	order = np.argsort(labels, kind='mergesort')
+	counts = np.bincount(labels, minlength=label_count)
+	starts = np.cumsum(counts) - counts
+	positions = np.empty(len(labels), dtype=int)
+	positions[order] = np.arange(len(labels)) - starts[labels[order]]
+	return np.split(order, starts[1:]), positions
+
+def get_component_correspondence(list1,list2,rows,cols,evaluation_function,matrix_function=None):
+	"""
+	Get best correspondence between two lists where only the pairs (list1[rows[k]],list2[cols[k]]) are allowed
+	Args:
+		list1: list of objects
+		list2: list of same type of objects
+		rows: indices into list1 of the allowed pairs
+		cols: indices into list2 of the allowed pairs
+		evaluation_function: function from a pair of objects to an error
+		matrix_function: optional batched version of evaluation_function, see get_cost_matrix
+	Returns:
+		a list of pairings of objects or None, in which every object appears once, that minimizes the
+		evaluation function, where leaving an object unpaired costs 1
+	"""
+	n, m = len(list1), len(list2)
+	if matrix_function is not None:
+		errors = np.asarray(matrix_function(list1,list2), dtype=float)[rows,cols]
+	else:
+		errors = np.array([evaluation_function(list1[i],list2[j]) for i,j in zip(rows,cols)], dtype=float)
+
+	#square problem where each object can go to a dummy (cost 1), and disallowed pairs cost more than two dummies
+	cost_matrix = np.full((n+m,m+n), 3.)
+	cost_matrix[rows,cols] = np.tanh(errors)
+	cost_matrix[:n,m:] = 1
+	cost_matrix[n:,:m] = 1
+	cost_matrix[n:,m:] = 0
 
+	correspondence = []
+	for i, j in zip(*linear_sum_assignment(cost_matrix)):
+		if i < n and j < m:
+			correspondence.append((list1[i],list2[j]))
+		elif i < n:
+			correspondence.append((list1[i],None))
+		elif j < m:
+			correspondence.append((None,list2[j]))
+	return correspondence
 
 def calculate_error(pairing,evaluation_function):
 	"""
@@ -1,4 +1,6 @@
 import unittest
+import itertools
+import random
 from math import tanh
 import correspondence_tracking
 
@@ -44,7 +46,7 @@ class Correspondence_Tracking_Test(unittest.TestCase):
 		expected_pairs.append((ComplexNum(1,3),ComplexNum(1,3.1)))
 		expected_pairs.append((None,ComplexNum(2,4)))
 		
-		self.assertEqual(sorted(expected_pairs), sorted(actual_pairs))
+		self.assertEqual(set(expected_pairs), set(actual_pairs))
 
 	def test_calculate_error_multiple_items(self):
 		original_objects = self.original_dict.keys()
@@ -67,6 +69,107 @@ class Correspondence_Tracking_Test(unittest.TestCase):
 		actual_error = correspondence_tracking.calculate_error(pairs,ComplexNum.error)
 		self.assertEqual(1, actual_error)
 
+	def test_get_cost_matrix_pads_with_one(self):
+		original_objects = self.original_dict.keys()
+		original_objects.append(None)
+		cost_matrix = correspondence_tracking.get_cost_matrix(original_objects,self.new_objects,ComplexNum.error)
+		for i, original in enumerate(original_objects):
+			for j, new in enumerate(self.new_objects):
+				expected_cost = correspondence_tracking.calculate_error([(original,new)],ComplexNum.error)
+				self.assertAlmostEqual(expected_cost, cost_matrix[i,j])
+
+	def test_get_best_correspondence_matches_exhaustive_search(self):
+		rng = random.Random(0)
+		for n, m in [(4,4),(5,3),(2,6)]:
+			list1 = [ComplexNum(rng.uniform(0,3),rng.uniform(0,3)) for i in range(n)]
+			list2 = [ComplexNum(rng.uniform(0,3),rng.uniform(0,3)) for i in range(m)]
+			padded1 = list1 + [None]*(m-n)
+			padded2 = list2 + [None]*(n-m)
+			expected_error = min(correspondence_tracking.calculate_error(zip(p,padded2),ComplexNum.error) for p in itertools.permutations(padded1))
+
+			pairs = correspondence_tracking.get_best_correspondence(list1,list2,ComplexNum.error)
+			actual_error = correspondence_tracking.calculate_error(pairs,ComplexNum.error)
+			self.assertAlmostEqual(expected_error, actual_error)
+			self.assertEqual(max(n,m), len(pairs))
+
+	def test_get_cost_matrix_with_matrix_function(self):
+		original_objects = self.original_dict.keys()
+		original_objects.append(None)
+		def error_matrix(objects1,objects2):
+			return [[o1.error(o2) for o2 in objects2] for o1 in objects1]
+		expected_matrix = correspondence_tracking.get_cost_matrix(original_objects,self.new_objects,ComplexNum.error)
+		actual_matrix = correspondence_tracking.get_cost_matrix(original_objects,self.new_objects,ComplexNum.error,error_matrix)
+		self.assertEqual(expected_matrix.tolist(), actual_matrix.tolist())
+
+	def test_get_gated_correspondence_never_pairs_distant_objects(self):
+		position = lambda o: (o.a, o.b)
+		list1 = [ComplexNum(0,0), ComplexNum(10,0), ComplexNum(100,100)]
+		list2 = [ComplexNum(1,0), ComplexNum(11,1), ComplexNum(50,50), ComplexNum(101,99)]
+		actual_pairs = correspondence_tracking.get_gated_correspondence(list1,list2,ComplexNum.error,position,5)
+		expected_pairs = [(list1[0],list2[0]), (list1[1],list2[1]), (list1[2],list2[3]), (None,list2[2])]
+		self.assertEqual(set(expected_pairs), set(actual_pairs))
+
+	def test_get_gated_correspondence_matches_best_correspondence(self):
+		rng = random.Random(1)
+		position = lambda o: (o.a, o.b)
+		#well separated clusters, each solved on its own
+		list1, list2 = [], []
+		for k in range(4):
+			list1.extend(ComplexNum(100*k+rng.uniform(0,2),rng.uniform(0,2)) for i in range(3))
+			list2.extend(ComplexNum(100*k+rng.uniform(0,2),rng.uniform(0,2)) for i in range(3))
+		expected_pairs = correspondence_tracking.get_best_correspondence(list1,list2,ComplexNum.error)
+		actual_pairs = correspondence_tracking.get_gated_correspondence(list1,list2,ComplexNum.error,position,10)
+		self.assertEqual(12, len(actual_pairs))
+		self.assertAlmostEqual(correspondence_tracking.calculate_error(expected_pairs,ComplexNum.error),
+			correspondence_tracking.calculate_error(actual_pairs,ComplexNum.error))
+
+	def test_transition_gated(self):
+		position = lambda o: (o.a, o.b)
+		actual_new_dict = correspondence_tracking.transition(self.original_dict,self.new_objects,ComplexNum.error,
+			position_function=position,max_distance=.5)
+		expected_new_dict = {ComplexNum(1,2): 1, ComplexNum(1,3.1): 2, ComplexNum(2,4): 3}
+		self.assertEqual(expected_new_dict, actual_new_dict)
+
+	def test_get_anytime_correspondence_optimal_with_time(self):
+		rng = random.Random(0)
+		for n, m in [(4,4),(5,3),(2,6),(30,30)]:
+			list1 = [ComplexNum(rng.uniform(0,3),rng.uniform(0,3)) for i in range(n)]
+			list2 = [ComplexNum(rng.uniform(0,3),rng.uniform(0,3)) for i in range(m)]
+			expected_pairs = correspondence_tracking.get_best_correspondence(list1,list2,ComplexNum.error)
+			actual_pairs, metrics = correspondence_tracking.get_anytime_correspondence(list1,list2,ComplexNum.error,10000)
+			expected_error = correspondence_tracking.calculate_error(expected_pairs,ComplexNum.error)
+			self.assertAlmostEqual(expected_error, correspondence_tracking.calculate_error(actual_pairs,ComplexNum.error))
+			self.assertAlmostEqual(expected_error, metrics['error'])
+			self.assertAlmostEqual(expected_error, metrics['lower_bound'])
+			self.assertTrue(metrics['optimal'])
+			self.assertEqual(0, metrics['gap'])
+			self.assertEqual(max(n,m), len(actual_pairs))
+
+	def test_get_anytime_correspondence_out_of_time(self):
+		rng = random.Random(1)
+		list1 = [ComplexNum(rng.uniform(0,3),rng.uniform(0,3)) for i in range(60)]
+		list2 = [ComplexNum(rng.uniform(0,3),rng.uniform(0,3)) for i in range(60)]
+		expected_pairs = correspondence_tracking.get_best_correspondence(list1,list2,ComplexNum.error)
+		actual_pairs, metrics = correspondence_tracking.get_anytime_correspondence(list1,list2,ComplexNum.error,0)
+		expected_error = correspondence_tracking.calculate_error(expected_pairs,ComplexNum.error)
+		actual_error = correspondence_tracking.calculate_error(actual_pairs,ComplexNum.error)
+		self.assertEqual(set(list1), set(o for o,p in actual_pairs))
+		self.assertEqual(set(list2), set(p for o,p in actual_pairs))
+		self.assertAlmostEqual(actual_error, metrics['error'])
+		self.assertLessEqual(metrics['lower_bound'], expected_error + 1e-9)
+		self.assertLessEqual(expected_error, actual_error + 1e-9)
+		self.assertAlmostEqual(metrics['gap'], (actual_error - metrics['lower_bound'])/actual_error)
+		self.assertEqual(metrics['gap'] < 1e-9, metrics['optimal'])
+
+	def test_transition_deadline(self):
+		metrics = {}
+		actual_new_dict = correspondence_tracking.transition(self.original_dict,self.new_objects,ComplexNum.error,
+			deadline=1000,metrics=metrics)
+		expected_new_dict = {ComplexNum(1,2): 1, ComplexNum(1,3.1): 2, ComplexNum(2,4): 3}
+		self.assertEqual(expected_new_dict, actual_new_dict)
+		self.assertTrue(metrics['optimal'])
+		self.assertIn('time', metrics)
+
 	# for debugging
 	def print_pairs(self,pairs):
 		for original, new in pairs:
@@ -0,0 +1,181 @@
+import os
+import json
+import hashlib
+import tempfile
+import zipfile
+import numpy as np
+import offline_tracking as ot
+from ellipse import array_to_ellipses
+
+#bump when detection changes, so that entries detected by older code are not used
+DETECTION_VERSION = 3
+
+def get_source_hash(source, block_size=2**20):
+	"""
+	Returns hex digest of the content of a video file, a directory of images or a list of frames
+
+	Args:
+		source: video filename (hashed by content only, so copies and renamed files have the same hash), directory
+			of images (hashed by name, which sets the order of the frames, and content) or list of images
+		block_size: number of bytes of a file read at a time
+	"""
+	digest = hashlib.sha1()
+	if isinstance(source, basestring):
+		filenames = [source]
+		if os.path.isdir(source):
+			filenames = [os.path.join(source, name) for name in sorted(os.listdir(source))]
+		for filename in filenames:
+			if filename != source:
+				digest.update(os.path.basename(filename))
+			with open(filename, 'rb') as f:
+				for block in iter(lambda: f.read(block_size), ''):
+					digest.update(block)
+	elif isinstance(source, (list, tuple)):
+		for frame in source:
+			digest.update(str(frame.shape))
+			digest.update(np.ascontiguousarray(frame).data)
+	else:
+		raise ValueError("can only hash files, directories and lists of frames")
+	return digest.hexdigest()
+
+class DetectionCache(object):
+	"""
+	Cache of the ellipses detected on every frame of a recording, stored on disk and keyed by the content of
+	the recording and the detection parameters, so that tracking a recording again with other tracking
+	settings skips detection
+
+	Every entry is a file in directory; entries are touched when used, and the least recently used entries
+	are evicted once the cache holds more than max_bytes. Several processes may share directory: entries
+	another process evicts first are skipped
+	"""
+	def __init__(self, directory, max_bytes=2**30):
+		"""
+		Args:
+			directory: directory to keep the entries in, created if missing
+			max_bytes: maximum total size of the entries
+		"""
+		self.directory = directory
+		self.max_bytes = max_bytes
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		#hashes of the files hashed so far, by (filename, size, modification time)
+		self.source_hashes = {}
+		#number of get_detections calls served from the cache
+		self.hits = 0
+
+	def get_key(self, source, parameters=None):
+		"""
+		Returns the key of the detections of source with the given detection parameters
+		"""
+		if isinstance(source, basestring) and os.path.isfile(source):
+			stat = os.stat(source)
+			file_key = (os.path.abspath(source), stat.st_size, stat.st_mtime)
+			if file_key not in self.source_hashes:
+				self.source_hashes[file_key] = get_source_hash(source)
+			source_hash = self.source_hashes[file_key]
+		else:
+			source_hash = get_source_hash(source)
+		parameters = json.dumps(ot.get_detection_parameters(parameters), sort_keys=True)
+		return hashlib.sha1("%d %s %s" % (DETECTION_VERSION, source_hash, parameters)).hexdigest()
+
+	def get_filename(self, key):
+		return os.path.join(self.directory, key + '.npz')
+
+	def load(self, key):
+		"""
+		Returns the detections array and frame count stored under key, or None if there are none
+
+		Entries that are missing (or evicted by another process while being read) count as missing, and so do
+		entries that cannot be read (truncated or corrupt), which are removed
+		"""
+		filename = self.get_filename(key)
+		try:
+			with np.load(filename) as entry:
+				detections, frame_count = entry['detections'], int(entry['frame_count'])
+		except (IOError, OSError):
+			return None
+		except (ValueError, KeyError, zipfile.BadZipfile):
+			try:
+				os.remove(filename)
+			except OSError:
+				pass
+			return None
+		try:
+			os.utime(filename, None)
+		except OSError:
+			#evicted by another process since, or a read-only cache
+			pass
+		return detections, frame_count
+
+	def store(self, key, detections, frame_count):
+		"""
+		Stores a detections array and frame count under key, then evicts the least recently used entries
+		"""
+		#write to a temporary file first, so that no one loads a partly written entry; it is not named as an entry,
+		#so other processes sharing the directory do not count or evict it
+		descriptor, temporary_filename = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+		with os.fdopen(descriptor, 'wb') as f:
+			np.savez(f, detections=detections, frame_count=frame_count)
+		os.rename(temporary_filename, self.get_filename(key))
+		self.evict(keep=key)
+
+	def get_entries(self):
+		"""
+		Returns list of (last use time, size, filename) of the entries, least recently used first
+		"""
+		entries = []
+		for name in os.listdir(self.directory):
+			if name.endswith('.npz'):
+				try:
+					stat = os.stat(os.path.join(self.directory, name))
+				except OSError:
+					#evicted by another process since it was listed
+					continue
+				entries.append((stat.st_mtime, stat.st_size, os.path.join(self.directory, name)))
+		return sorted(entries)
+
+	def evict(self, keep=None):
+		"""
+		Removes the least recently used entries until the cache holds at most max_bytes, except the entry under keep
+		"""
+		entries = self.get_entries()
+		total_bytes = sum(size for used, size, filename in entries)
+		for used, size, filename in entries:
+			if total_bytes <= self.max_bytes: break
+			if keep is not None and filename == self.get_filename(keep): continue
+			try:
+				os.remove(filename)
+			except OSError:
+				#already evicted by another process
+				pass
+			total_bytes -= size
+
+	def get_detections(self, source, processes=None, parameters=None):
+		"""
+		Returns the detections of a recording from the cache, detecting (with ot.detect_frames) and storing
+		them first if they are not cached
+
+		Args:
+			source: video filename, directory of images or list of images
+			processes: number of detection processes, see ot.detect_all
+			parameters: optional map of detection parameters to values, see ot.DETECTION_PARAMETERS
+		Returns:
+			detections array (see ot.detect_all), and number of frames in the recording
+		"""
+		key = self.get_key(source, parameters)
+		entry = self.load(key)
+		if entry is None:
+			entry = ot.detect_frames(source, processes, parameters=parameters)
+			self.store(key, *entry)
+		else:
+			self.hits += 1
+		return entry
+
+	def get_ellipses(self, source, processes=None, parameters=None):
+		"""
+		Returns list of the lists of ellipses detected on every frame of a recording, see get_detections
+		"""
+		detections, frame_count = self.get_detections(source, processes, parameters)
+		offsets = ot.get_frame_offsets(detections, frame_count)
+		ellipses = array_to_ellipses(detections[:,1:])
+		return [ellipses[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
\ No newline at end of file
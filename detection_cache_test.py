@@ -0,0 +1,140 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import cv2
+import offline_tracking
+import detection_cache
+
+class Detection_Cache_Test(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.cache = detection_cache.DetectionCache(os.path.join(self.directory, 'cache'))
+		self.frames = []
+		for i in range(12):
+			frame = np.zeros((120,160,3), np.uint8)
+			frame[:] = (40,120,40)
+			cv2.ellipse(frame, ((30+2*i,40),(24,14),10*i), (0,0,255), -1)
+			cv2.ellipse(frame, ((110-3*i,80+i),(12,14),0), (0,0,255), -1)
+			self.frames.append(frame)
+		#a last frame without ellipses
+		self.frames.append(np.zeros((120,160,3), np.uint8))
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_get_detections_caches(self):
+		detections, frame_count = self.cache.get_detections(self.frames, processes=0)
+		self.assertEqual(13, frame_count)
+		np.testing.assert_array_equal(offline_tracking.detect_all(self.frames, processes=0), detections)
+		self.assertEqual(1, len(self.cache.get_entries()))
+		#detection is not run again
+		offline_tracking.detect_frames, detect_frames = None, offline_tracking.detect_frames
+		try:
+			cached_detections, cached_frame_count = self.cache.get_detections(self.frames, processes=0)
+		finally:
+			offline_tracking.detect_frames = detect_frames
+		np.testing.assert_array_equal(detections, cached_detections)
+		self.assertEqual(13, cached_frame_count)
+
+	def test_key_depends_on_content_and_parameters(self):
+		key = self.cache.get_key(self.frames)
+		self.assertEqual(key, self.cache.get_key(list(self.frames), {'min_radius': 0, 'upper_red_bounds': [170,180]}))
+		self.assertNotEqual(key, self.cache.get_key(self.frames, {'min_radius': 5}))
+		self.assertNotEqual(key, self.cache.get_key(self.frames[:-1]))
+		self.assertRaises(ValueError, self.cache.get_key, self.frames, {'radius': 5})
+
+	def test_parameters_change_detections(self):
+		detections, frame_count = self.cache.get_detections(self.frames, processes=0)
+		filtered_detections, frame_count = self.cache.get_detections(self.frames, processes=0, parameters={'min_radius': 7})
+		self.assertEqual(24, len(detections))
+		self.assertLess(len(filtered_detections), len(detections))
+		self.assertTrue(np.all(filtered_detections[:,[offline_tracking.AXIS_0,offline_tracking.AXIS_1]].min(axis=1) > 7))
+		self.assertEqual(2, len(self.cache.get_entries()))
+
+	def test_video_file_key_and_ellipses(self):
+		filename = os.path.join(self.directory, "video.avi")
+		writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'MJPG'), 10, (160,120))
+		for frame in self.frames:
+			writer.write(frame)
+		writer.release()
+		ellipses = self.cache.get_ellipses(filename, processes=0)
+		#a copy of the video under another name is the same recording
+		copy_filename = os.path.join(self.directory, "copy.avi")
+		shutil.copy(filename, copy_filename)
+		self.assertEqual(self.cache.get_key(filename), self.cache.get_key(copy_filename))
+		self.assertEqual(13, len(ellipses))
+		self.assertEqual([], ellipses[-1])
+		self.assertEqual(offline_tracking.Detector()(self.frames[0]), self.cache.get_ellipses(self.frames, processes=0)[0])
+
+	def test_evicts_least_recently_used(self):
+		for min_radius in range(3):
+			self.cache.get_detections(self.frames, processes=0, parameters={'min_radius': min_radius})
+		entries = self.cache.get_entries()
+		for i, (used, size, filename) in enumerate(entries):
+			os.utime(filename, (i, i))
+		#using the oldest entry makes it the most recently used
+		self.cache.load(os.path.basename(entries[0][2])[:-4])
+		self.cache.max_bytes = 2*entries[0][1]
+		self.cache.evict()
+		remaining = [filename for used, size, filename in self.cache.get_entries()]
+		self.assertEqual([entries[2][2], entries[0][2]], remaining)
+
+	def test_unreadable_entries_are_missing(self):
+		detections, frame_count = self.cache.get_detections(self.frames, processes=0)
+		key = self.cache.get_key(self.frames)
+		filename = self.cache.get_filename(key)
+		with open(filename, 'rb') as f:
+			data = f.read()
+		for corrupt_data in (data[:len(data)//2], 'not an npz file', ''):
+			with open(filename, 'wb') as f:
+				f.write(corrupt_data)
+			self.assertEqual(None, self.cache.load(key))
+			self.assertFalse(os.path.exists(filename))
+		#an entry of another format
+		np.savez(filename, other=np.zeros(3))
+		self.assertEqual(None, self.cache.load(key))
+		cached_detections, cached_frame_count = self.cache.get_detections(self.frames, processes=0)
+		np.testing.assert_array_equal(detections, cached_detections)
+		self.assertEqual(1, len(self.cache.get_entries()))
+
+	def test_entry_read_but_not_touched(self):
+		detections, frame_count = self.cache.get_detections(self.frames, processes=0)
+		key = self.cache.get_key(self.frames)
+		#a read-only cache, or an entry evicted by another process right after it was read
+		def utime(filename, times):
+			raise OSError(13, "Permission denied")
+		detection_cache.os.utime, os_utime = utime, os.utime
+		try:
+			cached_detections, cached_frame_count = self.cache.load(key)
+		finally:
+			detection_cache.os.utime = os_utime
+		np.testing.assert_array_equal(detections, cached_detections)
+		self.assertTrue(os.path.exists(self.cache.get_filename(key)))
+
+	def test_shared_directory(self):
+		for min_radius in range(3):
+			self.cache.get_detections(self.frames, processes=0, parameters={'min_radius': min_radius})
+		#an entry being written by another process is neither counted nor evicted
+		temporary_filename = tempfile.mkstemp(suffix='.tmp', dir=self.cache.directory)[1]
+		self.assertEqual(3, len(self.cache.get_entries()))
+		#entries evicted by another process after they were listed are skipped
+		entries = self.cache.get_entries()
+		os.remove(entries[0][2])
+		self.cache.get_entries = lambda: entries
+		self.cache.max_bytes = 0
+		self.cache.evict()
+		del self.cache.get_entries
+		self.assertEqual([], self.cache.get_entries())
+		self.assertTrue(os.path.exists(temporary_filename))
+
+	def test_track_offline_with_cache(self):
+		expected_detections, expected_ids = offline_tracking.track_offline(self.frames, processes=0)
+		for i in range(2):
+			detections, ids = offline_tracking.track_offline(self.frames, processes=0, cache=self.cache)
+			np.testing.assert_array_equal(expected_detections, detections)
+			np.testing.assert_array_equal(expected_ids, ids)
+
+if __name__ == '__main__':
+	unittest.main()
\ No newline at end of file
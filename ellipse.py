@@ -1,6 +1,8 @@
 from scipy.optimize import bisect
 from math import sqrt, log, cos, sin, radians
+import heapq
 import numpy as np
+import cv2
 
 def ellipse_difference(ellipse1,ellipse2,a=1,b=1,c=1):
 	"""
@@ -52,6 +54,67 @@ def standardize_ellipse(ellipse):
 
 	return (center,new_axes,new_angle)
 
+def ellipses_to_array(ellipses):
+	"""
+	Returns ellipses packed into an array
+
+	Args:
+		ellipses: list of ellipses in the format returned by cv2.fitEllipse, or an N x 5 array
+	Returns:
+		N x 5 float array with rows (center x, center y, first axis, second axis, angle)
+	"""
+	if isinstance(ellipses, np.ndarray):
+		return ellipses.astype(float).reshape(-1,5)
+	return np.array([(center[0],center[1],axes[0],axes[1],angle) for center,axes,angle in ellipses], dtype=float).reshape(-1,5)
+
+def array_to_ellipses(ellipses):
+	"""
+	Returns ellipses unpacked from an array; inverse of ellipses_to_array
+
+	Args:
+		ellipses: N x 5 array with rows (center x, center y, first axis, second axis, angle)
+	Returns:
+		list of ellipses in the format returned by cv2.fitEllipse
+	"""
+	return [((cx,cy),(axis0,axis1),angle) for cx,cy,axis0,axis1,angle in np.reshape(ellipses, (-1,5)).tolist()]
+
+def standardize_ellipses(ellipses):
+	"""
+	Returns standardized ellipses: array version of standardize_ellipse
+
+	Args:
+		ellipses: list of ellipses or N x 5 array (see ellipses_to_array)
+	Returns:
+		N x 5 array of equivalent ellipses with axes in order large,small and angle between 0 and 180
+	"""
+	ellipses = ellipses_to_array(ellipses).copy()
+	swap = ellipses[:,2] < ellipses[:,3]
+	ellipses[swap,2], ellipses[swap,3] = ellipses[swap,3], ellipses[swap,2]
+	ellipses[:,4] = np.mod(ellipses[:,4] + 90*swap, 180)
+	return ellipses
+
+def ellipse_difference_matrix(ellipses1,ellipses2,a=1,b=1,c=1):
+	"""
+	Error function from every ellipse in ellipses1 to every ellipse in ellipses2, see ellipse_difference
+
+	Args:
+		ellipses1: list of N ellipses or N x 5 array (see ellipses_to_array)
+		ellipses2: list of M ellipses or M x 5 array
+		a: weight on displacement
+		b: weight on log of area ratio
+		c: weight of difference in angle
+	Returns:
+		N x M array, where entry (i,j) is ellipse_difference(ellipses1[i],ellipses2[j],a,b,c)
+	"""
+	ellipses1 = standardize_ellipses(ellipses1)
+	ellipses2 = standardize_ellipses(ellipses2)
+
+	displacement = np.hypot(ellipses1[:,None,0]-ellipses2[None,:,0], ellipses1[:,None,1]-ellipses2[None,:,1])
+	size_change = (ellipses1[:,2]*ellipses1[:,3])[:,None]/(ellipses2[:,2]*ellipses2[:,3])[None,:]
+	rotation = np.abs(ellipses1[:,None,4]-ellipses2[None,:,4])
+
+	return a*displacement + b*size_change + c*rotation
+
 def fit_error(ellipse,contour):
 	"""
 	Returns the difference between an ellipse and the set of contour points it should fit
@@ -62,14 +125,249 @@ def fit_error(ellipse,contour):
 	Returns:
 		sum of distances of each point on contour to the ellipse, scaled by size of ellipse
 	"""
-	error = 0.0
 	x, y = ellipse[1]
 	scale = sqrt(x*y)
-	for pnt in contour:
-		pnt = tuple(pnt[0])
-		error += distance_from_point_to_ellipse(pnt,ellipse)
+	pnts = np.reshape(contour, (-1,2))
+	error = distances_from_points_to_ellipse(pnts,ellipse).sum()
 	return error/scale
 
+def fit_errors(ellipses,contours):
+	"""
+	Returns fit_error of every ellipse against its contour, with all points of all contours solved at once
+
+	Args:
+		ellipses: list of N ellipses, or N x 5 array (see ellipses_to_array)
+		contours: list of N contours (of possibly different length) that the ellipses were fitted to
+	Returns:
+		length N array, where entry i is fit_error(ellipses[i],contours[i])
+	"""
+	ellipses = ellipses_to_array(ellipses)
+	if len(ellipses) == 0:
+		return np.zeros(0)
+
+	lengths = [len(contour) for contour in contours]
+	pnts = np.concatenate([np.reshape(contour, (-1,2)) for contour in contours])
+	distances = distances_from_points_to_ellipse(pnts, np.repeat(ellipses, lengths, axis=0))
+
+	errors = np.bincount(np.repeat(np.arange(len(ellipses)), lengths), weights=distances, minlength=len(ellipses))
+	with np.errstate(divide='ignore', invalid='ignore'):
+		errors = errors/np.sqrt(ellipses[:,2]*ellipses[:,3])
+	#degenerate ellipses fit nothing
+	errors[np.isnan(errors)] = np.inf
+	return errors
+
+#bound on the difference between a distance of approximate_fit_errors and the exact distance, in units of the
+#distance field grid (pixels/resolution): outline nodes are within sqrt(2)/2 of the ellipse and the outline is
+#sampled every 1/2, so every node of the field is within sqrt(2)/2 + 1/4 of the exact distance, and bilinear
+#interpolation adds at most sqrt(2)/2, as distances change by at most the distance moved
+DISTANCE_FIELD_ERROR = sqrt(2) + .25
+
+def approximate_fit_errors(ellipses,contours,resolution=1.,padding=4.,max_nodes=150):
+	"""
+	Returns an approximation of the fit_error of every ellipse against its contour, read off distance fields
+	rather than solved for every point
+
+	The outline of every ellipse is rasterized into a tile around it (padded by padding), all tiles are packed
+	into one image, a single distance transform of the image gives the distance from every pixel to the
+	nearest outline, and all contour points are scored at once by bilinear interpolation in it. Points
+	outside their tile or at least padding away from the outline are scored exactly, and so are ellipses
+	whose tile has more than max_nodes nodes per contour point (a node of the distance transform costs about
+	a hundredth of solving for a point). Tiles are set apart so that distances under padding always come
+	from a tile's own outline
+
+	The distance of every point is within DISTANCE_FIELD_ERROR/resolution pixels of the exact distance (of
+	distances_from_points_to_ellipse), so fit_error is within get_fit_error_bounds
+
+	Args:
+		ellipses: list of N ellipses, or N x 5 array (see ellipses_to_array)
+		contours: list of N contours that the ellipses were fitted to
+		resolution: grid nodes per pixel of the distance fields
+		padding: margin in pixels around every ellipse, within which distances are read off the field
+		max_nodes: largest number of nodes of a tile per point of its contour
+	Returns:
+		length N array, where entry i is approximately fit_error(ellipses[i],contours[i])
+	"""
+	ellipses = ellipses_to_array(ellipses)
+	if len(ellipses) == 0:
+		return np.zeros(0)
+
+	#tile of every ellipse: square grid of sizes nodes from origins (in pixels) covering the ellipse and padding
+	lengths = np.array([len(contour) for contour in contours])
+	with np.errstate(invalid='ignore'):
+		valid = np.all(np.isfinite(ellipses), axis=1) & (np.min(ellipses[:,2:4], axis=1) > 0)
+		diameters = np.where(valid, np.max(np.abs(ellipses[:,2:4]), axis=1), 0)
+		valid &= ((diameters + 2*padding + 2)*resolution)**2 <= max_nodes*lengths
+		diameters[~valid] = 0
+	radii = diameters/2. + padding
+	origins = np.floor(np.where(valid[:,None], ellipses[:,0:2], 0) - radii[:,None])
+	sizes = np.ceil((2*radii + 2)*resolution).astype(int)
+	offsets, shape = pack_tiles(sizes + 2)
+	field = np.full(shape, 255, np.uint8)
+
+	#outline samples, at most half a grid node apart (the perimeter is at most pi times the diameter), placed
+	#as closest_points_on_ellipse places its points
+	sample_counts = np.where(valid, np.maximum(np.ceil(2*np.pi*diameters*resolution), 8), 0).astype(int)
+	owners = np.repeat(np.arange(len(ellipses)), sample_counts)
+	t = 2*np.pi*(np.arange(len(owners)) - np.repeat(np.cumsum(sample_counts) - sample_counts, sample_counts))/sample_counts[owners]
+	e = standardize_ellipses(ellipses[valid])[np.cumsum(valid)[owners] - 1] if len(owners) else np.zeros((0,5))
+	rad = np.radians(e[:,4])
+	x0, x1 = e[:,2]/2.*np.cos(t), e[:,3]/2.*np.sin(t)
+	nodes_x = np.round((x0*np.cos(rad) + x1*np.sin(rad) + e[:,0] - origins[owners,0])*resolution).astype(int)
+	nodes_y = np.round((x1*np.cos(rad) - x0*np.sin(rad) + e[:,1] - origins[owners,1])*resolution).astype(int)
+	field[nodes_y + offsets[owners,1], nodes_x + offsets[owners,0]] = 0
+	field = cv2.distanceTransform(field, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)/resolution
+
+	pnts = np.concatenate([np.reshape(contour, (-1,2)) for contour in contours]).astype(float)
+	owners = np.repeat(np.arange(len(ellipses)), lengths)
+	grid = (pnts - origins[owners])*resolution
+	inside = valid[owners] & np.all((grid >= 0) & (grid < sizes[owners,None] - 1), axis=1)
+	grid = np.where(inside[:,None], grid, 0) + offsets[owners]
+	corners = np.floor(grid).astype(int)
+	fx, fy = (grid - corners).T
+	x0, y0 = corners.T
+	distances = ((1-fx)*(1-fy)*field[y0,x0] + fx*(1-fy)*field[y0,x0+1] + (1-fx)*fy*field[y0+1,x0] + fx*fy*field[y0+1,x0+1])
+
+	exact = ~inside | (distances >= padding)
+	distances[exact] = distances_from_points_to_ellipse(pnts[exact], ellipses[owners[exact]])
+
+	errors = np.bincount(owners, weights=distances, minlength=len(ellipses))
+	with np.errstate(divide='ignore', invalid='ignore'):
+		errors = errors/np.sqrt(ellipses[:,2]*ellipses[:,3])
+	#degenerate ellipses fit nothing
+	errors[np.isnan(errors)] = np.inf
+	return errors
+
+def get_fit_error_bounds(ellipses,contours,resolution=1.):
+	"""
+	Returns the bound on the difference between approximate_fit_errors and fit_errors of every ellipse
+	"""
+	ellipses = ellipses_to_array(ellipses)
+	lengths = np.array([len(contour) for contour in contours], dtype=float)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		bounds = lengths*DISTANCE_FIELD_ERROR/resolution/np.sqrt(ellipses[:,2]*ellipses[:,3])
+	bounds[np.isnan(bounds)] = np.inf
+	return bounds
+
+def pack_tiles(sizes):
+	"""
+	Returns positions to pack squares of the given sizes into one image, in rows, largest first
+
+	Args:
+		sizes: length N array of the side lengths of the squares
+	Returns:
+		N x 2 array of the (x, y) positions of the top left corners of the squares, and (height, width) of the image
+	"""
+	sizes = np.asarray(sizes, dtype=int)
+	width = max(int(np.ceil(np.sqrt(np.sum(sizes.astype(float)**2)))), sizes.max())
+	offsets = np.zeros((len(sizes),2), dtype=int)
+	x = y = row_height = 0
+	for i in np.argsort(-sizes, kind='mergesort'):
+		if x + sizes[i] > width:
+			x, y, row_height = 0, y + row_height, 0
+		offsets[i] = x, y
+		x += sizes[i]
+		row_height = max(row_height, sizes[i])
+	return offsets, (y + row_height, width)
+
+def lowest_approximate_fit_errors(ellipses,contours,count,resolution=1.):
+	"""
+	Returns the count ellipses with lowest fit_error against their contour, ranked by approximate_fit_errors
+	and refined exactly
+
+	Every ellipse is scored approximately, and only those that can still be among the best within the error
+	bounds (see get_fit_error_bounds) are scored exactly, best approximations first, so the result is the same as that of
+	lowest_fit_errors. It is faster when the contours have many points for the size of their ellipses
+
+	Args:
+		ellipses: list of N ellipses, or N x 5 array (see ellipses_to_array)
+		contours: list of N contours that the ellipses were fitted to
+		count: number of ellipses to keep
+		resolution: grid nodes per pixel of the distance fields, see approximate_fit_errors
+	Returns:
+		array of the indices of the (at most count) ellipses with lowest fit_error, ordered by fit_error (ties by
+		index), and array of their fit_errors
+	"""
+	ellipses = ellipses_to_array(ellipses)
+	if len(ellipses) <= count or count <= 0:
+		return lowest_fit_errors(ellipses,contours,count)
+
+	approximate_errors = approximate_fit_errors(ellipses,contours,resolution)
+	bounds = get_fit_error_bounds(ellipses,contours,resolution)
+	#the count best fit_errors are at most the count-th lowest upper bound, so ellipses whose lower bound is
+	#above it are not among them (degenerate ellipses have no bounds and are kept)
+	with np.errstate(invalid='ignore'):
+		threshold = np.sort(approximate_errors + bounds)[count-1]
+		candidates = np.flatnonzero(~(approximate_errors - bounds > threshold))
+	indices, errors = lowest_fit_errors(ellipses[candidates],[contours[i] for i in candidates],count,
+		np.argsort(approximate_errors[candidates], kind='mergesort'))
+	return candidates[indices], errors
+
+def lowest_fit_errors(ellipses,contours,count,order=None,chunk_size=8,min_points=2048):
+	"""
+	Returns the count ellipses with lowest fit_error against their contour, without finishing the fit_error of
+	ellipses that cannot be among them
+
+	Ellipses are scored in two rounds, all at once in each: the first count ellipses (in order) in full and
+	the first chunk_size points of the others, then the rest of the points of the others that are left.
+	Scored ellipses are kept in a heap of the count best, and the others are dropped after the first round if
+	their partial sum (a lower bound on their fit_error) already passes the worst of the heap. Every round
+	costs as much as scoring about a thousand points (see closest_points_on_nice_ellipse), so with fewer than
+	min_points points in all, every ellipse is scored in full at once instead
+
+	Args:
+		ellipses: list of N ellipses, or N x 5 array (see ellipses_to_array)
+		contours: list of N contours that the ellipses were fitted to
+		count: number of ellipses to keep
+		order: optional order to score the ellipses in, the likeliest good fits first so that the others are
+			dropped early; the result does not depend on it
+		chunk_size: number of points of every contour scored in the first round
+		min_points: number of points from which ellipses are scored in two rounds
+	Returns:
+		array of the indices of the (at most count) ellipses with lowest fit_error, ordered by fit_error (ties by
+		index, as a stable sort of fit_errors), and array of their fit_errors
+	"""
+	if count <= 0:
+		return np.zeros(0, dtype=int), np.zeros(0)
+	ellipses = ellipses_to_array(ellipses)
+	if len(ellipses) <= count or sum(len(contour) for contour in contours) < min_points:
+		errors = fit_errors(ellipses,contours)
+		indices = np.argsort(errors, kind='mergesort')[:count]
+		return indices, errors[indices]
+
+	pnts = [np.reshape(contour, (-1,2)) for contour in contours]
+	lengths = np.array([len(p) for p in pnts])
+	scales = np.sqrt(ellipses[:,2]*ellipses[:,3])
+	sums = np.zeros(len(ellipses))
+	scored = np.zeros(len(ellipses), dtype=int)
+	active = np.arange(len(ellipses)) if order is None else np.asarray(order, dtype=int)
+	#max-heap of (-fit_error, -index), so the worst of the kept ellipses (ties: the last) is on top
+	heap = []
+	while len(active):
+		takes = np.minimum(lengths[active] - scored[active], chunk_size)
+		if not heap:
+			takes[:count] = lengths[active[:count]]
+		chunk = np.concatenate([pnts[i][scored[i]:scored[i]+take] for i, take in zip(active, takes)])
+		distances = distances_from_points_to_ellipse(chunk, np.repeat(ellipses[active], takes, axis=0))
+		sums[active] += np.bincount(np.repeat(np.arange(len(active)), takes), weights=distances, minlength=len(active))
+		scored[active] += takes
+		with np.errstate(divide='ignore', invalid='ignore'):
+			errors = sums[active]/scales[active]
+		#degenerate ellipses fit nothing
+		errors[np.isnan(errors)] = np.inf
+
+		complete = scored[active] == lengths[active]
+		for index, error in zip(active[complete].tolist(), errors[complete].tolist()):
+			if len(heap) < count:
+				heapq.heappush(heap, (-error, -index))
+			elif (-error, -index) > heap[0]:
+				heapq.heapreplace(heap, (-error, -index))
+		#partial sums only grow, so ellipses already past the worst kept one are dropped
+		active = active[~complete & (errors <= -heap[0][0])]
+		chunk_size = lengths.max()
+
+	best = sorted((-error, -index) for error, index in heap)
+	return np.array([index for error, index in best], dtype=int), np.array([error for error, index in best])
+
 def rotate(pnt, angle):
 	"""
 	Returns point rotated by angle
@@ -103,6 +401,56 @@ def distance_from_point_to_ellipse(pnt,ellipse):
 
 	return sqrt((x0-y0)**2 + ((x1-y1)**2))
 
+def distances_from_points_to_ellipse(pnts,ellipse,iterations=64):
+	"""
+	Returns the distance from every point in pnts to the closest point on ellipse
+
+	Args:
+		pnts: K x 2 array of points
+		ellipse: ellipse to compare points to, or K x 5 array with one ellipse per point (see ellipses_to_array)
+		iterations: number of bisection steps, see closest_points_on_nice_ellipse
+	Returns:
+		length K array of distances
+	"""
+	pnts = np.asarray(pnts, dtype=float).reshape(-1,2)
+	closest_pnts = closest_points_on_ellipse(pnts,ellipse,iterations)
+	return np.hypot(closest_pnts[:,0]-pnts[:,0], closest_pnts[:,1]-pnts[:,1])
+
+def closest_points_on_ellipse(pnts,ellipse,iterations=64):
+	"""
+	Returns the closest point on ellipse to every point in pnts; array version of closest_point_on_ellipse
+
+	Args:
+		pnts: K x 2 array of points
+		ellipse: ellipse to compare points to, or K x 5 array with one ellipse per point (see ellipses_to_array)
+		iterations: number of bisection steps, see closest_points_on_nice_ellipse
+	Returns:
+		K x 2 array of closest points on ellipse
+	"""
+	pnts = np.asarray(pnts, dtype=float).reshape(-1,2)
+	if not isinstance(ellipse, np.ndarray):
+		ellipse = [ellipse]
+	ellipses = standardize_ellipses(ellipse)
+	center = ellipses[:,0:2]
+	rad = np.radians(ellipses[:,4])
+	cos_angle, sin_angle = np.cos(rad), np.sin(rad)
+
+	#effectively center ellipse at zero and align it with axes by modifying points
+	y = pnts - center
+	y0 = y[:,0]*cos_angle - y[:,1]*sin_angle
+	y1 = y[:,1]*cos_angle + y[:,0]*sin_angle
+
+	#solve with both coordinates of points positive, then re-flip signs
+	x = closest_points_on_nice_ellipse(np.column_stack((np.abs(y0),np.abs(y1))), ellipses[:,2:4], iterations)
+	x0 = np.where(y0 < 0, -x[:,0], x[:,0])
+	x1 = np.where(y1 < 0, -x[:,1], x[:,1])
+
+	#re-rotate and uncenter resulting points
+	closest_pnts = np.empty_like(pnts)
+	closest_pnts[:,0] = x0*cos_angle + x1*sin_angle + center[:,0]
+	closest_pnts[:,1] = x1*cos_angle - x0*sin_angle + center[:,1]
+	return closest_pnts
+
 #TODO: not exactly correct
 def closest_point_on_ellipse(pnt,ellipse):
 	"""
@@ -181,10 +529,63 @@ def closest_point_on_nice_ellipse(pnt,axes):
 			x1 = e1
 	else:
 		if y0 < (e0**2 - e1**2)/e0:
-			x0 = e0*2*y0/(e0**2-e1**2)
+			x0 = e0**2*y0/(e0**2-e1**2)
 			x1 = e1*sqrt(1.-(x0/e0)**2)
 		else:
 			x0 = e0
 			x1 = 0
 
-	return (x0,x1)
\ No newline at end of file
+	return (x0,x1)
+
+def closest_points_on_nice_ellipse(pnts,axes,iterations=64):
+	"""
+	Returns the closest points on an ellipse centered at the origin, aligned along axes, to points in the
+	first quadrant; array version of closest_point_on_nice_ellipse
+
+	The root of the same function is found by a fixed number of bisection steps on every point at once,
+	each step halving the bracket of Eberly's method (the default matches scipy's bisect to float precision)
+
+	Args:
+		pnts: K x 2 array of points (y0,y1), where y0,y1 >= 0
+		axes: length of ellipse axes in decreasing order, either a single pair or a K x 2 array
+		iterations: number of bisection steps
+	Returns:
+		K x 2 array of closest points on ellipse
+	"""
+	pnts = np.asarray(pnts, dtype=float).reshape(-1,2)
+	y0, y1 = pnts[:,0], pnts[:,1]
+	axes = np.broadcast_to(np.asarray(axes, dtype=float)/2., pnts.shape)
+	e0, e1 = axes[:,0], axes[:,1]
+	assert np.all(e0 >= e1)
+	closest_pnts = np.zeros_like(pnts)
+
+	#find closest point given one of four cases
+	#method from http://www.geometrictools.com/Documentation/DistancePointEllipseEllipsoid.pdf
+	general = (y1 > 0) & (y0 > 0)
+	#degenerate ellipses (zero minor axis) give inf/nan rather than raising
+	with np.errstate(divide='ignore', invalid='ignore'):
+		g0, g1, f0, f1 = y0[general], y1[general], e0[general], e1[general]
+		lower_bound = -f1**2 + f1*g1
+		upper_bound = -f1**2 + np.sqrt(f0**2*g0**2 + f1**2*g1**2)
+		for i in range(iterations):
+			t = (lower_bound + upper_bound)/2.
+			above = (f0*g0/(t+f0**2))**2 + (f1*g1/(t+f1**2))**2 - 1 > 0
+			lower_bound = np.where(above, t, lower_bound)
+			upper_bound = np.where(above, upper_bound, t)
+		tbar = (lower_bound + upper_bound)/2.
+		closest_pnts[general,0] = f0**2*g0/(tbar+f0**2)
+		closest_pnts[general,1] = f1**2*g1/(tbar+f1**2)
+
+	on_minor_axis = (y1 > 0) & ~general
+	closest_pnts[on_minor_axis,1] = e1[on_minor_axis]
+
+	on_major_axis = ~(y1 > 0)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		inside = on_major_axis & (y0 < (e0**2 - e1**2)/e0)
+		x0 = e0[inside]**2*y0[inside]/(e0[inside]**2-e1[inside]**2)
+	closest_pnts[inside,0] = x0
+	closest_pnts[inside,1] = e1[inside]*np.sqrt(1.-(x0/e0[inside])**2)
+	outside = on_major_axis & ~inside
+	closest_pnts[outside,0] = e0[outside]
+
+	return closest_pnts
\ No newline at end of file
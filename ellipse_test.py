@@ -1,5 +1,5 @@
 import unittest
-from math import tanh
+from math import tanh, sqrt
 import numpy as np
 import cv2
 import ellipse as e
@@ -77,6 +77,111 @@ class Ellipse_Test(unittest.TestCase):
 		self.show_points_and_ellipse(pnt,actual_closest_point, ellipse)
 		#TODO better check. currently validating by visual inspection
 
+	def test_standardize_ellipses_matches_standardize_ellipse(self):
+		ellipses = [self.ellipse1,self.ellipse2,self.ellipse3]
+		actual_ellipses = e.standardize_ellipses(ellipses)
+		expected_ellipses = e.ellipses_to_array(map(e.standardize_ellipse, ellipses))
+		np.testing.assert_allclose(expected_ellipses, actual_ellipses)
+
+	def test_ellipse_difference_matrix_matches_ellipse_difference(self):
+		rng = np.random.RandomState(0)
+		ellipses1 = [((x,y),(w,h),t) for x,y,w,h,t in rng.uniform(1,200,(6,5))] + [((128.,128.),(30.,20.),0.)]
+		ellipses2 = [((x,y),(w,h),t) for x,y,w,h,t in rng.uniform(1,200,(4,5))] + [((126.,124.),(22.,31.),-89.),((126.,124.),(31.,22.),-179.)]
+		actual_matrix = e.ellipse_difference_matrix(ellipses1,ellipses2,a=1,b=2,c=.5)
+		self.assertEqual((7,6), actual_matrix.shape)
+		for i, ellipse1 in enumerate(ellipses1):
+			for j, ellipse2 in enumerate(ellipses2):
+				self.assertAlmostEqual(e.ellipse_difference(ellipse1,ellipse2,a=1,b=2,c=.5), actual_matrix[i,j])
+
+	def test_closest_points_on_ellipse_matches_closest_point_on_ellipse(self):
+		rng = np.random.RandomState(1)
+		ellipse = ((128.,128.),(40.,90.),33.)
+		pnts = np.vstack((rng.uniform(60,200,(50,2)), [(128.,128.),(150.,128.),(128.,160.)]))
+		actual_pnts = e.closest_points_on_ellipse(pnts, ellipse)
+		for pnt, actual_pnt in zip(pnts, actual_pnts):
+			expected_pnt = e.closest_point_on_ellipse(tuple(pnt), ellipse)
+			np.testing.assert_allclose(expected_pnt, actual_pnt, atol=1e-8)
+
+	def test_closest_points_on_nice_ellipse_on_axes(self):
+		pnts = [(25,0),(0,10),(3,0),(0,0)]
+		actual_pnts = e.closest_points_on_nice_ellipse(pnts, (50,40))
+		expected_pnts = [e.closest_point_on_nice_ellipse(pnt, (50,40)) for pnt in pnts]
+		np.testing.assert_allclose(expected_pnts, actual_pnts)
+
+	def test_distances_from_points_to_ellipse_matches_distance_from_point_to_ellipse(self):
+		rng = np.random.RandomState(2)
+		pnts = rng.uniform(80,180,(40,2))
+		actual_distances = e.distances_from_points_to_ellipse(pnts, self.ellipse2)
+		expected_distances = [e.distance_from_point_to_ellipse(tuple(pnt), self.ellipse2) for pnt in pnts]
+		np.testing.assert_allclose(expected_distances, actual_distances, atol=1e-8)
+
+	def test_fit_errors_matches_fit_error(self):
+		rng = np.random.RandomState(3)
+		ellipses = [((100.,100.),(30.,20.),10.), ((50.,60.),(12.,25.),120.)]
+		contours = [rng.randint(70,130,(17,1,2)), rng.randint(30,80,(5,1,2))]
+		actual_errors = e.fit_errors(ellipses, contours)
+		expected_errors = [sum(e.distance_from_point_to_ellipse(tuple(pnt[0]),ellipse) for pnt in contour)/sqrt(ellipse[1][0]*ellipse[1][1])
+			for ellipse, contour in zip(ellipses, contours)]
+		np.testing.assert_allclose(expected_errors, actual_errors)
+		np.testing.assert_allclose(expected_errors, [e.fit_error(ellipse,contour) for ellipse, contour in zip(ellipses, contours)])
+
+	def test_lowest_fit_errors_matches_sorted_fit_errors(self):
+		rng = np.random.RandomState(4)
+		ellipses = [((x,y),(a0,a1),angle) for x, y, a0, a1, angle in rng.uniform((50,50,10,10,0), (200,200,60,60,180), (60,5))]
+		#contours around their own ellipse, or around nothing, of many lengths; one pair with equal errors
+		contours = [np.round(e.closest_points_on_ellipse(rng.uniform(-100,100,(rng.randint(5,200),2)) + ellipse[0], ellipse)
+			+ rng.normal(0, 1 + 4*(i % 3), (1,2))).astype(int).reshape(-1,1,2) for i, ellipse in enumerate(ellipses)]
+		ellipses[2], contours[2] = ellipses[57], contours[57]
+		errors = e.fit_errors(ellipses, contours)
+		expected_indices = np.argsort(errors, kind='mergesort')[:5]
+		for order in (None, rng.permutation(60), np.argsort(-errors)):
+			for min_points in (0, 2048, 10**6):
+				indices, lowest_errors = e.lowest_fit_errors(ellipses, contours, 5, order, min_points=min_points)
+				np.testing.assert_array_equal(expected_indices, indices)
+				np.testing.assert_allclose(errors[expected_indices], lowest_errors)
+		indices, lowest_errors = e.lowest_fit_errors(ellipses[:3], contours[:3], 5)
+		np.testing.assert_array_equal(np.argsort(errors[:3], kind='mergesort'), indices)
+		for min_points in (0, 10**6):
+			indices, lowest_errors = e.lowest_fit_errors(ellipses, contours, 0, min_points=min_points)
+			self.assertEqual((0, 0), (len(indices), len(lowest_errors)))
+
+	def test_approximate_fit_errors_within_bounds(self):
+		rng = np.random.RandomState(5)
+		ellipses = [((x,y),(a0,a1),angle) for x, y, a0, a1, angle in rng.uniform((50,50,5,5,0), (200,200,80,80,180), (40,5))]
+		contours = [np.round(e.closest_points_on_ellipse(rng.uniform(-100,100,(rng.randint(5,200),2)) + ellipse[0], ellipse)
+			+ rng.normal(0, 1 + 4*(i % 3), (1,2))).astype(int).reshape(-1,1,2) for i, ellipse in enumerate(ellipses)]
+		#a degenerate ellipse, and one too large for its contour to be scored on a distance field
+		ellipses += [((100.,100.),(0.,20.),0.), ((100.,100.),(800.,600.),30.)]
+		contours += [contours[0], contours[1]]
+		errors = e.fit_errors(ellipses, contours)
+		for resolution in (1., 2.):
+			approximate_errors = e.approximate_fit_errors(ellipses, contours, resolution)
+			bounds = e.get_fit_error_bounds(ellipses, contours, resolution)
+			self.assertTrue(np.all(np.abs(approximate_errors[:-2] - errors[:-2]) <= bounds[:-2]))
+			self.assertEqual(np.inf, approximate_errors[-2])
+			self.assertAlmostEqual(errors[-1], approximate_errors[-1])
+
+	def test_lowest_approximate_fit_errors_matches_lowest_fit_errors(self):
+		rng = np.random.RandomState(4)
+		ellipses = [((x,y),(a0,a1),angle) for x, y, a0, a1, angle in rng.uniform((50,50,10,10,0), (200,200,60,60,180), (60,5))]
+		contours = [np.round(e.closest_points_on_ellipse(rng.uniform(-100,100,(rng.randint(5,200),2)) + ellipse[0], ellipse)
+			+ rng.normal(0, 1 + 4*(i % 3), (1,2))).astype(int).reshape(-1,1,2) for i, ellipse in enumerate(ellipses)]
+		ellipses[2], contours[2] = ellipses[57], contours[57]
+		for count in (0, 1, 5, 60):
+			expected_indices, expected_errors = e.lowest_fit_errors(ellipses, contours, count)
+			indices, errors = e.lowest_approximate_fit_errors(ellipses, contours, count)
+			np.testing.assert_array_equal(expected_indices, indices)
+			np.testing.assert_allclose(expected_errors, errors)
+
+	def test_pack_tiles_do_not_overlap(self):
+		sizes = np.random.RandomState(6).randint(1, 50, 30)
+		offsets, shape = e.pack_tiles(sizes)
+		covered = np.zeros(shape, dtype=int)
+		for (x, y), size in zip(offsets, sizes):
+			covered[y:y+size, x:x+size] += 1
+		self.assertEqual(sum(sizes**2), covered.sum())
+		self.assertEqual(1, covered.max())
+
 	# for debugging purposes
 	def show_ellipses(self):
 		img = np.zeros((256,256,3), np.uint8)
@@ -1,16 +1,26 @@
+import os
+import sys
 import cv2
 import numpy as np
+import multiprocessing
+import threading
+import functools
+import Queue
+from collections import deque
+from math import sqrt
+from timeit import default_timer
 import correspondence_tracking as ct
 from ellipse import *
+from tracks import CONFIRMED
 
 """
 IMPORTANT NOTE:
 this class makes defensive copies of images whenever using methods that modify
 the original image (e.g. drawContours, drawEllipses). This allows a functional
 programming style to be applied, without concern of the original object mutating.
-However, this incurs a performance penalty due to copying, so if this becomes an
-issue it may be necessary to port all methods that use the copy() function to
-mutable versions.
+However, this incurs a performance penalty due to copying, so the drawing methods
+have mutable versions (draw_contours, draw_ellipses), and FrameContext runs the
+whole detection chain in preallocated buffers.
 """
 
 # -----------------------------------------------------------
@@ -31,43 +41,73 @@ def hsv_mask(hsv_img,lower,upper):
 	upper_hsv = np.array([upper,255,255])
 	return cv2.inRange(hsv_img, lower_hsv, upper_hsv)
 
-def get_red(img, lower_red_bounds=(0,2), upper_red_bounds=(170,180)):
+def get_red_mask(img, lower_red_bounds=(0,2), upper_red_bounds=(170,180), out=None, hsv_out=None, band_out=None):
 	"""
-	Returns the part of the image that is red
+	Returns mask of the part of the image that is red
+
+	The hue bands are combined with bitwise or (rather than adding masks, which could wrap around), and
+	every intermediate can be written to a preallocated buffer, so nothing is allocated per frame
 
 	Args:
 		img: image to extract red from
+		lower_red_bounds: hue range of the red band at the start of the hue circle
+		upper_red_bounds: hue range of the red band at the end of the hue circle
+		out: optional preallocated single channel uint8 image for the mask, reused across frames
+		hsv_out: optional preallocated image of the same shape as img, used as work space
+		band_out: optional preallocated single channel uint8 image, used as work space
 	Returns:
-		hsv version of image with non-red parts blacked out
+		mask (out, if given) that is 255 on red pixels and 0 elsewhere
 	"""
-	img_hsv=cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+	hsv_out = cv2.cvtColor(img, cv2.COLOR_BGR2HSV, dst=hsv_out)
 
 	lower_red0, upper_red0 = lower_red_bounds
-	mask0 = hsv_mask(img_hsv, lower_red0, upper_red0)
+	out = cv2.inRange(hsv_out, (lower_red0,50,50), (upper_red0,255,255), dst=out)
 
 	lower_red1, upper_red1 = upper_red_bounds
-	mask1 = hsv_mask(img_hsv, lower_red1, upper_red1)
+	band_out = cv2.inRange(hsv_out, (lower_red1,50,50), (upper_red1,255,255), dst=band_out)
 
-	mask = mask0 + mask1
-	img_red = cv2.bitwise_and(img, img, mask=mask)
+	return cv2.bitwise_or(out, band_out, dst=out)
+
+def get_red(img, lower_red_bounds=(0,2), upper_red_bounds=(170,180), out=None, mask_out=None, hsv_out=None, band_out=None):
+	"""
+	Returns the part of the image that is red
+
+	Args:
+		img: image to extract red from
+		lower_red_bounds: hue range of the red band at the start of the hue circle
+		upper_red_bounds: hue range of the red band at the end of the hue circle
+		out: optional preallocated image of the same shape as img for the result, reused across frames
+		mask_out: optional preallocated work space for the mask, see get_red_mask
+		hsv_out: optional preallocated work space for the hsv image, see get_red_mask
+		band_out: optional preallocated work space for the second hue band, see get_red_mask
+	Returns:
+		copy of image (out, if given) with non-red parts blacked out
+	"""
+	mask = get_red_mask(img, lower_red_bounds, upper_red_bounds, mask_out, hsv_out, band_out)
+
+	#bitwise_and leaves pixels outside of the mask untouched, so a reused buffer is cleared first
+	if out is not None:
+		out.fill(0)
+	img_red = cv2.bitwise_and(img, img, dst=out, mask=mask)
 
 	return img_red
 
 # -----------------------------------------------------------
 # hsv image methods
 # -----------------------------------------------------------
-def get_thresholded_hsv(hsv_img):
+def get_thresholded_hsv(hsv_img, out=None):
 	"""
 	Returns binary copy of hsv_img using optimal threshold (via Otsu method)
 
 	Args:
 		hsv_img: image to apply thresholding to
+		out: optional preallocated single channel uint8 image for the result, reused across frames
 	Returns:
-		copy of hsv_img with white in place of pixels with gray value over optimal threshold and black in place of pixels below
+		copy of hsv_img (out, if given) with white in place of pixels with gray value over optimal threshold and black in place of pixels below
 	"""
-	gray = hsv_img[:,:,2]
+	gray = cv2.extractChannel(hsv_img, 2, dst=out)
 	maxval = 255 #black
-	ret, thresh = cv2.threshold(gray, 0, maxval, cv2.THRESH_BINARY_INV+cv2.THRESH_OTSU)
+	ret, thresh = cv2.threshold(gray, 0, maxval, cv2.THRESH_BINARY_INV+cv2.THRESH_OTSU, dst=gray)
 	return thresh
 
 def get_contours_hsv(hsv_img,fill=True):
@@ -85,7 +125,7 @@ def get_contours_hsv(hsv_img,fill=True):
 		binary_img = get_filled_binary(binary_img)
 	return get_contours_binary(binary_img)
 
-def get_ellipses_hsv(hsv_img,min_radius=0,fill=True):
+def get_ellipses_hsv(hsv_img,min_radius=0,fill=True,approximate=False):
 	"""
 	Returns list of ellipses in an hsv img
 
@@ -93,26 +133,102 @@ def get_ellipses_hsv(hsv_img,min_radius=0,fill=True):
 		hsv_img: image to find ellipses on
 		min_radius: minimum radius of ellipse to consider
 		fill: whether or not to first apply dilation and erosion before getting contours
+		approximate: whether to rank the ellipses on distance fields first, see select_ellipses
 	Returns:
 		list of ellipses found in the image
 	"""
 	contours = get_contours_hsv(hsv_img,fill)
+	return select_ellipses(contours,min_radius,approximate=approximate)
 
-	#need more than 4 points to fit ellipse
-	contours = filter(lambda c: len(c) > 4, contours)
+def prefilter_contours(contours,min_radius=0,min_circularity=.1):
+	"""
+	Returns the contours that may be fitted by an ellipse, judged from their area (zeroth moment) and perimeter,
+	before any ellipse is fitted
 
-	#pair ellipses with their contours for next steps
-	ellipses_contour_pairs = zip(map(cv2.fitEllipse, contours),contours)
+	A contour is dropped if it has too few points to fit an ellipse to, encloses no area, is less circular
+	(4*pi*area/perimeter**2) than min_circularity, or encloses less than half the area of a circle of diameter
+	min_radius, the smallest ellipse select_ellipses keeps (half, since fitEllipse fits the points rather than
+	the area)
 
-	#filter out small ellipses
-	ellipses_contour_pairs = filter(lambda (e,c): min(e[1]) > min_radius, ellipses_contour_pairs)
+	Args:
+		contours: list of contours
+		min_radius: minimum radius of ellipse to consider, see select_ellipses
+		min_circularity: minimum circularity of a contour; an ellipse with axes 1:10 has about .24
+	Returns:
+		list of (contour, area) pairs of the contours kept
+	"""
+	min_area = max(np.pi/8*min_radius**2, 0)
+	kept = []
+	for contour in contours:
+		#need more than 4 points to fit ellipse
+		if len(contour) <= 4: continue
+		area = cv2.contourArea(contour)
+		if area <= min_area: continue
+		if 4*np.pi*area < min_circularity*cv2.arcLength(contour, True)**2: continue
+		kept.append((contour, area))
+	return kept
 
-	#get top 5 ellipses
-	ellipses_contour_pairs = sorted(ellipses_contour_pairs, key= lambda (e,c): fit_error(e,c))[:5]
+def select_ellipses(contours,min_radius=0,profiler=None,count=5,min_circularity=0,approximate=False,fit_errors=None):
+	"""
+	Returns the ellipses that best fit a list of contours
+
+	Only enough of the fit_error of every candidate is computed to tell whether it is among the best (see
+	lowest_fit_errors), so the ellipses are those of a stable sort of every fit_error. With min_circularity,
+	contours that cannot be fitted well are dropped first (see prefilter_contours), which is faster on cluttered
+	frames but may drop contours that would have been among the best.
+	With approximate, candidates are ranked on distance fields instead and only those that may be among the
+	best are scored exactly (see lowest_approximate_fit_errors); the ellipses returned are the same
+
+	Args:
+		contours: list of contours to fit ellipses to
+		min_radius: minimum radius of ellipse to consider
+		profiler: optional profiling.Profiler to record the 'fit' and 'ranking' stages and the numbers of
+			'contours' and 'ellipses_fitted' in
+		count: maximum number of ellipses to return
+		min_circularity: minimum circularity of a contour, see prefilter_contours; 0 to fit every contour
+		approximate: whether to rank on distance fields, faster when contours have many points
+		fit_errors: optional map to add the fit_error of every ellipse returned to, keyed by the ellipse
+	Returns:
+		list of the (at most count) ellipses with lowest fit_error against their contour, best first
+	"""
+	if profiler is not None:
+		start = default_timer()
+		profiler.count('contours', len(contours))
 
-	#extract ellipses from pairs
-	ellipses = map(lambda (e,c): e, ellipses_contour_pairs)
+	if min_circularity > 0:
+		contour_area_pairs = prefilter_contours(contours,min_radius,min_circularity)
+	else:
+		#need more than 4 points to fit ellipse; areas only order the scoring
+		contour_area_pairs = [(contour, cv2.contourArea(contour)) for contour in contours if len(contour) > 4]
 
+	#fit ellipses, filtering out small ones
+	ellipses_contour_pairs = []
+	areas = []
+	for contour, area in contour_area_pairs:
+		ellipse = cv2.fitEllipse(contour)
+		if min(ellipse[1]) > min_radius:
+			ellipses_contour_pairs.append((ellipse,contour))
+			areas.append(area)
+
+	if profiler is not None:
+		start = profiler.lap('fit', start)
+		profiler.count('ellipses_fitted', len(ellipses_contour_pairs))
+
+	ellipses = [e for e,c in ellipses_contour_pairs]
+	if approximate:
+		indices, errors = lowest_approximate_fit_errors(ellipses, [c for e,c in ellipses_contour_pairs], count)
+	else:
+		#score the candidates whose area is closest to that of their ellipse first, as they likely fit best
+		with np.errstate(divide='ignore', invalid='ignore'):
+			area_ratios = np.array(areas)/(np.pi/4*np.array([e[1][0]*e[1][1] for e in ellipses]))
+		order = np.argsort(np.abs(1 - np.nan_to_num(area_ratios)))
+		indices, errors = lowest_fit_errors(ellipses, [c for e,c in ellipses_contour_pairs], count, order)
+	ellipses = [ellipses[i] for i in indices]
+	if fit_errors is not None:
+		fit_errors.update(zip(ellipses, np.asarray(errors).tolist()))
+
+	if profiler is not None:
+		profiler.lap('ranking', start)
 	return ellipses
 
 # -----------------------------------------------------------
@@ -141,25 +257,9 @@ def get_ellipses_binary(binary_img,min_radius=0):
 		list of ellipses found in the image
 	"""
 	contours = get_contours_binary(binary_img)
+	return select_ellipses(contours,min_radius)
 
-	#need more than 4 points to fit ellipse
-	contours = filter(lambda c: len(c) > 4, contours)
-
-	#pair ellipses with their contours for next steps
-	ellipses_contour_pairs = zip(map(cv2.fitEllipse, contours),contours)
-
-	#filter out small ellipses
-	ellipses_contour_pairs = filter(lambda (e,c): min(e[1]) > min_radius, ellipses_contour_pairs)
-
-	#get top 5 ellipses
-	ellipses_contour_pairs = sorted(ellipses_contour_pairs, key= lambda (e,c): -1*fit_error(e,c))[:5]
-
-	#extract ellipses from pairs
-	ellipses = map(lambda (e,c): e, ellipses_contour_pairs)
-
-	return ellipses
-
-def get_filled_binary(binary_img, kernel_size=3, iterations=3):
+def get_filled_binary(binary_img, kernel_size=3, iterations=3, out=None):
 	"""
 	Returns the image with opening and closing operations applied on it
 
@@ -167,16 +267,27 @@ def get_filled_binary(binary_img, kernel_size=3, iterations=3):
 		binary_img: and= image with only black and white pixels
 		kernel_size: size of kernel used for opening and closing, must be odd
 		iterations: number of times opening and closing are applied
+		out: optional preallocated image for the result, reused across frames; may be binary_img itself
 	Returns:
-		the image after opening and closing are applied
+		the image (out, if given) after opening and closing are applied
 	"""
-	kernel = np.ones((kernel_size,kernel_size),np.uint8)
+	kernel = get_kernel(kernel_size)
 
-	opened_img = cv2.morphologyEx(binary_img, cv2.MORPH_OPEN, kernel, iterations=iterations)
-	dilated_img = cv2.dilate(opened_img, kernel, iterations=iterations)
+	opened_img = cv2.morphologyEx(binary_img, cv2.MORPH_OPEN, kernel, dst=out, iterations=iterations)
+	dilated_img = cv2.dilate(opened_img, kernel, dst=opened_img, iterations=iterations)
 
 	return dilated_img
 
+kernels = {}
+
+def get_kernel(kernel_size):
+	"""
+	Returns square morphology kernel of ones, cached by size
+	"""
+	if kernel_size not in kernels:
+		kernels[kernel_size] = np.ones((kernel_size,kernel_size),np.uint8)
+	return kernels[kernel_size]
+
 # -----------------------------------------------------------
 # drawing methods
 # -----------------------------------------------------------
@@ -190,9 +301,7 @@ def get_contour_image(img,contours):
 	Returns:
 		copy of image with contours overlaid
 	"""
-	img_copy = img.copy()
-	cv2.drawContours(img_copy, contours, -1, (0,255,0))
-	return img_copy
+	return draw_contours(img.copy(), contours)
 
 def get_ellipse_image(img,ellipses):
 	"""
@@ -204,60 +313,760 @@ def get_ellipse_image(img,ellipses):
 	Returns:
 		copy of image with ellipses overlaid
 	"""
-	img_copy = img.copy()
+	return draw_ellipses(img.copy(), ellipses)
+
+def draw_contours(img,contours):
+	"""
+	Overlays contours on img in place; mutable version of get_contour_image
+
+	Args:
+		img: image to overlay contours on
+		contours: list of contours to overlay on image
+	Returns:
+		img, with contours overlaid
+	"""
+	if len(contours) > 0:
+		cv2.drawContours(img, contours, -1, (0,255,0))
+	return img
+
+def draw_ellipses(img,ellipses):
+	"""
+	Overlays ellipses on img in place; mutable version of get_ellipse_image
+
+	Args:
+		img: img to overlay ellipses on
+		ellipses: ellipses to be overlaid on image
+	Returns:
+		img, with ellipses overlaid
+	"""
 	for ellipse in ellipses:
-		cv2.ellipse(img_copy, ellipse, (0,255,0))
-	return img_copy
+		cv2.ellipse(img, ellipse, (0,255,0))
+	return img
+
+# -----------------------------------------------------------
+# in-place frame processing
+# -----------------------------------------------------------
+class FrameContext(object):
+	"""
+	Work buffers and morphology settings for running the detection chain in place on frames of one size
+
+	The buffers are allocated on the first frame (and again only if the frame size changes), so the chain
+	get_red -> get_thresholded_hsv -> get_filled_binary -> get_contours_binary -> drawing allocates no
+	images per frame. Results returned by its methods are overwritten by the next frame, and so is fit_errors,
+	the map of the ellipses get_ellipses last returned to their fit_error.
+
+	With a profiling.Profiler, get_ellipses records the time of every stage of the chain in it. With
+	pyramid_levels, get_ellipses searches a downscaled frame first (see detect_ellipses_pyramid), without
+	the buffers
+	"""
+	def __init__(self, kernel_size=3, iterations=3, lower_red_bounds=(0,2), upper_red_bounds=(170,180), profiler=None,
+			pyramid_levels=0):
+		self.kernel_size = kernel_size
+		self.iterations = iterations
+		self.lower_red_bounds = lower_red_bounds
+		self.upper_red_bounds = upper_red_bounds
+		self.profiler = profiler
+		self.pyramid_levels = pyramid_levels
+		self.shape = None
+		self.fit_errors = {}
+
+	def allocate(self, shape):
+		"""
+		Allocates the work buffers for frames of shape, unless they already have that shape
+		"""
+		if shape == self.shape: return
+		self.shape = shape
+		self.red = np.empty(shape, np.uint8)
+		self.hsv = np.empty(shape, np.uint8)
+		self.display = np.empty(shape, np.uint8)
+		self.mask = np.empty(shape[:2], np.uint8)
+		self.band = np.empty(shape[:2], np.uint8)
+		self.binary = np.empty(shape[:2], np.uint8)
+
+	def get_red(self, img):
+		"""
+		Returns the red part of img (see get_red), in the red buffer
+		"""
+		self.allocate(img.shape)
+		return get_red(img, self.lower_red_bounds, self.upper_red_bounds, self.red, self.mask, self.hsv, self.band)
+
+	def get_binary(self, red_img, fill=True):
+		"""
+		Returns thresholded (see get_thresholded_hsv) and optionally filled (see get_filled_binary) red_img, in the binary buffer
+		"""
+		self.allocate(red_img.shape)
+		binary_img = get_thresholded_hsv(red_img, self.binary)
+		if fill:
+			binary_img = get_filled_binary(binary_img, self.kernel_size, self.iterations, binary_img)
+		return binary_img
+
+	def get_contours(self, red_img, fill=True):
+		"""
+		Returns list of contours from red_img; same as get_contours_hsv
+		"""
+		return get_contours_binary(self.get_binary(red_img, fill))
+
+	def get_ellipses(self, frame, min_radius=0, fill=True):
+		"""
+		Returns list of ellipses on the red part of frame; same as get_ellipses_hsv(get_red(frame))
+		"""
+		profiler = self.profiler
+		self.fit_errors.clear()
+		if self.pyramid_levels > 0:
+			return detect_ellipses_pyramid(frame, self.pyramid_levels, min_radius, fill, self.kernel_size, self.iterations,
+				self.lower_red_bounds, self.upper_red_bounds, profiler=profiler, fit_errors=self.fit_errors)
+		if profiler is None:
+			return select_ellipses(self.get_contours(self.get_red(frame), fill), min_radius, fit_errors=self.fit_errors)
+
+		#the same chain, timing each stage: hsv conversion and hue masks, Otsu threshold, opening and closing, contours
+		start = default_timer()
+		red_img = self.get_red(frame)
+		start = profiler.lap('red', start)
+		binary_img = get_thresholded_hsv(red_img, self.binary)
+		start = profiler.lap('threshold', start)
+		if fill:
+			binary_img = get_filled_binary(binary_img, self.kernel_size, self.iterations, binary_img)
+			start = profiler.lap('morphology', start)
+		contours = get_contours_binary(binary_img)
+		profiler.lap('find_contours', start)
+		return select_ellipses(contours, min_radius, profiler, fit_errors=self.fit_errors)
+
+	def get_display_image(self, img, contours=(), ellipses=()):
+		"""
+		Returns img with contours and ellipses overlaid, drawn in the display buffer rather than a copy
+		"""
+		self.allocate(img.shape)
+		np.copyto(self.display, img)
+		draw_contours(self.display, contours)
+		return draw_ellipses(self.display, ellipses)
 
 # -----------------------------------------------------------
 # main algorithm for fingertip tracking
 # -----------------------------------------------------------
-def follow_ellipses(cap,draw_contours=False,draw_ellipses=False):
+def read_frames(cap):
 	"""
-	Tracking algorithm to follow red ellipses throughout video
+	Generator over the frames of a video
 
 	Args:
 		cap: cv2.VideoCapture object
-		draw_contours: whether or not to draw the contours on each frame
-		draw_ellipses: whether or not to draw the ellipses on each frame
 	Returns:
-		list of dictionaries that map ellipses to ids
+		iterator over the frames read from cap, until it runs out of frames
 	"""
-	current_ellipses = None
-	dictionaries = []
-
 	while cap.isOpened():
-		previous_ellipses = current_ellipses
-		
 		ret, frame = cap.read()
 		if ret != True: break
-		red_img = get_red(frame)
-		images = [red_img]
-
-		if draw_contours:
-			contours = get_contours_hsv(red_img)
-			contour_image = get_contours_hsv(red_img, contours)
-			images.append(contour_image)
-		if draw_ellipses:
-			current_ellipses = get_ellipses_hsv(red_img)
-			ellipse_image = get_ellipse_image(red_img, ellipses)
-			images.append(ellipse_image)
-		cv2.imshow("red circles", np.hstack(images))
-
-		#special behavior on first frame
-		if previous_ellipses is None:
-			current_dict = {}
-			counter = 0
+		yield frame
+
+def iterate_frames(source):
+	"""
+	Generator over the frames of a video, a list of images, or a directory of images
+
+	Args:
+		source: cv2.VideoCapture object, video filename, directory of image files (read in sorted order),
+			or iterable of images in bgr format
+	Returns:
+		iterator over the frames of source
+	"""
+	if isinstance(source, basestring):
+		if os.path.isdir(source):
+			for name in sorted(os.listdir(source)):
+				img = cv2.imread(os.path.join(source, name))
+				if img is not None:
+					yield img
+			return
+		cap = cv2.VideoCapture(source)
+		try:
+			for frame in read_frames(cap):
+				yield frame
+		finally:
+			cap.release()
+	elif hasattr(source, 'read') and hasattr(source, 'isOpened'):
+		for frame in read_frames(source):
+			yield frame
+	else:
+		for frame in source:
+			yield frame
+
+def detect_ellipses(frame,context=None,pyramid_levels=0):
+	"""
+	Returns the ellipses tracked on a frame: the ellipses found on its red part
+
+	Args:
+		frame: image in bgr format
+		context: optional FrameContext to run detection in, without allocating images
+		pyramid_levels: number of times the frame is halved for a coarse search first, see detect_ellipses_pyramid;
+			the context's setting is used instead if there is a context
+	Returns:
+		list of ellipses found in the frame
+	"""
+	if context is not None:
+		return context.get_ellipses(frame)
+	if pyramid_levels > 0:
+		return detect_ellipses_pyramid(frame,pyramid_levels)
+	return get_ellipses_hsv(get_red(frame))
+
+def next_ellipse_dict(current_dict,ellipses,max_displacement=None):
+	"""
+	Returns map of ellipses to ids for the next frame
+
+	Args:
+		current_dict: map of ellipses to ids on the previous frame, or None on the first frame
+		ellipses: ellipses found on the next frame
+		max_displacement: optional maximum distance between the centers of matched ellipses; pairs further
+			apart are pruned before any difference is computed (see ct.get_gated_correspondence)
+	Returns:
+		map of ellipses to ids, numbered from 0 on the first frame and matched to current_dict otherwise
+	"""
+	if current_dict is None:
+		return dict(zip(ellipses, range(len(ellipses))))
+	return ct.transition(current_dict,ellipses,ellipse_difference,ellipse_difference_matrix,
+		lambda e: e[0],max_displacement)
+
+def track_ellipses(source,processes=0,queue_size=8,consumer=None,motion_model=None,detection_interval=1,max_displacement=None,tracks=None,
+		profiler=None,pyramid_levels=0,context=None):
+	"""
+	Tracking algorithm to follow red ellipses throughout video, one frame at a time and without display
+
+	Only the current frame's map is kept, so memory does not grow with the length of the video
+
+	Args:
+		source: frames to track ellipses through, see iterate_frames
+		processes: number of detection processes (see detect_ellipses_parallel), 0 to detect in this thread
+		queue_size: maximum number of frames read ahead when detecting in processes
+		consumer: optional function called with (frame_index, frame, ellipse_dict) on every frame, e.g. show_tracking
+		motion_model: optional motion_model.EllipseKalmanFilter; new ellipses are then matched against the
+			predicted ellipses rather than those of the previous frame
+		detection_interval: detect ellipses on every detection_interval-th frame only; frames in between map
+			the motion model's predictions to ids, or repeat the last map without a motion model
+		max_displacement: optional maximum distance between the centers of matched ellipses, see next_ellipse_dict
+		tracks: optional tracks.TrackStore to keep the tracks in, rather than matching ellipse-keyed maps
+		profiler: optional profiling.Profiler to record the time of every stage in: the detection stages (see
+			FrameContext.get_ellipses) and reading the frames ('read') when detecting in this thread, or waiting
+			for the detection processes ('detection') otherwise, then 'correspondence' and 'consumer', with the
+			numbers of 'ellipses' detected and of 'candidate_pairs' of tracked and detected ellipses (before any gating)
+		pyramid_levels: number of times frames are halved to search for ellipses before refining them at full
+			resolution, 0 to search at full resolution; see detect_ellipses_pyramid
+		context: optional object whose get_ellipses(frame) detects ellipses on every frame, used instead of a
+			FrameContext, e.g. a temporal_segmentation.IncrementalSegmenter; it cannot be used in processes, and
+			its own settings take the place of pyramid_levels and of profiler (which must then be the context's
+			own profiler, if any)
+	Returns:
+		iterator over (frame index, dictionary that maps ellipses to ids)
+	"""
+	if context is not None:
+		if processes != 0:
+			raise ValueError("a detection context cannot be used when detecting in processes")
+		if pyramid_levels != 0:
+			raise ValueError("pyramid_levels cannot be used with a detection context, set them on the context")
+		if profiler is not None and getattr(context, 'profiler', None) is not profiler:
+			raise ValueError("profiler cannot be used with a detection context that does not record into it")
+	frames = iterate_frames(source)
+	if profiler is not None and processes == 0:
+		frames = profile_iterator(frames, profiler, 'read')
+	if processes == 0:
+		if context is None:
+			context = FrameContext(profiler=profiler, pyramid_levels=pyramid_levels)
+		detections = ((frame, detect_ellipses(frame,context) if i % detection_interval == 0 else None)
+			for i, frame in enumerate(frames))
+	else:
+		detector = functools.partial(detect_ellipses, pyramid_levels=pyramid_levels) if pyramid_levels > 0 else detect_ellipses
+		detections = detect_ellipses_parallel(frames,processes,queue_size,detection_interval,detector)
+
+	current_dict = None
+	if profiler is not None and processes != 0:
+		detections = profile_iterator(detections, profiler, 'detection')
+	for frame_index, (frame, current_ellipses) in enumerate(detections):
+		if profiler is not None:
+			start = default_timer()
 			if current_ellipses is not None:
-				for ellipse in current_ellipses:
-					current_dict[ellipse] = counter
-					counter += 1
+				tracked_count = len(tracks) if tracks is not None else len(current_dict or ())
+				profiler.count('ellipses', len(current_ellipses))
+				profiler.count('candidate_pairs', tracked_count*len(current_ellipses))
+		if tracks is not None:
+			current_dict = next_track_dict(tracks,frame_index,current_ellipses,motion_model,max_displacement)
 		else:
-			dictionaries.append(current_dict)
-			current_dict = ct.transition(current_dict,current_ellipses,ellipse_difference)
+			current_dict = next_predicted_ellipse_dict(current_dict,current_ellipses,motion_model,max_displacement)
+		if profiler is not None:
+			start = profiler.lap('correspondence', start)
+		if consumer is not None:
+			consumer(frame_index, frame, current_dict)
+			if profiler is not None:
+				profiler.lap('consumer', start)
+		if profiler is not None:
+			profiler.end_frame()
+		yield frame_index, current_dict
+
+def profile_iterator(iterator, profiler, stage):
+	"""
+	Generator over the items of iterator that records the time taken to get each item as a duration of stage
+
+	Args:
+		iterator: iterator, e.g. over the frames of a video
+		profiler: profiling.Profiler to record the time in
+		stage: name of the stage
+	Returns:
+		iterator over the same items
+	"""
+	iterator = iter(iterator)
+	while True:
+		start = default_timer()
+		try:
+			item = next(iterator)
+		except StopIteration:
+			return
+		profiler.lap(stage, start)
+		yield item
+
+def get_tracking_image(frame,ellipse_dict,draw_contours=False,draw_ellipses=False):
+	"""
+	Returns the red part of frame, next to copies with its contours and tracked ellipses drawn on
+
+	Args:
+		frame: image in bgr format
+		ellipse_dict: map of ellipses to ids on frame
+		draw_contours: whether or not to add a copy with the contours drawn on
+		draw_ellipses: whether or not to add a copy with the ellipses and their ids drawn on
+	Returns:
+		the images side by side
+	"""
+	red_img = get_red(frame)
+	images = [red_img]
+
+	if draw_contours:
+		contours = get_contours_hsv(red_img)
+		contour_image = get_contour_image(red_img, contours)
+		images.append(contour_image)
+	if draw_ellipses:
+		ellipse_image = get_ellipse_image(red_img, ellipse_dict.keys())
+		for ellipse, ellipse_id in ellipse_dict.items():
+			center = tuple(int(x) for x in ellipse[0])
+			cv2.putText(ellipse_image, str(ellipse_id), center, cv2.FONT_HERSHEY_SIMPLEX, .5, (255,255,255))
+		images.append(ellipse_image)
+	return np.hstack(images)
+
+def show_tracking(frame_index,frame,ellipse_dict,draw_contours=False,draw_ellipses=False,window_name="red circles"):
+	"""
+	Shows the tracking image of a frame (see get_tracking_image); a consumer for track_ellipses
+	"""
+	cv2.imshow(window_name, get_tracking_image(frame,ellipse_dict,draw_contours,draw_ellipses))
+
+def next_predicted_ellipse_dict(current_dict,ellipses,motion_model=None,max_displacement=None):
+	"""
+	Returns map of ellipses to ids for the next frame, predicting the tracked ellipses with a motion model
+
+	Args:
+		current_dict: map of ellipses to ids on the previous frame, or None on the first frame
+		ellipses: ellipses found on the next frame, or None if ellipses were not detected on it
+		motion_model: optional motion_model.EllipseKalmanFilter tracking the ellipses of current_dict
+		max_displacement: optional maximum distance between the centers of matched ellipses, see next_ellipse_dict
+	Returns:
+		map of ellipses to ids, see next_ellipse_dict; ellipses are matched against the motion model's
+		predictions, and if they were not detected the predictions themselves are returned
+	"""
+	if motion_model is not None and current_dict is not None:
+		current_dict = motion_model.predict()
+	if ellipses is None:
+		return current_dict
+	current_dict = next_ellipse_dict(current_dict,ellipses,max_displacement)
+	if motion_model is not None:
+		motion_model.update(current_dict)
+	return current_dict
+
+def next_track_dict(tracks,frame_index,ellipses,motion_model=None,max_displacement=None):
+	"""
+	Steps a track store to the next frame; track store version of next_predicted_ellipse_dict
 
+	Args:
+		tracks: tracks.TrackStore of the ellipses tracked so far
+		frame_index: index of the next frame
+		ellipses: ellipses found on the next frame, or None if ellipses were not detected on it
+		motion_model: optional motion_model.EllipseKalmanFilter tracking the same ids as tracks
+		max_displacement: optional maximum distance between the centers of matched ellipses, see next_ellipse_dict
+	Returns:
+		map of the ellipses of the confirmed tracks seen on the next frame to their ids, or of all confirmed
+		tracks if ellipses were not detected on it
+	"""
+	if motion_model is not None and len(tracks) > 0:
+		predicted_dict = motion_model.predict()
+		tracks.set_ellipses(predicted_dict.values(), predicted_dict.keys())
+	if ellipses is None:
+		return tracks.as_dict((CONFIRMED,))
+	current_dict = tracks.step(ellipses,frame_index,max_displacement)
+	if motion_model is not None:
+		#every live track not seen on this frame keeps its motion, tentative ones too
+		alive_rows = tracks.get_alive_rows()
+		unseen_rows = alive_rows[tracks.last_seen[alive_rows] != frame_index]
+		motion_model.update(tracks.as_dict(frame_index=frame_index), tracks.ids[unseen_rows])
+	return current_dict
+
+def follow_ellipses(cap,draw_contours=False,draw_ellipses=False,profiler=None):
+	"""
+	Tracking algorithm to follow red ellipses throughout video, showing each frame until q is pressed
+
+	Args:
+		cap: cv2.VideoCapture object
+		draw_contours: whether or not to draw the contours on each frame
+		draw_ellipses: whether or not to draw the ellipses on each frame
+		profiler: optional profiling.Profiler to record the time of every stage in, see track_ellipses; the
+			display is recorded as the 'consumer' stage
+	Returns:
+		list of dictionaries that map ellipses to ids, one per frame
+	"""
+	def show(frame_index, frame, ellipse_dict):
+		show_tracking(frame_index, frame, ellipse_dict, draw_contours, draw_ellipses)
+
+	dictionaries = []
+	for frame_index, current_dict in track_ellipses(cap,consumer=show,profiler=profiler):
+		dictionaries.append(current_dict)
 		if cv2.waitKey(1) & 0xFF == ord('q'):
 			break
 
+	cap.release()
+	return dictionaries
+
+# -----------------------------------------------------------
+# region of interest tracking
+# -----------------------------------------------------------
+def get_search_windows(ellipses,shape,margins=20):
+	"""
+	Returns the windows of a frame to search for ellipses in, around where they were last seen
+
+	Args:
+		ellipses: list of ellipses to search around
+		shape: shape of the frame
+		margins: padding around each ellipse's bounding circle, either one number or one per ellipse
+	Returns:
+		list of non-overlapping windows (x0,y0,x1,y1) covering the padded ellipses, clipped to the frame
+	"""
+	height, width = shape[:2]
+	margins = np.broadcast_to(margins, (len(ellipses),))
+	windows = []
+	for ellipse, margin in zip(ellipses, margins):
+		(cx,cy), axes, angle = ellipse
+		radius = max(axes)/2. + margin
+		x0, y0 = max(int(cx-radius), 0), max(int(cy-radius), 0)
+		x1, y1 = min(int(np.ceil(cx+radius)), width), min(int(np.ceil(cy+radius)), height)
+		if x0 < x1 and y0 < y1:
+			windows.append((x0,y0,x1,y1))
+	return merge_windows(windows)
+
+def merge_windows(windows):
+	"""
+	Returns windows with every overlapping pair replaced by their bounding window, until none overlap
+
+	Args:
+		windows: list of windows (x0,y0,x1,y1)
+	Returns:
+		list of non-overlapping windows covering the same pixels
+	"""
+	windows = list(windows)
+	merged = True
+	while merged:
+		merged = False
+		for i in range(len(windows)):
+			for j in range(i+1, len(windows)):
+				a, b = windows[i], windows[j]
+				if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+					windows[i] = (min(a[0],b[0]), min(a[1],b[1]), max(a[2],b[2]), max(a[3],b[3]))
+					del windows[j]
+					merged = True
+					break
+			if merged: break
+	return windows
+
+def detect_ellipses_in_windows(frame,windows,min_radius=0,fill=True):
+	"""
+	Returns the ellipses found on the red part of frame, looking only inside windows
+
+	Args:
+		frame: image in bgr format
+		windows: list of non-overlapping windows (x0,y0,x1,y1) to search
+		min_radius: minimum radius of ellipse to consider
+		fill: whether or not to first apply dilation and erosion before getting contours
+	Returns:
+		list of ellipses found in the windows, in frame coordinates, selected as in get_ellipses_hsv
+	"""
+	return select_ellipses(get_contours_in_windows(frame,windows,fill),min_radius)
+
+def get_contours_in_windows(frame,windows,fill=True,kernel_size=3,iterations=3,lower_red_bounds=(0,2),upper_red_bounds=(170,180)):
+	"""
+	Returns list of the contours of the red part of frame inside windows, in frame coordinates
+
+	Contours touching an edge of their window inside the frame are left out: they are cut by the window, or are
+	the window's edge itself, around the background (white after get_thresholded_hsv)
+
+	Args:
+		frame: image in bgr format
+		windows: list of non-overlapping windows (x0,y0,x1,y1) to search
+		fill: whether or not to first apply dilation and erosion before getting contours
+		kernel_size: size of kernel used for opening and closing, see get_filled_binary
+		iterations: number of times opening and closing are applied
+		lower_red_bounds: hue range of the red band at the start of the hue circle, see get_red
+		upper_red_bounds: hue range of the red band at the end of the hue circle
+	Returns:
+		list of contours found in the windows (via simple chain approximation)
+	"""
+	height, width = frame.shape[:2]
+	contours = []
+	for x0,y0,x1,y1 in windows:
+		red_img = get_red(np.ascontiguousarray(frame[y0:y1,x0:x1]), lower_red_bounds, upper_red_bounds)
+		binary_img = get_thresholded_hsv(red_img)
+		if fill:
+			binary_img = get_filled_binary(binary_img, kernel_size, iterations, binary_img)
+		offset = np.array((x0,y0), np.int32)
+		for contour in get_contours_binary(binary_img):
+			x, y, w, h = cv2.boundingRect(contour)
+			if (x == 0 and x0 > 0) or (y == 0 and y0 > 0) or (x + w == x1 - x0 and x1 < width) or (y + h == y1 - y0 and y1 < height):
+				continue
+			contours.append(contour + offset)
+	return contours
+
+def get_speeds(previous_dict,current_dict):
+	"""
+	Returns how far each tracked ellipse's center moved between two frames
+
+	Args:
+		previous_dict: map of ellipses to ids on the previous frame
+		current_dict: map of ellipses to ids on the current frame
+	Returns:
+		map of ids in both frames to the displacement of their ellipse's center, in pixels
+	"""
+	previous_centers = dict((i, e[0]) for e, i in previous_dict.items() if e is not None)
+	speeds = {}
+	for ellipse, ellipse_id in current_dict.items():
+		if ellipse is not None and ellipse_id in previous_centers:
+			(x0,y0), (x1,y1) = previous_centers[ellipse_id], ellipse[0]
+			speeds[ellipse_id] = sqrt((x1-x0)**2 + (y1-y0)**2)
+	return speeds
+
+def track_ellipses_roi(source,margin=20,velocity_margin=0,rescan_interval=10,min_radius=0,fill=True,motion_model=None):
+	"""
+	Tracking algorithm to follow red ellipses throughout video, searching only around the tracked ellipses
+
+	Each frame is searched in windows around the ellipses of the previous frame. The whole frame is searched
+	on the first frame, every rescan_interval frames, and whenever the windows hold fewer ellipses than are
+	being tracked (a track was lost)
+
+	Args:
+		source: frames to track ellipses through, see iterate_frames
+		margin: padding in pixels around each ellipse's bounding circle
+		velocity_margin: extra padding per pixel that the ellipse moved on the previous frame
+		rescan_interval: number of frames between searches of the whole frame
+		min_radius: minimum radius of ellipse to consider
+		fill: whether or not to first apply dilation and erosion before getting contours
+		motion_model: optional motion_model.EllipseKalmanFilter; windows are then placed around the predicted
+			ellipses, and new ellipses matched against them
+	Returns:
+		iterator over (frame index, dictionary that maps ellipses to ids), as track_ellipses
+	"""
+	current_dict = None
+	speeds = {}
+
+	for frame_index, frame in enumerate(iterate_frames(source)):
+		previous_dict = current_dict
+		if motion_model is not None and current_dict is not None:
+			current_dict = motion_model.predict()
+
+		current_ellipses = None
+		tracked = [(e,i) for e,i in current_dict.items() if e is not None] if current_dict else []
+		if tracked and frame_index % rescan_interval != 0:
+			margins = [margin + velocity_margin*speeds.get(i, 0) for e,i in tracked]
+			windows = get_search_windows([e for e,i in tracked], frame.shape, margins)
+			current_ellipses = detect_ellipses_in_windows(frame,windows,min_radius,fill)
+			if len(current_ellipses) < len(tracked):
+				current_ellipses = None
+		if current_ellipses is None:
+			current_ellipses = get_ellipses_hsv(get_red(frame),min_radius,fill)
+
+		current_dict = next_ellipse_dict(current_dict,current_ellipses)
+		if motion_model is not None:
+			motion_model.update(current_dict)
+		if previous_dict is not None:
+			speeds = get_speeds(previous_dict,current_dict)
+		yield frame_index, current_dict
+
+# -----------------------------------------------------------
+# coarse-to-fine pyramid detection
+# -----------------------------------------------------------
+def get_pyramid_level(img,levels):
+	"""
+	Returns img downscaled by 2**levels, keeping every 2**levels-th pixel of every 2**levels-th row
+
+	Pixels are sampled rather than averaged, so that downscaling costs as little as what is done with the
+	downscaled image, and not as much as reading every pixel of img
+	"""
+	scale = 2**levels
+	return cv2.resize(img, (max(img.shape[1]//scale, 1), max(img.shape[0]//scale, 1)), interpolation=cv2.INTER_NEAREST)
+
+def scale_morphology(kernel_size,iterations,scale):
+	"""
+	Returns the kernel size and number of iterations that open and dilate about as far (see get_filled_binary)
+	on an image scaled by scale
+
+	Args:
+		kernel_size: size of kernel used for opening and closing, must be odd
+		iterations: number of times opening and closing are applied
+		scale: factor the image is scaled by, below 1 when downscaled
+	Returns:
+		kernel size (odd, at least 3) and number of iterations (at least 1)
+	"""
+	reach = (kernel_size//2)*iterations*scale
+	kernel_size = max(int(round(kernel_size*scale))//2*2 + 1, 3)
+	return kernel_size, max(int(round(reach/(kernel_size//2))), 1)
+
+def detect_ellipses_pyramid(frame,levels=1,min_radius=0,fill=True,kernel_size=3,iterations=3,lower_red_bounds=(0,2),
+		upper_red_bounds=(170,180),candidates=10,margin=None,profiler=None,fit_errors=None):
+	"""
+	Returns the ellipses found on the red part of frame, searching a downscaled frame first
+
+	The detection chain runs on the frame downscaled by 2**levels, with the morphology (see scale_morphology)
+	and min_radius scaled to match, to find up to candidates ellipses; the chain then runs again at full
+	resolution in windows around them only (see get_search_windows), where the final ellipses are fitted and
+	selected as in get_ellipses_hsv. The work thus grows with the area of the markers rather than of the frame,
+	but markers smaller than a few pixels of the downscaled frame are lost, and so are ellipses longer than the
+	frame, which get_ellipses_hsv may return when it finds too few markers
+
+	Args:
+		frame: image in bgr format
+		levels: number of times the frame is halved for the coarse search
+		min_radius: minimum radius of ellipse to consider, in full resolution pixels
+		fill: whether or not to first apply dilation and erosion before getting contours
+		kernel_size: size of kernel used for opening and closing at full resolution, see get_filled_binary
+		iterations: number of times opening and closing are applied at full resolution
+		lower_red_bounds: hue range of the red band at the start of the hue circle, see get_red
+		upper_red_bounds: hue range of the red band at the end of the hue circle
+		candidates: number of ellipses kept from the coarse search
+		margin: padding in full resolution pixels around each candidate's bounding circle; by default two
+			downscaled pixels plus twice the reach of the morphology
+		profiler: optional profiling.Profiler to record the 'coarse' and 'refine' stages in, besides those of
+			select_ellipses on the windows
+		fit_errors: optional map to add the fit_error of every ellipse returned to, see select_ellipses
+	Returns:
+		list of ellipses found in the frame, in full resolution coordinates
+	"""
+	if profiler is not None:
+		start = default_timer()
+	scale = 2**levels
+	small_img = get_pyramid_level(frame, levels)
+	binary_img = get_thresholded_hsv(get_red(small_img, lower_red_bounds, upper_red_bounds))
+	if fill:
+		small_kernel_size, small_iterations = scale_morphology(kernel_size, iterations, 1./scale)
+		binary_img = get_filled_binary(binary_img, small_kernel_size, small_iterations, binary_img)
+	coarse_ellipses = select_ellipses(get_contours_binary(binary_img), float(min_radius)/scale, count=candidates)
+	#ellipses longer than the frame (fitted to its border) would take the whole frame to refine
+	coarse_ellipses = [e for e in coarse_ellipses if max(e[1]) <= max(small_img.shape[:2])]
+	if profiler is not None:
+		start = profiler.lap('coarse', start)
+	if not coarse_ellipses:
+		return []
+
+	#pixel i of the downscaled frame is pixel i*scale of the frame
+	ellipses = [((cx*scale, cy*scale), (a0*scale, a1*scale), angle)
+		for (cx,cy), (a0,a1), angle in coarse_ellipses]
+	if margin is None:
+		#the morphology shrinks the candidates, and a window cutting through an ellipse loses it
+		margin = 2*scale + 2*(kernel_size//2)*iterations
+	windows = get_search_windows(ellipses, frame.shape, margin)
+	contours = get_contours_in_windows(frame, windows, fill, kernel_size, iterations, lower_red_bounds, upper_red_bounds)
+	if profiler is not None:
+		profiler.lap('refine', start)
+	return select_ellipses(contours, min_radius, profiler, fit_errors=fit_errors)
+
+# -----------------------------------------------------------
+# multi-core frame pipeline
+# -----------------------------------------------------------
+#seconds detect_ellipses_parallel waits for its reader thread to stop
+READER_TIMEOUT = 5.
+
+def detect_ellipses_parallel(frames,processes=None,queue_size=8,detection_interval=1,detector=detect_ellipses):
+	"""
+	Generator over every frame paired with its detect_ellipses, with detection spread over a pool of processes
+
+	A reader thread pulls frames into a bounded queue, and at most queue_size frames are being detected
+	at once, so a slow consumer holds back the reader rather than piling up frames in memory
+
+	Args:
+		frames: iterable of images in bgr format
+		processes: number of detection processes, defaults to the number of cores
+		queue_size: maximum number of frames read ahead and maximum number of frames being detected
+		detection_interval: detect ellipses on every detection_interval-th frame only, pairing other frames with None
+		detector: picklable function from a frame to the list of ellipses found in it, used instead of detect_ellipses
+	Returns:
+		iterator over (frame, list of ellipses found in the frame), in frame order; an exception raised by frames is
+		raised again after the frames read before it
+	"""
+	frame_queue = Queue.Queue(maxsize=queue_size)
+	stopped = threading.Event()
+	#holds the exception info of the reader, if frames raised
+	end_of_frames = [None]
+
+	def put(item):
+		while not stopped.is_set():
+			try:
+				frame_queue.put(item, timeout=.1)
+				return True
+			except Queue.Full:
+				pass
+		return False
+
+	def read():
+		try:
+			for frame in frames:
+				if not put(frame): return
+		except Exception:
+			end_of_frames[0] = sys.exc_info()
+		finally:
+			put(end_of_frames)
+
+	#the workers are forked before the reader starts, so none is forked while the reader holds a lock (of the
+	#queue, malloc or the video decoder)
+	pool = multiprocessing.Pool(processes)
+	reader = threading.Thread(target=read)
+	reader.daemon = True
+	pending = deque()
+	try:
+		reader.start()
+		frame_index = 0
+		while True:
+			frame = frame_queue.get()
+			if frame is end_of_frames: break
+			if frame_index % detection_interval == 0:
+				pending.append((frame, pool.apply_async(detector, (frame,))))
+			else:
+				pending.append((frame, None))
+			frame_index += 1
+			if len(pending) >= queue_size:
+				frame, result = pending.popleft()
+				yield frame, None if result is None else result.get()
+		while pending:
+			frame, result = pending.popleft()
+			yield frame, None if result is None else result.get()
+		pool.close()
+		if end_of_frames[0] is not None:
+			exc_type, exc_value, exc_traceback = end_of_frames[0]
+			raise exc_type, exc_value, exc_traceback
+	finally:
+		stopped.set()
+		pool.terminate()
+		pool.join()
+		#the reader stops at its next frame, before the caller releases what it reads from
+		if reader.is_alive():
+			reader.join(READER_TIMEOUT)
+
+def follow_ellipses_parallel(cap,processes=None,queue_size=8):
+	"""
+	Tracking algorithm to follow red ellipses throughout video, detecting ellipses on several frames at once
+
+	Frames are read in one thread, detected in a pool of processes, and passed through transition in
+	frame order, so the result is the same as follow_ellipses (without drawing)
+
+	Args:
+		cap: cv2.VideoCapture object
+		processes: number of detection processes, defaults to the number of cores
+		queue_size: maximum number of frames read ahead and maximum number of frames being detected
+	Returns:
+		list of dictionaries that map ellipses to ids, one per frame
+	"""
+	dictionaries = [current_dict for frame_index, current_dict in track_ellipses(cap,processes,queue_size)]
 	cap.release()
 	return dictionaries
\ No newline at end of file
@@ -1,11 +1,259 @@
 import unittest
+import threading
+import time
+import os
+import shutil
+import tempfile
 from math import tanh
 import numpy as np
 import cv2
 import fingertip_tracking
+import motion_model
 
 class Fingertip_Tracking_Test(unittest.TestCase):
-	
+	def setUp(self):
+		self.frames = []
+		for i in range(12):
+			frame = np.zeros((120,160,3), np.uint8)
+			frame[:] = (40,120,40)
+			cv2.ellipse(frame, ((30+2*i,40),(24,14),10*i), (0,0,255), -1)
+			cv2.ellipse(frame, ((110-3*i,80+i),(18,26),0), (0,0,255), -1)
+			self.frames.append(frame)
+
+	def get_red_two_masks(self, img):
+		img_hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+		mask = fingertip_tracking.hsv_mask(img_hsv, 0, 2) | fingertip_tracking.hsv_mask(img_hsv, 170, 180)
+		return mask, cv2.bitwise_and(img, img, mask=mask)
+
+	def test_get_red_matches_two_masks(self):
+		rng = np.random.RandomState(0)
+		img = rng.randint(0, 256, (60,80,3)).astype(np.uint8)
+		expected_mask, expected_red = self.get_red_two_masks(img)
+		self.assertTrue(expected_mask.any())
+		np.testing.assert_array_equal(expected_mask, fingertip_tracking.get_red_mask(img))
+		np.testing.assert_array_equal(expected_red, fingertip_tracking.get_red(img))
+
+	def test_get_red_reuses_buffers(self):
+		rng = np.random.RandomState(1)
+		out = np.empty((60,80,3), np.uint8)
+		mask_out = np.empty((60,80), np.uint8)
+		hsv_out = np.empty((60,80,3), np.uint8)
+		band_out = np.empty((60,80), np.uint8)
+		for i in range(3):
+			img = rng.randint(0, 256, (60,80,3)).astype(np.uint8)
+			expected_mask, expected_red = self.get_red_two_masks(img)
+			actual_red = fingertip_tracking.get_red(img, out=out, mask_out=mask_out, hsv_out=hsv_out, band_out=band_out)
+			self.assertTrue(actual_red is out)
+			np.testing.assert_array_equal(expected_mask, mask_out)
+			np.testing.assert_array_equal(expected_red, actual_red)
+
+	def test_frame_context_matches_functional_api(self):
+		context = fingertip_tracking.FrameContext()
+		for frame in self.frames[:3]:
+			red_img = fingertip_tracking.get_red(frame)
+			np.testing.assert_array_equal(red_img, context.get_red(frame))
+			expected_binary = fingertip_tracking.get_filled_binary(fingertip_tracking.get_thresholded_hsv(red_img))
+			np.testing.assert_array_equal(expected_binary, context.get_binary(red_img))
+			self.assertEqual(fingertip_tracking.get_ellipses_hsv(red_img), context.get_ellipses(frame))
+
+	def test_frame_context_reuses_buffers(self):
+		context = fingertip_tracking.FrameContext()
+		red_img = context.get_red(self.frames[0])
+		binary_img = context.get_binary(red_img)
+		contours = context.get_contours(red_img)
+		ellipses = context.get_ellipses(self.frames[1])
+		display_img = context.get_display_image(self.frames[1], contours, ellipses)
+		self.assertTrue(context.get_red(self.frames[2]) is red_img)
+		self.assertTrue(context.get_binary(red_img) is binary_img)
+		self.assertTrue(context.get_display_image(self.frames[2]) is display_img)
+		np.testing.assert_array_equal(self.frames[2], display_img)
+
+	def test_draw_ellipses_matches_get_ellipse_image(self):
+		ellipses = fingertip_tracking.detect_ellipses(self.frames[0])
+		expected_img = fingertip_tracking.get_ellipse_image(self.frames[0], ellipses)
+		img = self.frames[0].copy()
+		self.assertTrue(fingertip_tracking.draw_ellipses(img, ellipses) is img)
+		np.testing.assert_array_equal(expected_img, img)
+
+	def test_get_search_windows_merges_overlapping(self):
+		ellipses = [((10,10),(8,8),0), ((15,12),(8,8),0), ((100,100),(8,8),0)]
+		actual_windows = fingertip_tracking.get_search_windows(ellipses, (120,160,3), 5)
+		self.assertEqual([(1,1,24,21),(91,91,109,109)], actual_windows)
+
+	def test_track_ellipses_roi_matches_full_frame(self):
+		expected_results = list(fingertip_tracking.track_ellipses(self.frames))
+		actual_results = list(fingertip_tracking.track_ellipses_roi(self.frames, margin=10, velocity_margin=1, rescan_interval=5))
+		self.assertEqual(expected_results, actual_results)
+
+	def test_track_ellipses_roi_rescans_lost_track(self):
+		jumped_frame = np.zeros((120,160,3), np.uint8)
+		jumped_frame[:] = (40,120,40)
+		cv2.ellipse(jumped_frame, ((36,40),(24,14),30), (0,0,255), -1)
+		cv2.ellipse(jumped_frame, ((130,20),(18,26),0), (0,0,255), -1)
+		frames = self.frames[:3] + [jumped_frame]
+		results = list(fingertip_tracking.track_ellipses_roi(frames, margin=10, rescan_interval=100))
+		self.assertEqual([0,1], sorted(results[3][1].values()))
+		self.assertTrue(all(e is not None for e in results[3][1]))
+
+	def test_detect_ellipses_pyramid_matches_full_resolution(self):
+		frames = [cv2.resize(frame, (640,480), interpolation=cv2.INTER_NEAREST) for frame in self.frames[::3]]
+		for levels in (1, 2, 3):
+			context = fingertip_tracking.FrameContext(pyramid_levels=levels)
+			for frame in frames:
+				expected_ellipses = fingertip_tracking.detect_ellipses(frame)
+				self.assertEqual(2, len(expected_ellipses))
+				self.assertEqual(sorted(expected_ellipses), sorted(fingertip_tracking.detect_ellipses_pyramid(frame, levels)))
+				self.assertEqual(sorted(expected_ellipses), sorted(context.get_ellipses(frame)))
+
+	def test_track_ellipses_pyramid_parallel_matches_serial(self):
+		frames = [cv2.resize(frame, (640,480), interpolation=cv2.INTER_NEAREST) for frame in self.frames[:4]]
+		expected_results = list(fingertip_tracking.track_ellipses(frames, pyramid_levels=2))
+		self.assertEqual(expected_results, list(fingertip_tracking.track_ellipses(frames, processes=2, pyramid_levels=2)))
+
+	def test_scale_morphology(self):
+		self.assertEqual((3,3), fingertip_tracking.scale_morphology(3, 3, 1))
+		self.assertEqual((3,2), fingertip_tracking.scale_morphology(3, 3, .5))
+		self.assertEqual((3,1), fingertip_tracking.scale_morphology(3, 3, .125))
+		self.assertEqual((5,2), fingertip_tracking.scale_morphology(7, 2, .5))
+
+	def test_get_contours_in_windows_leaves_out_window_edges(self):
+		frame = self.frames[0]
+		#around the first ellipse, and cutting through it
+		self.assertEqual(1, len(fingertip_tracking.get_contours_in_windows(frame, [(10,20,50,60)])))
+		self.assertEqual([], fingertip_tracking.get_contours_in_windows(frame, [(10,20,30,60)]))
+
+	def test_next_ellipse_dict_first_frame(self):
+		ellipses = fingertip_tracking.detect_ellipses(self.frames[0])
+		actual_dict = fingertip_tracking.next_ellipse_dict(None, ellipses)
+		self.assertEqual(range(len(ellipses)), sorted(actual_dict.values()))
+
+	def test_next_ellipse_dict_keeps_ids(self):
+		leftmost_ids = []
+		current_dict = None
+		for frame in self.frames:
+			current_dict = fingertip_tracking.next_ellipse_dict(current_dict, fingertip_tracking.detect_ellipses(frame))
+			self.assertEqual([0,1], sorted(current_dict.values()))
+			leftmost_ids.append(current_dict[min(current_dict, key=lambda e: e[0][0])])
+		self.assertEqual([leftmost_ids[0]]*len(self.frames), leftmost_ids)
+
+	def test_detect_ellipses_parallel_matches_serial(self):
+		expected_ellipses = map(fingertip_tracking.detect_ellipses, self.frames)
+		pairs = list(fingertip_tracking.detect_ellipses_parallel(self.frames, processes=2, queue_size=3))
+		self.assertEqual(expected_ellipses, [ellipses for frame, ellipses in pairs])
+		self.assertTrue(all(frame is expected_frame for (frame, ellipses), expected_frame in zip(pairs, self.frames)))
+
+	def test_detect_ellipses_parallel_raises_reader_errors(self):
+		def frames():
+			for frame in self.frames[:3]:
+				yield frame
+			raise IOError("unreadable frame")
+		pairs = []
+		with self.assertRaises(IOError):
+			for pair in fingertip_tracking.detect_ellipses_parallel(frames(), processes=2, queue_size=2):
+				pairs.append(pair)
+		self.assertEqual(map(fingertip_tracking.detect_ellipses, self.frames[:3]), [ellipses for frame, ellipses in pairs])
+		with self.assertRaises(IOError):
+			list(fingertip_tracking.track_ellipses(frames(), processes=2))
+
+	def test_detect_ellipses_parallel_stops_reader(self):
+		#frames slow to read, as from a camera: the reader is still reading when the consumer stops
+		def frames():
+			for frame in self.frames:
+				time.sleep(.5)
+				yield frame
+		thread_count = threading.active_count()
+		pairs = fingertip_tracking.detect_ellipses_parallel(frames(), processes=2, queue_size=2)
+		next(pairs)
+		pairs.close()
+		self.assertEqual(thread_count, threading.active_count())
+
+	def test_track_ellipses_parallel_matches_serial(self):
+		expected_results = list(fingertip_tracking.track_ellipses(self.frames))
+		actual_results = list(fingertip_tracking.track_ellipses(self.frames, processes=2, queue_size=3))
+		self.assertEqual(range(len(self.frames)), [frame_index for frame_index, ellipse_dict in expected_results])
+		self.assertEqual(expected_results, actual_results)
+
+	def test_track_ellipses_detection_interval_parallel_matches_serial(self):
+		expected_results = list(fingertip_tracking.track_ellipses(self.frames, motion_model=motion_model.EllipseKalmanFilter(), detection_interval=3))
+		actual_results = list(fingertip_tracking.track_ellipses(self.frames, processes=2, queue_size=3, motion_model=motion_model.EllipseKalmanFilter(), detection_interval=3))
+		self.assertEqual(expected_results, actual_results)
+		for frame_index, ellipse_dict in expected_results:
+			self.assertEqual([0,1], sorted(ellipse_dict.values()))
+
+	def test_track_ellipses_roi_motion_model(self):
+		results = list(fingertip_tracking.track_ellipses_roi(self.frames, margin=10, rescan_interval=100, motion_model=motion_model.EllipseKalmanFilter()))
+		expected_results = list(fingertip_tracking.track_ellipses(self.frames))
+		self.assertEqual([d for i,d in expected_results], [d for i,d in results])
+
+	def test_track_ellipses_directory_of_images(self):
+		directory = tempfile.mkdtemp()
+		try:
+			for i, frame in enumerate(self.frames):
+				cv2.imwrite(os.path.join(directory, "%03d.png" % i), frame)
+			expected_results = list(fingertip_tracking.track_ellipses(self.frames))
+			actual_results = list(fingertip_tracking.track_ellipses(directory))
+			self.assertEqual(expected_results, actual_results)
+		finally:
+			shutil.rmtree(directory)
+
+	def test_track_ellipses_consumer(self):
+		seen = []
+		def consumer(frame_index, frame, ellipse_dict):
+			seen.append((frame_index, ellipse_dict))
+			image = fingertip_tracking.get_tracking_image(frame, ellipse_dict, draw_contours=True, draw_ellipses=True)
+			self.assertEqual((frame.shape[0], 3*frame.shape[1], 3), image.shape)
+		results = list(fingertip_tracking.track_ellipses(self.frames, consumer=consumer))
+		self.assertEqual(results, seen)
+
+	def get_binary_with_clutter(self):
+		binary_img = np.zeros((200,300), np.uint8)
+		for i in range(6):
+			cv2.ellipse(binary_img, ((30+45*i,40),(30,20+4*i),15*i), 255, -1)
+		#worse fits: stars and a thin line
+		for i in range(5):
+			angles = np.linspace(0, 2*np.pi, 2*(5+i), endpoint=False)
+			radii = np.where(np.arange(len(angles)) % 2, 10, 25)
+			star = np.column_stack((40+55*i + radii*np.cos(angles), 120 + radii*np.sin(angles)))
+			cv2.fillPoly(binary_img, [np.round(star).astype(np.int32)], 255)
+		cv2.line(binary_img, (20,180), (280,185), 255, 1)
+		return binary_img
+
+	def test_get_ellipses_binary_keeps_best_fits(self):
+		binary_img = self.get_binary_with_clutter()
+		ellipses = fingertip_tracking.get_ellipses_binary(binary_img)
+		self.assertEqual(5, len(ellipses))
+		for (cx, cy), axes, angle in ellipses:
+			self.assertTrue(abs(cy - 40) < 1)
+
+	def test_select_ellipses_matches_sorting_every_fit_error(self):
+		contours = fingertip_tracking.get_contours_binary(self.get_binary_with_clutter())
+		#every contour is fitted by default, the line enclosing no area too
+		candidates = [contour for contour in contours if len(contour) > 4]
+		ellipses = map(cv2.fitEllipse, candidates)
+		errors = fingertip_tracking.fit_errors(ellipses, candidates)
+		for count in (1, 5, 20):
+			expected = [ellipses[i] for i in np.argsort(errors, kind='mergesort')[:count]]
+			self.assertEqual(expected, fingertip_tracking.select_ellipses(contours, count=count))
+		#the prefilter is opted in to
+		self.assertEqual(6, len(fingertip_tracking.select_ellipses(contours, count=20, min_circularity=.6)))
+
+	def test_select_ellipses_approximate_matches_exact(self):
+		contours = fingertip_tracking.get_contours_binary(self.get_binary_with_clutter())
+		for count in (1, 5, 20):
+			self.assertEqual(fingertip_tracking.select_ellipses(contours, count=count, min_circularity=0),
+				fingertip_tracking.select_ellipses(contours, count=count, min_circularity=0, approximate=True))
+
+	def test_prefilter_contours(self):
+		contours = fingertip_tracking.get_contours_binary(self.get_binary_with_clutter())
+		self.assertEqual(12, len(contours))
+		#the line encloses no area
+		kept = fingertip_tracking.prefilter_contours(contours, min_circularity=0)
+		self.assertEqual(11, len(kept))
+		for contour, area in kept:
+			self.assertEqual(cv2.contourArea(contour), area)
+		#the stars are not round enough, and only the largest ellipses are large enough
+		self.assertEqual(6, len(fingertip_tracking.prefilter_contours(contours, min_circularity=.6)))
+		self.assertEqual(2, len(fingertip_tracking.prefilter_contours(contours, min_radius=44, min_circularity=.6)))
 
 if __name__ == '__main__':
-	unittest.main()
\ No newline at end of file
+	unittest.main()
@@ -0,0 +1,101 @@
+import numpy as np
+from ellipse import standardize_ellipses, array_to_ellipses
+
+class EllipseKalmanFilter(object):
+	"""
+	Constant-velocity Kalman filter over the center, axes and angle of every tracked ellipse
+
+	Each of the five ellipse parameters of a track is filtered independently with a (position, velocity)
+	state, so the filter of all tracks is kept as arrays with one row per track and one column per
+	parameter, and predict/update are a handful of array operations however many tracks there are
+	"""
+	def __init__(self, process_noise=(1.,1.,.1,.1,1.), measurement_noise=(1.,1.,1.,1.,4.), initial_velocity_variance=100.):
+		"""
+		Args:
+			process_noise: variance of the acceleration of (center x, center y, major axis, minor axis, angle) per frame
+			measurement_noise: variance of the detected (center x, center y, major axis, minor axis, angle)
+			initial_velocity_variance: variance of the velocity of a new track
+		"""
+		self.process_noise = np.asarray(process_noise, dtype=float)
+		self.measurement_noise = np.asarray(measurement_noise, dtype=float)
+		self.initial_velocity_variance = initial_velocity_variance
+
+		self.ids = np.zeros(0, dtype=int)
+		self.positions = np.zeros((0,5))
+		self.velocities = np.zeros((0,5))
+		#covariance [[p00, p01], [p01, p11]] of (position, velocity) of every parameter of every track
+		self.p00 = np.zeros((0,5))
+		self.p01 = np.zeros((0,5))
+		self.p11 = np.zeros((0,5))
+
+	def predict(self, dt=1.):
+		"""
+		Advances every track by dt frames
+
+		Args:
+			dt: number of frames to advance
+		Returns:
+			map of predicted ellipses to ids
+		"""
+		q = self.process_noise
+		self.positions = self.positions + dt*self.velocities
+		self.positions[:,4] = np.mod(self.positions[:,4], 180)
+		self.positions[:,2:4] = np.maximum(self.positions[:,2:4], 1e-3)
+		self.p00 = self.p00 + 2*dt*self.p01 + dt**2*self.p11 + q*dt**3/3.
+		self.p01 = self.p01 + dt*self.p11 + q*dt**2/2.
+		self.p11 = self.p11 + q*dt
+		return self.get_ellipse_dict()
+
+	def update(self, ellipse_dict, coasting_ids=()):
+		"""
+		Corrects the tracks with the ellipses matched to them, starts tracks for new ids, and drops tracks
+		whose id is no longer in ellipse_dict or coasting_ids
+
+		Args:
+			ellipse_dict: map of detected ellipses to ids (None keys are ignored)
+			coasting_ids: ids of tracks that were not detected but are kept, on their prediction alone
+		"""
+		pairs = [(i,e) for e,i in ellipse_dict.items() if e is not None]
+		ids = np.array([i for i,e in pairs], dtype=int)
+		measurements = standardize_ellipses([e for i,e in pairs])
+
+		#match tracks to measurements by id
+		order = np.argsort(ids)
+		matched = np.in1d(self.ids, ids)
+		rows = order[np.searchsorted(ids[order], self.ids[matched])]
+		z = measurements[rows]
+
+		p00, p01, p11 = self.p00[matched], self.p01[matched], self.p11[matched]
+		innovation = z - self.positions[matched]
+		innovation[:,4] = np.mod(innovation[:,4] + 90, 180) - 90
+		s = p00 + self.measurement_noise
+		k0, k1 = p00/s, p01/s
+
+		positions = self.positions[matched] + k0*innovation
+		positions[:,4] = np.mod(positions[:,4], 180)
+		velocities = self.velocities[matched] + k1*innovation
+		p00, p01, p11 = (1-k0)*p00, (1-k0)*p01, p11 - k1*p01
+
+		#keep coasting tracks as predicted
+		coasting = np.in1d(self.ids, coasting_ids) & ~matched
+		positions = np.vstack((positions, self.positions[coasting]))
+		velocities = np.vstack((velocities, self.velocities[coasting]))
+		p00 = np.vstack((p00, self.p00[coasting]))
+		p01 = np.vstack((p01, self.p01[coasting]))
+		p11 = np.vstack((p11, self.p11[coasting]))
+
+		#start new tracks at rest, with velocity unknown
+		new = ~np.in1d(ids, self.ids)
+		new_count = np.count_nonzero(new)
+		self.ids = np.concatenate((self.ids[matched], self.ids[coasting], ids[new]))
+		self.positions = np.vstack((positions, measurements[new]))
+		self.velocities = np.vstack((velocities, np.zeros((new_count,5))))
+		self.p00 = np.vstack((p00, np.tile(self.measurement_noise, (new_count,1))))
+		self.p01 = np.vstack((p01, np.zeros((new_count,5))))
+		self.p11 = np.vstack((p11, np.full((new_count,5), self.initial_velocity_variance)))
+
+	def get_ellipse_dict(self):
+		"""
+		Returns map of the current estimate of every track's ellipse to its id
+		"""
+		return dict(zip(array_to_ellipses(self.positions), self.ids.tolist()))
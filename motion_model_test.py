@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+import fingertip_tracking
+import motion_model
+
+class Motion_Model_Test(unittest.TestCase):
+	def setUp(self):
+		self.kalman_filter = motion_model.EllipseKalmanFilter()
+
+	def moving_ellipses(self, t):
+		#three equal ellipses in a row, accelerating to the right
+		x = 2.*t**2
+		return [((100.+x+40*i, 50.+i), (20.,12.), 30.) for i in range(3)]
+
+	def test_predict_constant_velocity(self):
+		for t in range(10):
+			self.kalman_filter.predict()
+			self.kalman_filter.update({((10.+5*t, 20.-2*t), (30.,20.), 10.+t): 7})
+		predicted_dict = self.kalman_filter.predict()
+		(center, axes, angle), = predicted_dict.keys()
+		self.assertEqual([7], predicted_dict.values())
+		np.testing.assert_allclose((60.,0.), center, atol=.5)
+		np.testing.assert_allclose((30.,20.), axes, atol=.5)
+		self.assertAlmostEqual(20., angle, delta=.5)
+
+	def test_update_angle_wraps_around(self):
+		for t in range(10):
+			self.kalman_filter.predict()
+			self.kalman_filter.update({((0.,0.), (30.,20.), (170.+4*t) % 180): 0})
+		(center, axes, angle), = self.kalman_filter.predict().keys()
+		self.assertAlmostEqual((170.+40) % 180, angle, delta=1)
+
+	def test_update_adds_and_drops_tracks(self):
+		self.kalman_filter.update({((0.,0.),(10.,5.),0.): 1, ((5.,5.),(10.,5.),0.): 2})
+		self.kalman_filter.predict()
+		self.kalman_filter.update({((1.,1.),(10.,5.),0.): 2, ((9.,9.),(10.,5.),0.): 3, None: 1})
+		self.assertEqual([2,3], sorted(self.kalman_filter.ids.tolist()))
+		self.assertEqual([2,3], sorted(self.kalman_filter.get_ellipse_dict().values()))
+
+	def test_update_keeps_coasting_tracks(self):
+		self.kalman_filter.update({((0.,0.),(10.,5.),0.): 1, ((5.,5.),(10.,5.),0.): 2})
+		self.kalman_filter.predict()
+		self.kalman_filter.update({((1.,1.),(10.,5.),0.): 2}, coasting_ids=[1])
+		self.assertEqual([1,2], sorted(self.kalman_filter.ids.tolist()))
+		self.assertIn(((0.,0.),(10.,5.),0.), self.kalman_filter.get_ellipse_dict())
+
+	def test_tracking_fast_motion_keeps_ids(self):
+		current_dict = None
+		ids = []
+		for t in range(12):
+			ellipses = self.moving_ellipses(t)
+			current_dict = fingertip_tracking.next_predicted_ellipse_dict(current_dict, ellipses, self.kalman_filter)
+			ids.append([current_dict[e] for e in ellipses])
+		self.assertEqual([ids[0]]*12, ids)
+
+if __name__ == '__main__':
+	unittest.main()
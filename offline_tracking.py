@@ -0,0 +1,315 @@
+import os
+import cv2
+import numpy as np
+import multiprocessing
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+import correspondence_tracking as ct
+import fingertip_tracking as ft
+from ellipse import ellipses_to_array, array_to_ellipses, ellipse_difference_matrix
+from tracks import match_ellipses
+
+#columns of a detections array, one row per ellipse, sorted by frame
+FRAME, CENTER_X, CENTER_Y, AXIS_0, AXIS_1, ANGLE = range(6)
+
+#parameters of ellipse detection, see ft.FrameContext and ft.get_ellipses_hsv
+DETECTION_PARAMETERS = {
+	'min_radius': 0,
+	'fill': True,
+	'lower_red_bounds': (0,2),
+	'upper_red_bounds': (170,180),
+	'kernel_size': 3,
+	'iterations': 3,
+	'pyramid_levels': 0,
+}
+
+def get_detection_parameters(parameters=None):
+	"""
+	Returns DETECTION_PARAMETERS updated with parameters
+	"""
+	parameters = dict(parameters or {})
+	unknown = set(parameters) - set(DETECTION_PARAMETERS)
+	if unknown:
+		raise ValueError("unknown detection parameters: %s" % ", ".join(sorted(unknown)))
+	return dict(DETECTION_PARAMETERS, **parameters)
+
+class Detector(object):
+	"""
+	Detects ellipses on frames with the given detection parameters, in a ft.FrameContext of its own; can be
+	sent to worker processes, which then allocate their own context
+	"""
+	def __init__(self, parameters=None):
+		self.parameters = get_detection_parameters(parameters)
+		self.context = None
+
+	def __call__(self, frame):
+		if self.context is None:
+			p = self.parameters
+			self.context = ft.FrameContext(p['kernel_size'], p['iterations'], p['lower_red_bounds'], p['upper_red_bounds'],
+				pyramid_levels=p['pyramid_levels'])
+		return self.context.get_ellipses(frame, self.parameters['min_radius'], self.parameters['fill'])
+
+	def __getstate__(self):
+		return {'parameters': self.parameters, 'context': None}
+
+def get_detection_rows(frame_index, ellipses):
+	"""
+	Returns the rows of a detections array for the ellipses found on frame frame_index
+	"""
+	ellipses = ellipses_to_array(ellipses)
+	return np.column_stack((np.full(len(ellipses), frame_index, dtype=float), ellipses))
+
+def detect_chunk(args):
+	"""
+	Detects ellipses on frames start to stop (or the end of the video if stop is None) of a video file
+
+	Args:
+		args: (video filename, start, stop, detection parameters), packed for Pool.imap
+	Returns:
+		detections array of the chunk, and number of frames read
+	"""
+	filename, start, stop, parameters = args
+	cap = cv2.VideoCapture(filename)
+	cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+	detector = Detector(parameters)
+	rows = [np.zeros((0,6))]
+	frame_index = start
+	try:
+		while stop is None or frame_index < stop:
+			ret, frame = cap.read()
+			if not ret: break
+			rows.append(get_detection_rows(frame_index, detector(frame)))
+			frame_index += 1
+	finally:
+		cap.release()
+	return np.vstack(rows), frame_index - start
+
+def detect_all(source, processes=None, chunk_size=256, parameters=None):
+	"""
+	Detects ellipses on every frame of a recording, in parallel
+
+	A video file is cut into chunks of frames that worker processes seek to and decode themselves, so frames
+	never pass between processes; other sources are decoded here and detected with ft.detect_ellipses_parallel
+
+	Args:
+		source: video filename, directory of images or iterable of images (see ft.iterate_frames)
+		processes: number of detection processes, defaults to the number of cores; 0 to detect in this process
+		chunk_size: number of frames per chunk of a video file
+		parameters: optional map of detection parameters to values, see DETECTION_PARAMETERS
+	Returns:
+		detections array: one row (frame index, center x, center y, axis 0, axis 1, angle) per ellipse, sorted by frame
+	"""
+	return detect_frames(source, processes, chunk_size, parameters)[0]
+
+def detect_frames(source, processes=None, chunk_size=256, parameters=None):
+	"""
+	Detects ellipses on every frame of a recording, in parallel; see detect_all
+
+	Returns:
+		detections array, and number of frames in the recording
+	"""
+	detector = Detector(parameters)
+	frame_count = 0
+	if isinstance(source, basestring) and not os.path.isdir(source):
+		cap = cv2.VideoCapture(source)
+		frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+		cap.release()
+
+	if processes == 0:
+		rows = [get_detection_rows(i, detector(frame)) for i, frame in enumerate(ft.iterate_frames(source))]
+		frame_count = len(rows)
+	elif frame_count > 0:
+		#the last chunk reads to the end, in case the frame count of the container is off
+		starts = range(0, frame_count, chunk_size)
+		chunks = [(source, start, start + chunk_size, parameters) for start in starts[:-1]] + [(source, starts[-1], None, parameters)]
+		pool = multiprocessing.Pool(processes)
+		try:
+			results = pool.map(detect_chunk, chunks)
+			pool.close()
+		finally:
+			pool.terminate()
+			pool.join()
+		rows = [chunk_rows for chunk_rows, chunk_frame_count in results]
+		frame_count = starts[-1] + results[-1][1]
+	else:
+		detections = ft.detect_ellipses_parallel(ft.iterate_frames(source), processes, detector=detector)
+		rows = [get_detection_rows(i, ellipses) for i, (frame, ellipses) in enumerate(detections)]
+		frame_count = len(rows)
+	return np.vstack([np.zeros((0,6))] + rows), frame_count
+
+def get_frame_offsets(detections, frame_count=None, first_frame=0):
+	"""
+	Returns array of frame_count+1 offsets, where the detections of frame first_frame+i are
+	detections[offsets[i]:offsets[i+1]]; frame_count defaults to the frames up to the last detection
+	"""
+	if frame_count is None:
+		frame_count = int(detections[-1,FRAME]) + 1 - first_frame if len(detections) else 0
+	return np.searchsorted(detections[:,FRAME], np.arange(first_frame, first_frame + frame_count + 1))
+
+def link_chunk(args):
+	"""
+	Links the detections of every frame of a chunk to those of the next frame
+
+	Args:
+		args: (detections of consecutive frames, row of the first of them, max_displacement), packed for Pool.imap
+	Returns:
+		array of pairs of rows (in the full detections array) of linked detections
+	"""
+	detections, row_offset, max_displacement = args
+	links = [np.zeros((0,2), dtype=int)]
+	if len(detections) == 0:
+		return links[0]
+	offsets = get_frame_offsets(detections, first_frame=int(detections[0,FRAME]))
+	for start, middle, stop in zip(offsets[:-2], offsets[1:-1], offsets[2:]):
+		if start == middle or middle == stop: continue
+		rows1, rows2 = match_ellipses(detections[start:middle,1:], detections[middle:stop,1:], max_displacement)
+		links.append(np.column_stack((rows1 + start, rows2 + middle)) + row_offset)
+	return np.vstack(links)
+
+def link_frames(detections, max_displacement=None, processes=None, chunk_size=256):
+	"""
+	Links the detections of every frame to those of the next frame, as ct.transition matches them, in parallel
+
+	Args:
+		detections: detections array (see detect_all)
+		max_displacement: optional maximum distance between the centers of linked ellipses
+		processes: number of processes, defaults to the number of cores; 0 to link in this process
+		chunk_size: number of frames per chunk
+	Returns:
+		array of pairs of rows of linked detections
+	"""
+	offsets = get_frame_offsets(detections)
+	#chunks overlap by one frame, so that the links between chunks are made
+	chunks = [(detections[offsets[start]:offsets[min(start + chunk_size + 1, len(offsets) - 1)]], offsets[start], max_displacement)
+		for start in range(0, len(offsets) - 1, chunk_size)]
+	if processes == 0:
+		links = map(link_chunk, chunks)
+	else:
+		pool = multiprocessing.Pool(processes)
+		try:
+			links = pool.map(link_chunk, chunks)
+			pool.close()
+		finally:
+			pool.terminate()
+			pool.join()
+	return np.vstack([np.zeros((0,2), dtype=int)] + links)
+
+def get_labels(links, count):
+	"""
+	Returns the number of chains of linked rows and array of the chain of each of count rows, numbered in order
+	of their first row
+	"""
+	if count == 0:
+		return 0, np.zeros(0, dtype=int)
+	graph = coo_matrix((np.ones(len(links)), (links[:,0], links[:,1])), shape=(count,count))
+	chain_count, labels = connected_components(graph, directed=False)
+	#renumber chains by their first row, which is the order they start in
+	first_rows = np.full(chain_count, count, dtype=int)
+	np.minimum.at(first_rows, labels, np.arange(count))
+	order = np.empty(chain_count, dtype=int)
+	order[np.argsort(first_rows, kind='mergesort')] = np.arange(chain_count)
+	return chain_count, order[labels]
+
+def close_gaps(detections, links, max_displacement=50, max_gap=5):
+	"""
+	Links the ends of chains of frame to frame links to the starts of later chains, for tracks that dropped out
+	of a few frames, solving one assignment problem over the whole recording
+
+	An end may be linked to a start 2 to max_gap+1 frames later and within max_displacement per frame of it;
+	candidates are found with a kd-tree over (x, y, frame), and every connected group of candidates is solved
+	on its own (see ct.get_gated_correspondence)
+
+	Args:
+		detections: detections array (see detect_all)
+		links: array of pairs of rows of linked detections (see link_frames)
+		max_displacement: maximum distance per frame between the centers of linked ellipses
+		max_gap: maximum number of frames without a detection between linked chains
+	Returns:
+		array of pairs of rows of the chain ends and starts linked
+	"""
+	chain_count, labels = get_labels(links, len(detections))
+	if chain_count < 2:
+		return np.zeros((0,2), dtype=int)
+	ends = np.zeros(chain_count, dtype=int)
+	np.maximum.at(ends, labels, np.arange(len(detections)))
+	starts = np.full(chain_count, len(detections), dtype=int)
+	np.minimum.at(starts, labels, np.arange(len(detections)))
+
+	#candidate pairs, near each other in (x, y, frame) with frames scaled to max_displacement
+	def get_points(rows):
+		return np.column_stack((detections[rows][:,[CENTER_X,CENTER_Y]], detections[rows,FRAME]*max_displacement))
+	radius = np.sqrt(3)*max_displacement*(max_gap + 1)
+	candidates = cKDTree(get_points(ends)).sparse_distance_matrix(cKDTree(get_points(starts)), radius, output_type='ndarray')
+	rows, cols = candidates['i'], candidates['j']
+	gaps = detections[starts[cols],FRAME] - detections[ends[rows],FRAME]
+	distances = np.hypot(*(detections[starts[cols]][:,[CENTER_X,CENTER_Y]] - detections[ends[rows]][:,[CENTER_X,CENTER_Y]]).T)
+	allowed = (gaps >= 2) & (gaps <= max_gap + 1) & (distances <= max_displacement*gaps)
+	rows, cols = rows[allowed], cols[allowed]
+	if len(rows) == 0:
+		return np.zeros((0,2), dtype=int)
+
+	#connected groups of candidates, with starts numbered after ends
+	graph = coo_matrix((np.ones(len(rows)), (rows, cols + chain_count)), shape=(2*chain_count, 2*chain_count))
+	component_count, components = connected_components(graph, directed=False)
+	end_groups, local_ends = ct.group_by_label(components[:chain_count], component_count)
+	start_groups, local_starts = ct.group_by_label(components[chain_count:], component_count)
+	pair_groups, local_pairs = ct.group_by_label(components[rows], component_count)
+
+	ellipses = detections[:,1:]
+	matrix_function = lambda rows1, rows2: ellipse_difference_matrix(ellipses[rows1], ellipses[rows2])
+	gap_links = []
+	for group_ends, group_starts, pairs in zip(end_groups, start_groups, pair_groups):
+		if len(pairs) == 0: continue
+		correspondence = ct.get_component_correspondence(ends[group_ends].tolist(), starts[group_starts].tolist(),
+			local_ends[rows[pairs]], local_starts[cols[pairs]], None, matrix_function)
+		gap_links.extend((i,j) for i,j in correspondence if i is not None and j is not None)
+	return np.array(gap_links, dtype=int).reshape(-1,2)
+
+def link_tracks(detections, max_displacement=50, max_gap=5, processes=None):
+	"""
+	Links detections into tracks: frame to frame, then across gaps of up to max_gap frames
+
+	Args:
+		detections: detections array (see detect_all)
+		max_displacement: maximum distance per frame between the centers of linked ellipses
+		max_gap: maximum number of frames a track may be missed for and keep its id
+		processes: number of processes to link frames in, defaults to the number of cores; 0 for this process
+	Returns:
+		array of the track id of every detection, numbered from 0 in the order tracks start
+	"""
+	links = link_frames(detections, max_displacement, processes)
+	if max_gap > 0:
+		links = np.vstack((links, close_gaps(detections, links, max_displacement, max_gap)))
+	return get_labels(links, len(detections))[1]
+
+def track_offline(source, processes=None, max_displacement=50, max_gap=5, chunk_size=256, parameters=None, cache=None):
+	"""
+	Tracks ellipses through a whole recording, detecting every frame in parallel and then linking tracks
+	with the whole recording in view, so tracks that drop out for up to max_gap frames keep their ids
+
+	Args:
+		source: video filename, directory of images or iterable of images (see ft.iterate_frames)
+		processes: number of processes, defaults to the number of cores; 0 to run in this process
+		max_displacement: maximum distance per frame between the centers of linked ellipses
+		max_gap: maximum number of frames a track may be missed for and keep its id
+		chunk_size: number of frames per chunk of a video file
+		parameters: optional map of detection parameters to values, see DETECTION_PARAMETERS
+		cache: optional detection_cache.DetectionCache to take the detections from, or store them in
+	Returns:
+		detections array (see detect_all) and array of the track id of every detection
+	"""
+	if cache is not None:
+		detections, frame_count = cache.get_detections(source, processes, parameters)
+	else:
+		detections = detect_all(source, processes, chunk_size, parameters)
+	return detections, link_tracks(detections, max_displacement, max_gap, processes)
+
+def get_ellipse_dicts(detections, ids, frame_count=None):
+	"""
+	Returns list of maps of ellipses to ids, one per frame, as ft.track_ellipses gives them
+	"""
+	offsets = get_frame_offsets(detections, frame_count)
+	ellipses = array_to_ellipses(detections[:,1:])
+	ids = ids.tolist()
+	return [dict(zip(ellipses[start:stop], ids[start:stop])) for start, stop in zip(offsets[:-1], offsets[1:])]
\ No newline at end of file
@@ -0,0 +1,77 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import cv2
+import fingertip_tracking
+import offline_tracking
+
+class Offline_Tracking_Test(unittest.TestCase):
+	def setUp(self):
+		#two ellipses crossing the frame, the first one missing from frames 10 and 11
+		self.frames = []
+		for i in range(30):
+			frame = np.zeros((120,160,3), np.uint8)
+			frame[:] = (40,120,40)
+			if i not in (10,11):
+				cv2.ellipse(frame, ((20+3*i,40),(20,14),0), (0,0,255), -1)
+			cv2.ellipse(frame, ((140-3*i,85),(20,14),0), (0,0,255), -1)
+			self.frames.append(frame)
+
+	def get_track_centers(self, detections, ids):
+		#x of the centers of every track, in frame order
+		return [detections[ids == i, offline_tracking.CENTER_X].tolist() for i in range(ids.max() + 1)]
+
+	def test_detect_all_matches_detect_ellipses(self):
+		detections = offline_tracking.detect_all(self.frames, processes=0)
+		self.assertEqual((58,6), detections.shape)
+		offsets = offline_tracking.get_frame_offsets(detections)
+		for i, frame in enumerate(self.frames):
+			self.assertEqual(fingertip_tracking.detect_ellipses(frame),
+				offline_tracking.array_to_ellipses(detections[offsets[i]:offsets[i+1],1:]))
+
+	def test_detect_all_parallel_matches_serial(self):
+		expected_detections = offline_tracking.detect_all(self.frames, processes=0)
+		np.testing.assert_array_equal(expected_detections, offline_tracking.detect_all(self.frames, processes=2))
+
+	def test_detect_all_video_chunks(self):
+		directory = tempfile.mkdtemp()
+		try:
+			filename = os.path.join(directory, "video.avi")
+			writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'MJPG'), 10, (160,120))
+			for frame in self.frames:
+				writer.write(frame)
+			writer.release()
+			expected_detections = offline_tracking.detect_all(filename, processes=0)
+			actual_detections = offline_tracking.detect_all(filename, processes=2, chunk_size=7)
+			np.testing.assert_array_equal(expected_detections, actual_detections)
+		finally:
+			shutil.rmtree(directory)
+
+	def test_link_frames_parallel_matches_serial(self):
+		detections = offline_tracking.detect_all(self.frames, processes=0)
+		expected_links = offline_tracking.link_frames(detections, 20, processes=0)
+		actual_links = offline_tracking.link_frames(detections, 20, processes=2, chunk_size=4)
+		self.assertEqual(9 + 17 + 29, len(expected_links))
+		self.assertEqual(sorted(map(tuple, expected_links)), sorted(map(tuple, actual_links)))
+
+	def test_track_offline_closes_gaps(self):
+		detections, ids = offline_tracking.track_offline(self.frames, processes=0, max_displacement=10, max_gap=3)
+		self.assertEqual([0,1], sorted(set(ids.tolist())))
+		for centers in self.get_track_centers(detections, ids):
+			self.assertTrue(np.all(np.diff(centers) > 0) or np.all(np.diff(centers) < 0))
+
+	def test_track_offline_without_gap_closing(self):
+		detections, ids = offline_tracking.track_offline(self.frames, processes=0, max_displacement=10, max_gap=0)
+		self.assertEqual([0,1,2], sorted(set(ids.tolist())))
+		self.assertEqual([10,18,30], sorted(len(c) for c in self.get_track_centers(detections, ids)))
+
+	def test_get_ellipse_dicts_matches_track_ellipses(self):
+		frames = self.frames[:10]
+		detections, ids = offline_tracking.track_offline(frames, processes=0)
+		expected_dicts = [d for i, d in fingertip_tracking.track_ellipses(frames)]
+		self.assertEqual(expected_dicts, offline_tracking.get_ellipse_dicts(detections, ids, len(frames)))
+
+if __name__ == '__main__':
+	unittest.main()
\ No newline at end of file
@@ -0,0 +1,235 @@
+import csv
+import random
+import itertools
+import timeit
+import multiprocessing
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+import offline_tracking as ot
+from tracks import TrackStore
+
+#parameters of the tracker (see tracks.TrackStore and TrackStore.step) and their defaults; every other parameter of
+#a configuration is a detection parameter (see ot.DETECTION_PARAMETERS)
+TRACKER_PARAMETERS = {
+	'a': 1,
+	'b': 1,
+	'c': 1,
+	'max_displacement': None,
+	'confirm_hits': 1,
+	'confirm_window': 1,
+	'max_misses': 0,
+}
+
+def grid_configs(space):
+	"""
+	Returns list of every configuration of a grid
+
+	Args:
+		space: map of parameter names to lists of values
+	Returns:
+		list of maps of parameter names to values
+	"""
+	names = sorted(space)
+	return [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+
+def random_configs(space, count, seed=0):
+	"""
+	Returns list of random configurations
+
+	Args:
+		space: map of parameter names to lists of values to choose from, or to functions from a random.Random
+			to a value (e.g. lambda rng: rng.uniform(0,2))
+		count: number of configurations
+		seed: seed for the random choices
+	Returns:
+		list of maps of parameter names to values
+	"""
+	rng = random.Random(seed)
+	names = sorted(space)
+	return [dict((name, space[name](rng) if callable(space[name]) else rng.choice(space[name])) for name in names)
+		for i in range(count)]
+
+def split_config(config):
+	"""
+	Returns the detection parameters and the tracker parameters of a configuration
+	"""
+	detection_parameters = dict((k,v) for k,v in config.items() if k not in TRACKER_PARAMETERS)
+	tracker_parameters = dict(TRACKER_PARAMETERS, **dict((k,v) for k,v in config.items() if k in TRACKER_PARAMETERS))
+	return ot.get_detection_parameters(detection_parameters), tracker_parameters
+
+def detect_job(args):
+	"""
+	Detects ellipses on every frame of a source, in this process
+
+	Args:
+		args: (source, detection parameters, optional detection_cache.DetectionCache), packed for Pool.map
+	Returns:
+		detections array, frame count, seconds taken, and whether the detections were taken from the cache
+	"""
+	source, parameters, cache = args
+	return get_detections(source, 0, parameters, cache)
+
+def get_detections(source, processes, parameters, cache=None):
+	"""
+	Returns the detections array and frame count of a source (see ot.detect_frames), the seconds taken, and whether
+	they were taken from cache rather than detected
+	"""
+	start = timeit.default_timer()
+	if cache is None:
+		detections, frame_count = ot.detect_frames(source, processes, parameters=parameters)
+		return detections, frame_count, timeit.default_timer() - start, False
+	hits = cache.hits
+	detections, frame_count = cache.get_detections(source, processes, parameters)
+	return detections, frame_count, timeit.default_timer() - start, cache.hits > hits
+
+def track_detections(detections, frame_count, a=1, b=1, c=1, max_displacement=None, confirm_hits=1, confirm_window=1,
+		max_misses=0):
+	"""
+	Tracks detected ellipses frame by frame through a tracks.TrackStore
+
+	Args:
+		detections: detections array (see ot.detect_all)
+		frame_count: number of frames
+		other arguments: see tracks.TrackStore and TrackStore.step
+	Returns:
+		list of maps of ellipses to ids, one per frame
+	"""
+	tracks = TrackStore(confirm_hits=confirm_hits, confirm_window=confirm_window, max_misses=max_misses)
+	offsets = ot.get_frame_offsets(detections, frame_count)
+	return [tracks.step(detections[start:stop,1:], frame_index, max_displacement, a, b, c)
+		for frame_index, (start, stop) in enumerate(zip(offsets[:-1], offsets[1:]))]
+
+def count_id_switches(ellipse_dicts, ground_truth, match_distance=10):
+	"""
+	Scores tracking against ground truth
+
+	Every frame, tracked ellipses are matched to ground-truth ellipses with centers within match_distance
+	(minimizing the total distance); a ground-truth object whose match has a different id than its previous
+	match is an id switch
+
+	Args:
+		ellipse_dicts: list of maps of tracked ellipses to ids, one per frame
+		ground_truth: list of maps of ground-truth ids to ellipses, one per frame
+		match_distance: maximum distance between the centers of matched ellipses
+	Returns:
+		map with the number of 'id_switches', 'misses' (unmatched ground truth) and 'false_positives' (unmatched tracks)
+	"""
+	scores = {'id_switches': 0, 'misses': 0, 'false_positives': 0}
+	last_ids = {}
+	for ellipse_dict, truth in zip(ellipse_dicts, ground_truth):
+		tracked = [(e,i) for e,i in ellipse_dict.items() if e is not None]
+		truth = truth.items()
+		matches = []
+		if tracked and truth:
+			tracked_centers = np.array([e[0] for e,i in tracked], dtype=float)
+			true_centers = np.array([e[0] for i,e in truth], dtype=float)
+			distances = np.hypot(*(true_centers[:,None,:] - tracked_centers[None,:,:]).transpose(2,0,1))
+			#pairs beyond match_distance cost more than leaving both unmatched
+			rows, cols = linear_sum_assignment(np.where(distances <= match_distance, distances, 3*match_distance + 1))
+			matches = [(r,c) for r,c in zip(rows, cols) if distances[r,c] <= match_distance]
+		for r, c in matches:
+			true_id, track_id = truth[r][0], tracked[c][1]
+			if true_id in last_ids and last_ids[true_id] != track_id:
+				scores['id_switches'] += 1
+			last_ids[true_id] = track_id
+		scores['misses'] += len(truth) - len(matches)
+		scores['false_positives'] += len(tracked) - len(matches)
+	return scores
+
+def track_job(args):
+	"""
+	Tracks the detections of a source with one tracker configuration and scores the result
+
+	Args:
+		args: (detections, frame count, ground truth or None, tracker parameters, match_distance), packed for Pool.map
+	Returns:
+		map of scores: the number of 'tracks' and seconds 'tracking' took, and the counts of count_id_switches if
+		there is ground truth
+	"""
+	detections, frame_count, ground_truth, tracker_parameters, match_distance = args
+	start = timeit.default_timer()
+	ellipse_dicts = track_detections(detections, frame_count, **tracker_parameters)
+	scores = {'tracking': timeit.default_timer() - start}
+	scores['tracks'] = len(set(i for d in ellipse_dicts for i in d.values()))
+	if ground_truth is not None:
+		scores.update(count_id_switches(ellipse_dicts, ground_truth, match_distance))
+	return scores
+
+def run_sweep(configs, sources, processes=None, cache=None, match_distance=10):
+	"""
+	Tracks every source with every configuration, detecting each source once per distinct set of detection
+	parameters, with detection and tracking spread over a pool of processes
+
+	Args:
+		configs: list of maps of parameter names to values (see grid_configs and random_configs); parameters in
+			TRACKER_PARAMETERS configure the tracker, the others detection
+		sources: list of video filenames, directories of images or lists of images, or of (source, ground truth)
+			pairs, where ground truth is a list of maps of ground-truth ids to ellipses, one per frame
+		processes: number of processes, defaults to the number of cores; 0 to run in this process
+		cache: optional detection_cache.DetectionCache to take detections from, or store them in
+		match_distance: see count_id_switches
+	Returns:
+		list of results, one per configuration and source: the configuration, with the 'source' index, the
+		scores of track_job, whether the detections were taken from the cache ('detection_cached'), and the
+		'detection_fps' (nan for cached detections) and 'tracking_fps' throughputs in frames per second
+	"""
+	sources = [s if isinstance(s, tuple) else (s, None) for s in sources]
+
+	#detect every source once per set of detection parameters
+	detection_keys = []
+	runs = []
+	for config in configs:
+		detection_parameters, tracker_parameters = split_config(config)
+		for source_index in range(len(sources)):
+			key = (source_index, sorted(detection_parameters.items()))
+			if key not in detection_keys:
+				detection_keys.append(key)
+			runs.append((config, source_index, detection_keys.index(key), tracker_parameters))
+	detection_jobs = [(sources[i][0], dict(parameters), cache) for i, parameters in detection_keys]
+
+	pool = multiprocessing.Pool(processes) if processes != 0 else None
+	try:
+		map_function = pool.map if pool is not None else map
+		if len(detection_jobs) == 1 and pool is not None:
+			#a single recording is cut into chunks for the pool instead
+			source, parameters, job_cache = detection_jobs[0]
+			detection_results = [get_detections(source, processes, parameters, job_cache)]
+		else:
+			detection_results = map_function(detect_job, detection_jobs)
+
+		track_jobs = [detection_results[detection_index][:2] + (sources[source_index][1], tracker_parameters, match_distance)
+			for config, source_index, detection_index, tracker_parameters in runs]
+		scores = map_function(track_job, track_jobs)
+		if pool is not None:
+			pool.close()
+	finally:
+		if pool is not None:
+			pool.terminate()
+			pool.join()
+
+	results = []
+	for (config, source_index, detection_index, tracker_parameters), run_scores in zip(runs, scores):
+		detections, frame_count, detection_seconds, cached = detection_results[detection_index]
+		result = dict(config, source=source_index, **run_scores)
+		tracking_seconds = result.pop('tracking')
+		result['detection_cached'] = cached
+		#loading cached detections says nothing of the speed of detection
+		if cached:
+			result['detection_fps'] = float('nan')
+		else:
+			result['detection_fps'] = frame_count/detection_seconds if detection_seconds > 0 else float('inf')
+		result['tracking_fps'] = frame_count/tracking_seconds if tracking_seconds > 0 else float('inf')
+		results.append(result)
+	return results
+
+def write_results(filename, results):
+	"""
+	Writes results of run_sweep as a csv table, one row per configuration and source
+	"""
+	score_columns = ['source', 'tracks', 'id_switches', 'misses', 'false_positives', 'detection_cached', 'detection_fps',
+		'tracking_fps']
+	columns = sorted(set(k for result in results for k in result) - set(score_columns)) + score_columns
+	with open(filename, 'wb') as f:
+		writer = csv.DictWriter(f, columns, restval='')
+		writer.writeheader()
+		writer.writerows(results)
\ No newline at end of file
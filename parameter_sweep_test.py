@@ -0,0 +1,96 @@
+import unittest
+import os
+import csv
+import shutil
+import tempfile
+import numpy as np
+import cv2
+import detection_cache
+import parameter_sweep
+
+class Parameter_Sweep_Test(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.frames = []
+		self.ground_truth = []
+		for i in range(10):
+			frame = np.zeros((120,160,3), np.uint8)
+			frame[:] = (40,120,40)
+			ellipses = {3: ((30.+4*i,40.),(24.,14.),10.*i), 7: ((130.-4*i,90.),(18.,26.),0.)}
+			for ellipse in ellipses.values():
+				cv2.ellipse(frame, ellipse, (0,0,255), -1)
+			self.frames.append(frame)
+			self.ground_truth.append(ellipses)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_grid_configs(self):
+		configs = parameter_sweep.grid_configs({'a': [1,2], 'min_radius': [0,3,5]})
+		self.assertEqual(6, len(configs))
+		self.assertIn({'a': 2, 'min_radius': 3}, configs)
+
+	def test_random_configs(self):
+		space = {'a': lambda rng: rng.uniform(0,2), 'fill': [True,False]}
+		configs = parameter_sweep.random_configs(space, 5, seed=1)
+		self.assertEqual(configs, parameter_sweep.random_configs(space, 5, seed=1))
+		self.assertTrue(all(0 <= config['a'] <= 2 and config['fill'] in (True,False) for config in configs))
+
+	def test_split_config(self):
+		detection_parameters, tracker_parameters = parameter_sweep.split_config({'a': 2, 'min_radius': 3})
+		self.assertEqual(3, detection_parameters['min_radius'])
+		self.assertEqual(2, tracker_parameters['a'])
+		self.assertEqual(1, tracker_parameters['b'])
+		self.assertRaises(ValueError, parameter_sweep.split_config, {'radius': 3})
+
+	def test_count_id_switches(self):
+		e0, e1 = ((0.,0.),(4.,4.),0.), ((50.,50.),(4.,4.),0.)
+		ellipse_dicts = [{e0: 0, e1: 1}, {e0: 1, e1: 0}, {e0: 1}, {e0: 1, ((99.,99.),(4.,4.),0.): 2}]
+		ground_truth = [{'a': e0, 'b': e1}]*4
+		scores = parameter_sweep.count_id_switches(ellipse_dicts, ground_truth)
+		self.assertEqual({'id_switches': 2, 'misses': 2, 'false_positives': 1}, scores)
+
+	def test_run_sweep_scores_ground_truth(self):
+		configs = parameter_sweep.grid_configs({'a': [1,.5], 'min_radius': [0,30]})
+		results = parameter_sweep.run_sweep(configs, [(self.frames, self.ground_truth)], processes=0)
+		self.assertEqual(4, len(results))
+		for config, result in zip(configs, results):
+			self.assertEqual(config['a'], result['a'])
+			self.assertEqual(0, result['id_switches'])
+			self.assertEqual(0 if config['min_radius'] == 0 else 20, result['misses'])
+			self.assertGreater(result['tracking_fps'], 0)
+
+	def test_run_sweep_detects_once_per_detection_parameters(self):
+		cache = detection_cache.DetectionCache(self.directory)
+		configs = parameter_sweep.grid_configs({'a': [1,2,3], 'max_displacement': [None,20], 'fill': [True,False]})
+		sources = [self.frames, (self.frames[:5], self.ground_truth[:5])]
+		results = parameter_sweep.run_sweep(configs, sources, processes=2, cache=cache)
+		self.assertEqual(2*2, len(cache.get_entries()))
+		self.assertEqual(12*2, len(results))
+		self.assertTrue(all(not r['detection_cached'] and r['detection_fps'] > 0 for r in results))
+		serial_results = parameter_sweep.run_sweep(configs, sources, processes=0)
+		ignored = ('detection_cached', 'detection_fps', 'tracking_fps')
+		strip = lambda results: [dict((k,v) for k,v in r.items() if k not in ignored) for r in results]
+		self.assertEqual(strip(serial_results), strip(results))
+
+	def test_run_sweep_cached_detections(self):
+		#a single recording is detected in this process, and by the pool in chunks
+		for processes in (0, 2):
+			cache = detection_cache.DetectionCache(os.path.join(self.directory, str(processes)))
+			for cached in (False, True):
+				result, = parameter_sweep.run_sweep([{'a': 1}], [self.frames], processes=processes, cache=cache)
+				self.assertEqual(cached, result['detection_cached'])
+				self.assertEqual(cached, np.isnan(result['detection_fps']))
+
+	def test_write_results(self):
+		results = parameter_sweep.run_sweep([{'a': 1}], [self.frames], processes=0)
+		filename = os.path.join(self.directory, 'results.csv')
+		parameter_sweep.write_results(filename, results)
+		with open(filename) as f:
+			rows = list(csv.DictReader(f))
+		self.assertEqual(1, len(rows))
+		self.assertEqual('2', rows[0]['tracks'])
+		self.assertEqual('', rows[0]['id_switches'])
+
+if __name__ == '__main__':
+	unittest.main()
\ No newline at end of file
@@ -0,0 +1,151 @@
+from math import log
+from timeit import default_timer
+import numpy as np
+
+class Histogram(object):
+	"""
+	Histogram of durations over logarithmic buckets, cheap enough to record every stage of every frame
+
+	Percentiles are read off the buckets, so they are accurate to the relative width of a bucket
+	(growth - 1, 5% by default); the count, total, minimum and maximum are exact
+	"""
+	def __init__(self, smallest=1e-6, largest=100., growth=1.05):
+		"""
+		Args:
+			smallest: upper edge of the first bucket, in seconds; shorter durations are counted in it
+			largest: durations from this up are counted in the last bucket
+			growth: ratio between the edges of consecutive buckets
+		"""
+		self.smallest = smallest
+		self.log_growth = log(growth)
+		self.edges = smallest*growth**np.arange(int(log(largest/smallest)/self.log_growth) + 2)
+		self.counts = np.zeros(len(self.edges), dtype=int)
+		self.count = 0
+		self.total = 0.
+		self.min = float('inf')
+		self.max = 0.
+
+	def record(self, value):
+		"""
+		Adds a duration in seconds
+		"""
+		index = int(log(value/self.smallest)/self.log_growth) + 1 if value > self.smallest else 0
+		self.counts[min(index, len(self.counts) - 1)] += 1
+		self.count += 1
+		self.total += value
+		if value < self.min: self.min = value
+		if value > self.max: self.max = value
+
+	def percentile(self, q):
+		"""
+		Returns the duration that q percent of the recorded durations are at most, or 0 if there are none
+		"""
+		if self.count == 0:
+			return 0.
+		index = np.searchsorted(np.cumsum(self.counts), q/100.*self.count)
+		if index == len(self.edges) - 1:
+			#the last bucket has no upper edge
+			return self.max
+		#the upper edge of the bucket, but never beyond the extremes seen
+		return min(max(float(self.edges[index]), self.min), self.max)
+
+	def summary(self):
+		"""
+		Returns map of 'count', 'mean', 'p50', 'p95', 'p99' and 'max', durations in seconds
+		"""
+		return {
+			'count': self.count,
+			'mean': self.total/self.count if self.count else 0.,
+			'p50': self.percentile(50),
+			'p95': self.percentile(95),
+			'p99': self.percentile(99),
+			'max': self.max,
+		}
+
+class Profiler(object):
+	"""
+	Wall time of every stage of the tracking loop, as histograms (see Histogram), and counters of the work done
+
+	Instrumented functions take an optional profiler and check it against None only, so tracking without one
+	costs nothing. A stage is timed by passing the time it started to lap, which returns the time it ended
+	so that consecutive stages chain:
+
+		start = default_timer()
+		red_img = get_red(frame)
+		start = profiler.lap('red', start)
+
+	With report_interval, a summary of the frames since the last report is passed to callback (printed by
+	default) every report_interval frames, and the histograms and counters start over
+	"""
+	def __init__(self, report_interval=None, callback=None):
+		"""
+		Args:
+			report_interval: optional number of frames between reports
+			callback: function called with every report (see summary), print_summary if None
+		"""
+		self.report_interval = report_interval
+		self.callback = callback
+		self.reset()
+
+	def reset(self):
+		"""
+		Clears the histograms and counters
+		"""
+		self.histograms = {}
+		self.counters = {}
+		self.frames = 0
+
+	def record(self, stage, seconds):
+		"""
+		Adds a duration in seconds to the histogram of stage
+		"""
+		histogram = self.histograms.get(stage)
+		if histogram is None:
+			histogram = self.histograms[stage] = Histogram()
+		histogram.record(seconds)
+
+	def lap(self, stage, start):
+		"""
+		Records the time since start as a duration of stage, and returns the current time
+		"""
+		now = default_timer()
+		self.record(stage, now - start)
+		return now
+
+	def count(self, counter, value=1):
+		"""
+		Adds value to counter
+		"""
+		self.counters[counter] = self.counters.get(counter, 0) + value
+
+	def end_frame(self):
+		"""
+		Counts a frame, reporting (see report_interval) if it completes an interval
+		"""
+		self.frames += 1
+		if self.report_interval is not None and self.frames % self.report_interval == 0:
+			(self.callback or print_summary)(self.summary())
+			self.reset()
+
+	def summary(self):
+		"""
+		Returns map with the number of 'frames', the summaries of the histograms by stage under 'stages'
+		(see Histogram.summary) and the 'counters'
+		"""
+		return {
+			'frames': self.frames,
+			'stages': dict((stage, histogram.summary()) for stage, histogram in self.histograms.items()),
+			'counters': dict(self.counters),
+		}
+
+def print_summary(summary):
+	"""
+	Prints a summary of a Profiler as a table in milliseconds
+	"""
+	print "%d frames" % summary['frames']
+	print "%-16s %8s %10s %10s %10s %10s %10s" % ('stage', 'count', 'mean', 'p50', 'p95', 'p99', 'max')
+	for stage, s in sorted(summary['stages'].items()):
+		print "%-16s %8d %7.3f ms %7.3f ms %7.3f ms %7.3f ms %7.3f ms" % (stage, s['count'], s['mean']*1000,
+			s['p50']*1000, s['p95']*1000, s['p99']*1000, s['max']*1000)
+	for counter, value in sorted(summary['counters'].items()):
+		print "%-16s %8d" % (counter, value)
\ No newline at end of file
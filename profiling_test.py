@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+import fingertip_tracking
+import profiling
+from synthetic_video import SyntheticVideo
+
+class Profiling_Test(unittest.TestCase):
+	def test_histogram_percentiles(self):
+		histogram = profiling.Histogram()
+		values = np.random.RandomState(0).lognormal(np.log(1e-3), 1, 10000)
+		for value in values:
+			histogram.record(value)
+		summary = histogram.summary()
+		self.assertEqual(10000, summary['count'])
+		self.assertAlmostEqual(values.mean(), summary['mean'])
+		self.assertEqual(values.max(), summary['max'])
+		for q in (50, 95, 99):
+			self.assertTrue(abs(histogram.percentile(q)/np.percentile(values, q) - 1) < .06)
+
+	def test_histogram_extremes(self):
+		histogram = profiling.Histogram()
+		self.assertEqual(0, histogram.percentile(50))
+		histogram.record(0)
+		histogram.record(1e4)
+		self.assertTrue(histogram.percentile(50) <= 1e-6)
+		self.assertEqual(1e4, histogram.percentile(100))
+
+	def test_lap_and_count(self):
+		profiler = profiling.Profiler()
+		start = profiler.lap('a', 0)
+		profiler.lap('b', start)
+		profiler.count('pairs', 3)
+		profiler.count('pairs')
+		summary = profiler.summary()
+		self.assertEqual(['a', 'b'], sorted(summary['stages']))
+		self.assertEqual(1, summary['stages']['b']['count'])
+		self.assertEqual({'pairs': 4}, summary['counters'])
+
+	def test_periodic_report(self):
+		reports = []
+		profiler = profiling.Profiler(report_interval=2, callback=reports.append)
+		for i in range(5):
+			profiler.record('stage', .001)
+			profiler.count('frames seen')
+			profiler.end_frame()
+		self.assertEqual(2, len(reports))
+		self.assertEqual(2, reports[1]['frames'])
+		self.assertEqual(2, reports[1]['stages']['stage']['count'])
+		self.assertEqual({'frames seen': 2}, reports[1]['counters'])
+		self.assertEqual(1, profiler.frames)
+
+	def test_profiled_tracking(self):
+		frames, ground_truth = SyntheticVideo(count=3, frame_count=10, resolution=(120,160)).get_frames()
+		profiler = profiling.Profiler()
+		profiled_dicts = [d for i, d in fingertip_tracking.track_ellipses(frames, profiler=profiler)]
+		self.assertEqual([d for i, d in fingertip_tracking.track_ellipses(frames)], profiled_dicts)
+		summary = profiler.summary()
+		self.assertEqual(10, summary['frames'])
+		for stage in ('read', 'red', 'threshold', 'morphology', 'find_contours', 'fit', 'ranking', 'correspondence'):
+			self.assertEqual(10, summary['stages'][stage]['count'])
+		ellipse_count = sum(len(d) for d in profiled_dicts)
+		self.assertEqual(ellipse_count, summary['counters']['ellipses'])
+		self.assertEqual(ellipse_count, summary['counters']['ellipses_fitted'])
+		self.assertEqual(sum(len(d1)*len(d2) for d1, d2 in zip(profiled_dicts[:-1], profiled_dicts[1:])),
+			summary['counters']['candidate_pairs'])
+
+if __name__ == '__main__':
+	unittest.main()
\ No newline at end of file
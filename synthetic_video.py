@@ -0,0 +1,172 @@
+import cv2
+import numpy as np
+from track_file import TrackWriter
+
+BACKGROUND = (40,120,40)
+RED = (0,0,255)
+
+class SyntheticVideo(object):
+	"""
+	Deterministic video of red ellipses moving, rotating and scaling over a green background, with ground truth
+
+	Every ellipse moves at constant speed and bounces off the borders of the frame, turns at a constant rate, and
+	scales its axes up and down periodically. Optional gaussian pixel noise and background-colored bars moving
+	across the frame (occluders) make detection harder; ellipses mostly hidden by occluders are left out of the
+	ground truth of a frame. The same seed always gives the same frames and ground truth
+	"""
+	def __init__(self, count=5, frame_count=100, resolution=(480,640), seed=0, speed=3., rotation_speed=2.,
+			scale_amplitude=.1, scale_period=50, noise=0., occluders=0, min_visible=.5):
+		"""
+		Args:
+			count: number of ellipses
+			frame_count: number of frames
+			resolution: (height, width) of the frames
+			seed: seed for the starting positions, sizes and motions of the ellipses and for the noise
+			speed: maximum speed of the ellipses in pixels per frame, at 480 rows (scaled with the height)
+			rotation_speed: maximum rotation of the ellipses in degrees per frame
+			scale_amplitude: maximum relative change of the axes from their mean
+			scale_period: number of frames an ellipse takes to scale up and back down
+			noise: standard deviation of the gaussian noise added to every pixel
+			occluders: number of occluding bars
+			min_visible: minimum fraction of an ellipse that must be visible for it to be in the ground truth
+		"""
+		self.count = count
+		self.frame_count = frame_count
+		self.height, self.width = resolution
+		self.seed = seed
+		self.noise = noise
+		self.min_visible = min_visible
+
+		rng = np.random.RandomState(seed)
+		scale = self.height/480.
+		self.axes = rng.uniform(20, 60, (count,2))*scale
+		self.centers = np.column_stack((rng.uniform(0, self.width, count), rng.uniform(0, self.height, count)))
+		self.velocities = rng.uniform(-speed, speed, (count,2))*scale
+		self.angles = rng.uniform(0, 180, count)
+		self.angular_velocities = rng.uniform(-rotation_speed, rotation_speed, count)
+		self.scale_amplitude = scale_amplitude
+		self.scale_period = scale_period
+		self.scale_phases = rng.uniform(0, 2*np.pi, count)
+		#occluders: (x, y, width, height, x velocity) of bars sliding sideways
+		self.occluders = np.column_stack((rng.uniform(0, self.width, occluders), rng.uniform(0, self.height, occluders),
+			rng.uniform(10, 40, occluders)*scale, rng.uniform(60, 200, occluders)*scale, rng.uniform(-speed, speed, occluders)*scale))
+
+	def get_ellipses(self, frame_index):
+		"""
+		Returns list of the ellipses of every id on frame frame_index, in the format returned by cv2.fitEllipse
+		"""
+		#reflect the unbounded motion back into the frame, so ellipses bounce off the borders without touching them
+		#(detection merges an ellipse touching a border with the border)
+		margins = self.axes.max(axis=1)[:,None]*(1 + self.scale_amplitude)/2 + 1
+		sizes = np.maximum(np.array([self.width, self.height], dtype=float) - 2*margins, 1)
+		position = np.mod(self.centers - margins + frame_index*self.velocities, 2*sizes)
+		centers = margins + np.where(position > sizes, 2*sizes - position, position)
+		angles = np.mod(self.angles + frame_index*self.angular_velocities, 180)
+		scales = 1 + self.scale_amplitude*np.sin(self.scale_phases + 2*np.pi*frame_index/self.scale_period)
+		axes = self.axes*scales[:,None]
+		return [((cx,cy),(a0,a1),angle) for (cx,cy), (a0,a1), angle in zip(centers.tolist(), axes.tolist(), angles.tolist())]
+
+	def get_occluders(self, frame_index):
+		"""
+		Returns list of the ((x0, y0), (x1, y1)) corners of every occluder on frame frame_index
+		"""
+		x = np.mod(self.occluders[:,0] + frame_index*self.occluders[:,4], self.width)
+		y, w, h = self.occluders[:,1], self.occluders[:,2], self.occluders[:,3]
+		return [((int(x0),int(y0)),(int(x0+w0),int(y0+h0))) for x0, y0, w0, h0 in zip(x, y - h/2, w, h)]
+
+	def render(self, frame_index):
+		"""
+		Returns the frame and the ground truth of frame frame_index
+
+		Returns:
+			bgr image, and map of the ids of the ellipses visible on it to the ellipses
+		"""
+		frame = np.empty((self.height,self.width,3), np.uint8)
+		frame[:] = BACKGROUND
+		ellipses = self.get_ellipses(frame_index)
+		for ellipse in ellipses:
+			cv2.ellipse(frame, ellipse, RED, -1)
+		for corner0, corner1 in self.get_occluders(frame_index):
+			cv2.rectangle(frame, corner0, corner1, BACKGROUND, -1)
+
+		if self.noise > 0:
+			rng = np.random.RandomState([self.seed, frame_index])
+			noisy_frame = frame + rng.normal(0, self.noise, frame.shape)
+			frame = np.clip(noisy_frame, 0, 255).astype(np.uint8)
+		return frame, self.get_truth(frame_index)
+
+	def get_truth(self, frame_index):
+		"""
+		Returns map of the ids of the ellipses visible on frame frame_index to the ellipses
+		"""
+		ellipses = self.get_ellipses(frame_index)
+		occluders = self.get_occluders(frame_index)
+		if not occluders:
+			return dict(enumerate(ellipses))
+		occluder_mask = np.zeros((self.height,self.width), np.uint8)
+		for corner0, corner1 in occluders:
+			cv2.rectangle(occluder_mask, corner0, corner1, 1, -1)
+		return dict((i, ellipse) for i, ellipse in enumerate(ellipses)
+			if self.get_visible_fraction(ellipse, occluder_mask) >= self.min_visible)
+
+	def get_visible_fraction(self, ellipse, occluder_mask):
+		"""
+		Returns the fraction of the pixels of ellipse not covered by occluder_mask
+		"""
+		mask = np.zeros_like(occluder_mask)
+		cv2.ellipse(mask, ellipse, 1, -1)
+		area = np.count_nonzero(mask)
+		if area == 0:
+			return 0.
+		return 1 - np.count_nonzero(mask & occluder_mask)/float(area)
+
+	def __len__(self):
+		return self.frame_count
+
+	def __iter__(self):
+		"""
+		Iterates over the frames, rendered one at a time, so the video can be passed to ft.track_ellipses as a source
+		"""
+		for frame_index in range(self.frame_count):
+			yield self.render(frame_index)[0]
+
+	def get_ground_truth(self):
+		"""
+		Returns list of maps of the ids of the visible ellipses to the ellipses, one per frame
+		"""
+		return [self.get_truth(frame_index) for frame_index in range(self.frame_count)]
+
+	def get_frames(self):
+		"""
+		Returns list of all frames and the ground truth (see get_ground_truth)
+		"""
+		frames, ground_truth = zip(*[self.render(frame_index) for frame_index in range(self.frame_count)]) or ([], [])
+		return list(frames), list(ground_truth)
+
+	def write(self, filename, ground_truth_path=None, fps=30, fourcc='MJPG'):
+		"""
+		Writes the frames to a video file, and optionally the ground truth to a track file (see track_file)
+
+		Args:
+			filename: video file to write
+			ground_truth_path: optional directory to write the ground truth to, as a track file
+			fps: frames per second of the video
+			fourcc: four character code of the video codec
+		Returns:
+			ground truth (see get_ground_truth)
+		"""
+		writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*fourcc), fps, (self.width,self.height))
+		truth_writer = TrackWriter(ground_truth_path) if ground_truth_path is not None else None
+		ground_truth = []
+		try:
+			for frame_index in range(self.frame_count):
+				frame, truth = self.render(frame_index)
+				writer.write(frame)
+				ground_truth.append(truth)
+				if truth_writer is not None:
+					truth_writer.append(frame_index, dict((e,i) for i,e in truth.items()))
+		finally:
+			writer.release()
+			if truth_writer is not None:
+				truth_writer.close()
+		return ground_truth
\ No newline at end of file
@@ -0,0 +1,69 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import fingertip_tracking
+import parameter_sweep
+import synthetic_video
+import track_file
+
+class Synthetic_Video_Test(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_same_seed_same_video(self):
+		frames1, truth1 = synthetic_video.SyntheticVideo(count=3, frame_count=5, resolution=(120,160), noise=5, occluders=1).get_frames()
+		frames2, truth2 = synthetic_video.SyntheticVideo(count=3, frame_count=5, resolution=(120,160), noise=5, occluders=1).get_frames()
+		self.assertTrue(all(np.array_equal(frame1, frame2) for frame1, frame2 in zip(frames1, frames2)))
+		self.assertEqual(truth1, truth2)
+		frames3, truth3 = synthetic_video.SyntheticVideo(count=3, frame_count=5, resolution=(120,160), seed=1).get_frames()
+		self.assertNotEqual(truth1, truth3)
+
+	def test_ellipses_stay_in_frame(self):
+		video = synthetic_video.SyntheticVideo(count=6, frame_count=200, resolution=(120,160), speed=10)
+		for truth in video.get_ground_truth():
+			self.assertEqual(6, len(truth))
+			for (cx, cy), axes, angle in truth.values():
+				self.assertTrue(0 < cx - max(axes)/2 and cx + max(axes)/2 < 160)
+				self.assertTrue(0 < cy - max(axes)/2 and cy + max(axes)/2 < 120)
+
+	def test_detected_ellipses_match_ground_truth(self):
+		frames, ground_truth = synthetic_video.SyntheticVideo(count=1, frame_count=10, resolution=(240,320)).get_frames()
+		for frame, truth in zip(frames, ground_truth):
+			ellipses = fingertip_tracking.detect_ellipses(frame)
+			self.assertEqual(1, len(ellipses))
+			self.assertTrue(np.hypot(*np.subtract(ellipses[0][0], truth[0][0])) < 1)
+
+	def test_occluded_ellipses_left_out_of_ground_truth(self):
+		video = synthetic_video.SyntheticVideo(count=1, frame_count=1, resolution=(240,320))
+		video.occluders = np.array([[0., 120, 320, 240, 0]])
+		frame, truth = video.render(0)
+		self.assertEqual({}, truth)
+		self.assertEqual([], fingertip_tracking.detect_ellipses(frame))
+
+	def test_tracking_accuracy(self):
+		video = synthetic_video.SyntheticVideo(count=3, frame_count=30, resolution=(240,320), seed=1, noise=10)
+		ellipse_dicts = [ellipse_dict for frame_index, ellipse_dict in fingertip_tracking.track_ellipses(video)]
+		scores = parameter_sweep.count_id_switches(ellipse_dicts, video.get_ground_truth())
+		self.assertEqual({'id_switches': 0, 'misses': 0, 'false_positives': 0}, scores)
+
+	def test_write(self):
+		video = synthetic_video.SyntheticVideo(count=2, frame_count=5, resolution=(120,160))
+		ground_truth = video.write(os.path.join(self.directory, 'video.avi'), os.path.join(self.directory, 'truth'))
+		frames = list(fingertip_tracking.iterate_frames(os.path.join(self.directory, 'video.avi')))
+		self.assertEqual(5, len(frames))
+		self.assertEqual((120,160,3), frames[0].shape)
+		tracks = track_file.TrackFile(os.path.join(self.directory, 'truth'))
+		self.assertEqual(5, tracks.frame_count)
+		for frame_index, truth in enumerate(ground_truth):
+			ellipse_dict = tracks.get_ellipse_dict(frame_index)
+			self.assertEqual(sorted(truth), sorted(ellipse_dict.values()))
+			for ellipse, true_id in ellipse_dict.items():
+				self.assertTrue(np.allclose(np.hstack(map(np.ravel, ellipse)), np.hstack(map(np.ravel, truth[true_id])), atol=1e-3))
+
+if __name__ == '__main__':
+	unittest.main()
\ No newline at end of file
@@ -0,0 +1,255 @@
+import cv2
+import numpy as np
+import fingertip_tracking as ft
+
+def otsu_threshold(histogram):
+	"""
+	Returns the threshold the Otsu method picks for an image with the given histogram, as cv2.threshold does
+
+	Args:
+		histogram: length 256 array of the number of pixels of every gray value
+	Returns:
+		threshold between 0 and 255: pixels above it are one class, the others the other class
+	"""
+	p = np.asarray(histogram, dtype=float)
+	p = p/p.sum()
+	q1 = np.cumsum(p)
+	q2 = 1 - q1
+	m1 = np.cumsum(np.arange(len(p))*p)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		sigma = (m1[-1]*q1 - m1)**2/(q1*q2)
+	#cv2 skips the splits that leave a class (all but) empty, and keeps the first best split
+	epsilon = np.finfo(np.float32).eps
+	sigma[(np.minimum(q1, q2) < epsilon) | (np.maximum(q1, q2) > 1 - epsilon)] = 0
+	return int(np.argmax(sigma))
+
+def get_histogram(gray):
+	"""
+	Returns length 256 array of the number of pixels of every value of a single channel uint8 image
+	"""
+	return cv2.calcHist([gray], [0], None, [256], [0,256]).ravel().astype(int)
+
+def get_tile_maxima(img, tile_size):
+	"""
+	Returns the largest value of img in every tile_size x tile_size tile
+
+	Args:
+		img: image of one or three uint8 channels
+		tile_size: side of the tiles in pixels; tiles at the right and bottom are cut short if it does not divide the image
+	Returns:
+		rows x columns uint8 array of the maxima of the tiles
+	"""
+	height, width = img.shape[:2]
+	rows, cols = -(-height//tile_size), -(-width//tile_size)
+	if rows*tile_size != height or cols*tile_size != width:
+		img = cv2.copyMakeBorder(img, 0, rows*tile_size - height, 0, cols*tile_size - width, cv2.BORDER_CONSTANT, value=0)
+	#maximum over the rows of every tile with one cv2.max per row, then over the columns of every tile
+	img = img.reshape(rows, tile_size, -1)
+	maxima = img[:,0,:].copy()
+	for i in range(1, tile_size):
+		cv2.max(maxima, img[:,i,:], dst=maxima)
+	return maxima.reshape(rows, cols, -1).max(axis=2)
+
+def get_tile_windows(tiles, tile_size, shape):
+	"""
+	Returns windows covering the marked tiles of an image
+
+	Args:
+		tiles: rows x columns boolean array of the tiles to cover
+		tile_size: side of the tiles in pixels
+		shape: shape of the image
+	Returns:
+		list of non-overlapping windows (x0,y0,x1,y1) in pixels, clipped to the image
+	"""
+	height, width = shape[:2]
+	count, labels, stats, centroids = cv2.connectedComponentsWithStats(tiles.astype(np.uint8), connectivity=8)
+	windows = [(x*tile_size, y*tile_size, min((x + w)*tile_size, width), min((y + h)*tile_size, height))
+		for x, y, w, h, area in stats[1:]]
+	return ft.merge_windows(windows)
+
+def pad_window(window, padding, shape):
+	"""
+	Returns window (x0,y0,x1,y1) grown by padding on every side, clipped to an image of the given shape
+	"""
+	x0, y0, x1, y1 = window
+	height, width = shape[:2]
+	return (max(x0 - padding, 0), max(y0 - padding, 0), min(x1 + padding, width), min(y1 + padding, height))
+
+def get_inner_contours(binary_img, window=None):
+	"""
+	Returns the contours of a binary image, or of a window of it, that do not touch its border, and their bounds
+
+	Contours touching the border of the frame are those of the background around the markers, and contours
+	touching the border of a window are cut by it
+
+	Args:
+		binary_img: an image with only black and white pixels
+		window: optional window (x0,y0,x1,y1) to find contours in
+	Returns:
+		list of contours, in image coordinates, and N x 4 array of their bounds (x0,y0,x1,y1)
+	"""
+	x0, y0, x1, y1 = window if window is not None else (0, 0, binary_img.shape[1], binary_img.shape[0])
+	offset = np.array((x0,y0), np.int32)
+	contours = []
+	bounds = []
+	for contour in ft.get_contours_binary(np.ascontiguousarray(binary_img[y0:y1,x0:x1])):
+		x, y, w, h = cv2.boundingRect(contour)
+		if x == 0 or y == 0 or x + w == x1 - x0 or y + h == y1 - y0:
+			continue
+		contours.append(contour + offset)
+		bounds.append((x + x0, y + y0, x + x0 + w, y + y0 + h))
+	return contours, np.array(bounds, dtype=int).reshape(-1,4)
+
+class IncrementalSegmenter(object):
+	"""
+	Segments the frames of a video (see ft.get_contours_hsv) reusing what it found on earlier frames, for fixed
+	cameras where most of the scene is static
+
+	Frames are compared with what was last segmented in tiles of tile_size pixels, and only the tiles where a
+	pixel changed by more than change_threshold are segmented again: the hsv masks, the histogram of the red
+	part (updated by the pixels that changed, rather than counted again), and the threshold and morphology in
+	windows around the changed tiles, grown by how far the morphology reaches so that the binary image is the
+	same as that of the whole frame. Contours are found again only around the windows, the others are kept.
+
+	The Otsu threshold is picked again from the updated histogram on every frame; when it moves by more than
+	threshold_tolerance, when more than max_changed of the tiles changed (segmenting them one window at a time
+	then costs more than the whole frame at once), or every refresh_interval frames, the whole frame is
+	segmented again. Pixels that change by less than change_threshold, and the threshold moving within
+	threshold_tolerance, are ignored until then; with both 0, the binary image is always that of
+	get_thresholded_hsv and get_filled_binary.
+
+	Contours touching the border of the frame are left out, as they are of the background around the markers.
+	A part of the background that is cut off from the border of the frame away from the changed tiles is only
+	found at the next full segmentation. Results returned by its methods are overwritten by the next frame
+	"""
+	def __init__(self, tile_size=40, change_threshold=16, threshold_tolerance=0, max_changed=.5, refresh_interval=100,
+			fill=True, kernel_size=3, iterations=3, lower_red_bounds=(0,2), upper_red_bounds=(170,180)):
+		"""
+		Args:
+			tile_size: side of the tiles in pixels; 40 divides the common frame sizes from 640x480 to 3840x2160
+			change_threshold: largest change of a channel of a pixel that leaves it unchanged
+			threshold_tolerance: largest change of the Otsu threshold that leaves it unchanged
+			max_changed: largest fraction of the tiles that is segmented again by itself
+			refresh_interval: number of frames between segmentations of the whole frame, None for never
+			fill: whether or not to apply opening and dilation before getting contours, see ft.get_filled_binary
+			kernel_size: size of kernel used for opening and dilation
+			iterations: number of times opening and dilation are applied
+			lower_red_bounds: hue range of the red band at the start of the hue circle, see ft.get_red
+			upper_red_bounds: hue range of the red band at the end of the hue circle
+		"""
+		self.tile_size = tile_size
+		self.change_threshold = change_threshold
+		self.threshold_tolerance = threshold_tolerance
+		self.max_changed = max_changed
+		self.refresh_interval = refresh_interval
+		self.fill = fill
+		self.kernel_size = kernel_size
+		self.iterations = iterations
+		self.lower_red_bounds = lower_red_bounds
+		self.upper_red_bounds = upper_red_bounds
+		#after opening and dilating, a pixel of the binary image depends on the pixels up to this far from it
+		self.reach = 3*(kernel_size//2)*iterations if fill else 0
+		self.reset()
+
+	def reset(self):
+		"""
+		Forgets the frames seen so far, so the next frame is segmented whole
+		"""
+		self.shape = None
+		self.frames = 0
+		self.full_updates = 0
+
+	def segment_frame(self, frame):
+		"""
+		Segments the whole of frame, starting over
+		"""
+		self.shape = frame.shape
+		self.reference = frame.copy()
+		red_img = ft.get_red(frame, self.lower_red_bounds, self.upper_red_bounds)
+		self.gray = cv2.extractChannel(red_img, 2)
+		self.histogram = get_histogram(self.gray)
+		self.threshold = otsu_threshold(self.histogram)
+		self.binary = cv2.threshold(self.gray, self.threshold, 255, cv2.THRESH_BINARY_INV)[1]
+		if self.fill:
+			self.binary = ft.get_filled_binary(self.binary, self.kernel_size, self.iterations, self.binary)
+		self.contours, self.bounds = get_inner_contours(self.binary)
+		tiles_shape = (-(-self.shape[0]//self.tile_size), -(-self.shape[1]//self.tile_size))
+		self.changed_tiles = np.ones(tiles_shape, dtype=bool)
+		self.full_updates += 1
+
+	def get_contours(self, frame):
+		"""
+		Returns list of contours of the red part of frame; same as ft.get_contours_hsv(ft.get_red(frame)), but
+		for the contours touching the border of the frame (see IncrementalSegmenter)
+		"""
+		self.frames += 1
+		if frame.shape != self.shape or (self.refresh_interval is not None and self.frames % self.refresh_interval == 0):
+			self.segment_frame(frame)
+			return self.contours
+
+		self.changed_tiles = get_tile_maxima(cv2.absdiff(frame, self.reference), self.tile_size) > self.change_threshold
+		if not self.changed_tiles.any():
+			return self.contours
+		if self.changed_tiles.mean() > self.max_changed:
+			self.segment_frame(frame)
+			return self.contours
+		windows = get_tile_windows(self.changed_tiles, self.tile_size, self.shape)
+
+		#red part of the windows, and of as much around them as the morphology of what is written back reaches
+		crops = []
+		for window in windows:
+			x0, y0, x1, y1 = window
+			crop_window = pad_window(window, 2*self.reach, self.shape)
+			cx0, cy0, cx1, cy1 = crop_window
+			red_img = ft.get_red(np.ascontiguousarray(frame[cy0:cy1,cx0:cx1]), self.lower_red_bounds, self.upper_red_bounds)
+			gray = cv2.extractChannel(red_img, 2)
+			self.histogram -= get_histogram(np.ascontiguousarray(self.gray[y0:y1,x0:x1]))
+			self.gray[y0:y1,x0:x1] = gray[y0-cy0:y1-cy0,x0-cx0:x1-cx0]
+			self.histogram += get_histogram(np.ascontiguousarray(self.gray[y0:y1,x0:x1]))
+			self.reference[y0:y1,x0:x1] = frame[y0:y1,x0:x1]
+			crops.append((window, crop_window, gray))
+
+		if abs(otsu_threshold(self.histogram) - self.threshold) > self.threshold_tolerance:
+			self.segment_frame(frame)
+			return self.contours
+
+		dirty_windows = []
+		for window, (cx0, cy0, cx1, cy1), gray in crops:
+			binary_img = cv2.threshold(gray, self.threshold, 255, cv2.THRESH_BINARY_INV)[1]
+			if self.fill:
+				binary_img = ft.get_filled_binary(binary_img, self.kernel_size, self.iterations, binary_img)
+			x0, y0, x1, y1 = pad_window(window, self.reach, self.shape)
+			self.binary[y0:y1,x0:x1] = binary_img[y0-cy0:y1-cy0,x0-cx0:x1-cx0]
+			dirty_windows.append((x0, y0, x1, y1))
+		self.update_contours(dirty_windows)
+		return self.contours
+
+	def update_contours(self, dirty_windows):
+		"""
+		Finds the contours again around the windows of the binary image that were written to
+		"""
+		#windows grow over the kept contours they touch, until they cut through none
+		windows = ft.merge_windows([pad_window(window, 2, self.shape) for window in dirty_windows])
+		kept = np.ones(len(self.contours), dtype=bool)
+		while True:
+			w = np.array(windows)
+			touching = kept & np.any((self.bounds[:,None,0] <= w[None,:,2]) & (self.bounds[:,None,2] >= w[None,:,0]) &
+				(self.bounds[:,None,1] <= w[None,:,3]) & (self.bounds[:,None,3] >= w[None,:,1]), axis=1)
+			if not touching.any(): break
+			kept &= ~touching
+			windows = ft.merge_windows(windows + [pad_window(bounds, 2, self.shape) for bounds in self.bounds[touching].tolist()])
+
+		contours = [contour for contour, keep in zip(self.contours, kept) if keep]
+		bounds = [self.bounds[kept]]
+		for window in windows:
+			window_contours, window_bounds = get_inner_contours(self.binary, window)
+			contours.extend(window_contours)
+			bounds.append(window_bounds)
+		self.contours = contours
+		self.bounds = np.vstack(bounds)
+
+	def get_ellipses(self, frame, min_radius=0):
+		"""
+		Returns list of ellipses on the red part of frame, selected from get_contours as in ft.get_ellipses_hsv
+		"""
+		return ft.select_ellipses(self.get_contours(frame), min_radius)
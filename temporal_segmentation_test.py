@@ -0,0 +1,89 @@
+import unittest
+import numpy as np
+import cv2
+import fingertip_tracking
+import profiling
+import temporal_segmentation as ts
+from synthetic_video import SyntheticVideo
+
+class Temporal_Segmentation_Test(unittest.TestCase):
+	def setUp(self):
+		self.video = SyntheticVideo(count=5, frame_count=20, resolution=(240,320), seed=3, occluders=2)
+		self.frames, self.ground_truth = self.video.get_frames()
+
+	def get_contour_set(self, contours):
+		return sorted(contour.ravel().tolist() for contour in contours)
+
+	def test_otsu_threshold_matches_cv2(self):
+		rng = np.random.RandomState(0)
+		images = [fingertip_tracking.get_red(frame)[:,:,2].copy() for frame in self.frames[::5]]
+		images += [rng.randint(0, 256, (30,40)).astype(np.uint8) for i in range(20)]
+		images += [((rng.rand(30,40) < .3)*rng.randint(100, 256)).astype(np.uint8) for i in range(20)]
+		images += [np.full((10,10), 7, np.uint8)]
+		for gray in images:
+			expected_threshold = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV+cv2.THRESH_OTSU)[0]
+			self.assertEqual(expected_threshold, ts.otsu_threshold(ts.get_histogram(gray)))
+
+	def test_get_tile_maxima(self):
+		img = np.random.RandomState(1).randint(0, 256, (50,70,3)).astype(np.uint8)
+		for tile_size in (10, 16):
+			maxima = ts.get_tile_maxima(img, tile_size)
+			self.assertEqual((-(-50//tile_size), -(-70//tile_size)), maxima.shape)
+			for (row, col), maximum in np.ndenumerate(maxima):
+				self.assertEqual(img[row*tile_size:(row+1)*tile_size, col*tile_size:(col+1)*tile_size].max(), maximum)
+
+	def test_get_tile_windows_cover_tiles(self):
+		tiles = np.zeros((5,6), dtype=bool)
+		tiles[0,0] = tiles[1,1] = tiles[3,4] = tiles[4,5] = True
+		self.assertEqual([(0,0,20,20),(40,30,55,45)], ts.get_tile_windows(tiles, 10, (45,55)))
+
+	def test_matches_whole_frame_segmentation(self):
+		#every frame segmented tile by tile, however many tiles changed
+		segmenter = ts.IncrementalSegmenter(change_threshold=0, max_changed=1, refresh_interval=None)
+		for frame in self.frames:
+			contours = segmenter.get_contours(frame)
+			binary_img = fingertip_tracking.get_filled_binary(fingertip_tracking.get_thresholded_hsv(fingertip_tracking.get_red(frame)))
+			np.testing.assert_array_equal(binary_img, segmenter.binary)
+			self.assertEqual(self.get_contour_set(ts.get_inner_contours(binary_img)[0]), self.get_contour_set(contours))
+		self.assertEqual(1, segmenter.full_updates)
+
+	def test_unchanged_frame_reuses_contours(self):
+		segmenter = ts.IncrementalSegmenter()
+		contours = segmenter.get_contours(self.frames[0])
+		self.assertTrue(contours is segmenter.get_contours(self.frames[0].copy()))
+		self.assertFalse(segmenter.changed_tiles.any())
+
+	def test_threshold_change_segments_whole_frame(self):
+		#red in two shades, split between them until a patch of background makes it split off the background
+		frame = np.zeros((240,320,3), np.uint8)
+		frame[:] = (0,0,200)
+		frame[120:] = (0,0,150)
+		segmenter = ts.IncrementalSegmenter(max_changed=1, refresh_interval=None)
+		segmenter.get_contours(frame)
+		self.assertEqual(150, segmenter.threshold)
+		frame[:120,:40] = (40,120,40)
+		segmenter.get_contours(frame)
+		self.assertEqual(2, segmenter.full_updates)
+		self.assertEqual(0, segmenter.threshold)
+
+	def test_refresh_interval(self):
+		segmenter = ts.IncrementalSegmenter(max_changed=1, refresh_interval=5)
+		for frame in self.frames[:10]:
+			segmenter.get_contours(frame)
+		self.assertEqual(3, segmenter.full_updates)
+
+	def test_track_ellipses_with_segmenter(self):
+		expected_results = list(fingertip_tracking.track_ellipses(self.frames))
+		actual_results = list(fingertip_tracking.track_ellipses(self.frames, context=ts.IncrementalSegmenter()))
+		self.assertEqual(expected_results, actual_results)
+		#arguments the segmenter would leave unused
+		for kwargs in ({'processes': 2}, {'pyramid_levels': 1}, {'profiler': profiling.Profiler()}):
+			with self.assertRaises(ValueError):
+				list(fingertip_tracking.track_ellipses(self.frames, context=ts.IncrementalSegmenter(), **kwargs))
+		profiler = profiling.Profiler()
+		context = fingertip_tracking.FrameContext(profiler=profiler)
+		self.assertEqual(expected_results, list(fingertip_tracking.track_ellipses(self.frames, context=context, profiler=profiler)))
+		self.assertEqual(len(self.frames), profiler.histograms['red'].count)
+
+if __name__ == '__main__':
+	unittest.main()
\ No newline at end of file
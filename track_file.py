@@ -0,0 +1,257 @@
+import os
+import json
+import numpy as np
+import fingertip_tracking as ft
+from ellipse import ellipses_to_array, array_to_ellipses
+
+#columns of a track file, one row per tracked ellipse; float32 holds the output of cv2.fitEllipse exactly
+COLUMNS = (
+	('frame', np.dtype('<i4')),
+	('track_id', np.dtype('<i4')),
+	('cx', np.dtype('<f4')),
+	('cy', np.dtype('<f4')),
+	('major', np.dtype('<f4')),
+	('minor', np.dtype('<f4')),
+	('angle', np.dtype('<f4')),
+	('fit_error', np.dtype('<f4')),
+)
+VERSION = 1
+
+def get_column_filename(path, name):
+	return os.path.join(path, name + '.bin')
+
+class TrackWriter(object):
+	"""
+	Streams tracked ellipses to a track file: a directory with one flat binary file per column, a frame
+	index of row offsets and, once closed, a track index of the rows each track spans
+
+	Rows are appended frame by frame, and the frame index is written after the rows it covers, so a file
+	that was not closed (e.g. while tracking is still running) can be read up to its last complete frame.
+	Frames must be written in increasing order; frames that are skipped are stored as empty
+	"""
+	def __init__(self, path):
+		"""
+		Args:
+			path: directory to write the track file to; created if missing, and overwritten if it holds a track file
+		"""
+		self.path = path
+		if not os.path.isdir(path):
+			os.makedirs(path)
+		with open(os.path.join(path, 'header.json'), 'w') as header:
+			json.dump({'version': VERSION, 'columns': [(name, dtype.str) for name, dtype in COLUMNS]}, header)
+		if os.path.exists(os.path.join(path, 'tracks.bin')):
+			os.remove(os.path.join(path, 'tracks.bin'))
+		self.files = [open(get_column_filename(path, name), 'wb') for name, dtype in COLUMNS]
+		self.index = open(os.path.join(path, 'index.bin'), 'wb')
+		self.index.write(np.zeros(1, '<i8').tobytes())
+
+		self.row_count = 0
+		self.frame_count = 0
+		#track id -> [first row, last row, row count]
+		self.tracks = {}
+
+	def append(self, frame_index, ellipse_dict, fit_errors=None):
+		"""
+		Appends the tracked ellipses of a frame
+
+		Args:
+			frame_index: index of the frame, at least the index of the last frame appended plus one
+			ellipse_dict: map of ellipses to ids on the frame, as the tracking functions give them (None keys are skipped)
+			fit_errors: optional map of ellipses to their fit_error, stored as nan otherwise
+		"""
+		pairs = [(e,i) for e,i in ellipse_dict.items() if e is not None]
+		errors = None if fit_errors is None else [fit_errors.get(e, np.nan) for e,i in pairs]
+		self.append_rows(np.full(len(pairs), frame_index, dtype=int), [i for e,i in pairs], [e for e,i in pairs],
+			errors, frame_index)
+
+	def append_rows(self, frames, track_ids, ellipses, fit_errors=None, last_frame=None):
+		"""
+		Appends tracked ellipses of any number of frames at once, e.g. the result of offline_tracking.track_offline
+
+		Args:
+			frames: array of the frame of every ellipse, in increasing order
+			track_ids: array of the track id of every ellipse
+			ellipses: list of ellipses or N x 5 array (see ellipses_to_array)
+			fit_errors: optional array of the fit_error of every ellipse, stored as nan otherwise
+			last_frame: last frame the rows cover, defaults to the frame of the last row
+		"""
+		frames = np.asarray(frames, dtype=int)
+		if last_frame is None:
+			if len(frames) == 0: return
+			last_frame = frames[-1]
+		if (len(frames) and frames[0] < self.frame_count) or last_frame < self.frame_count:
+			raise ValueError("frames must be appended in increasing order, after frame %d" % (self.frame_count - 1))
+		rows = np.zeros(len(frames), dtype=[(name, dtype) for name, dtype in COLUMNS])
+		rows['frame'] = frames
+		rows['track_id'] = track_ids
+		for name, values in zip(('cx','cy','major','minor','angle'), ellipses_to_array(ellipses).T):
+			rows[name] = values
+		rows['fit_error'] = np.nan if fit_errors is None else fit_errors
+
+		for (name, dtype), column_file in zip(COLUMNS, self.files):
+			column_file.write(rows[name].tobytes())
+			column_file.flush()
+		self.update_tracks(rows['track_id'])
+
+		#offset of the end of every frame; frames without rows end where the previous frame does
+		offsets = self.row_count + np.searchsorted(frames, np.arange(self.frame_count, last_frame + 1), side='right')
+		self.index.write(offsets.astype('<i8').tobytes())
+		self.index.flush()
+		self.row_count += len(rows)
+		self.frame_count = last_frame + 1
+
+	def update_tracks(self, track_ids):
+		"""
+		Updates the track index with the track ids of the rows being appended
+		"""
+		unique_ids, first_rows, counts = np.unique(track_ids, return_index=True, return_counts=True)
+		last_rows = len(track_ids) - 1 - np.unique(track_ids[::-1], return_index=True)[1]
+		for track_id, first_row, last_row, count in zip(unique_ids.tolist(), (first_rows + self.row_count).tolist(),
+				(last_rows + self.row_count).tolist(), counts.tolist()):
+			track = self.tracks.setdefault(track_id, [first_row, last_row, 0])
+			track[1] = last_row
+			track[2] += count
+
+	def consume(self, frame_index, frame, ellipse_dict):
+		"""
+		Appends the tracked ellipses of a frame, without fit errors; consumer for ft.track_ellipses
+		"""
+		self.append(frame_index, ellipse_dict)
+
+	def close(self):
+		"""
+		Writes the track index and closes the files
+		"""
+		tracks = np.array([[track_id] + track for track_id, track in sorted(self.tracks.items())], dtype='<i8').reshape(-1,4)
+		with open(os.path.join(self.path, 'tracks.bin'), 'wb') as tracks_file:
+			tracks_file.write(tracks.tobytes())
+		for column_file in self.files + [self.index]:
+			column_file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+class TrackFile(object):
+	"""
+	Read access to a track file (see TrackWriter), memory mapped so that only the rows read are loaded
+
+	The columns are available as read-only arrays, e.g. track_file.columns['cx'], and every method returns
+	views of them (or copies of only the rows asked for), whatever the size of the file
+	"""
+	def __init__(self, path):
+		"""
+		Args:
+			path: directory of the track file
+		"""
+		self.path = path
+		with open(os.path.join(path, 'header.json')) as header:
+			header = json.load(header)
+		if header['version'] != VERSION:
+			raise ValueError("unsupported track file version %s" % header['version'])
+
+		self.offsets = self.map(os.path.join(path, 'index.bin'), np.dtype('<i8'))
+		self.row_count = int(self.offsets[-1])
+		self.columns = dict((name, self.map(get_column_filename(path, name), np.dtype(dtype), self.row_count))
+			for name, dtype in header['columns'])
+
+		#track id, first row, last row, row count, if the writer was closed
+		tracks_filename = os.path.join(path, 'tracks.bin')
+		self.tracks = self.map(tracks_filename, np.dtype('<i8')).reshape(-1,4) if os.path.exists(tracks_filename) else None
+
+	@staticmethod
+	def map(filename, dtype, count=None):
+		"""
+		Returns read-only memory map of the first count values (all values if None) of a binary file
+		"""
+		if count is None:
+			count = os.path.getsize(filename) // dtype.itemsize
+		if count == 0:
+			return np.zeros(0, dtype)
+		return np.memmap(filename, dtype, mode='r', shape=(count,))
+
+	def __len__(self):
+		return self.row_count
+
+	@property
+	def frame_count(self):
+		return len(self.offsets) - 1
+
+	def get_frame_rows(self, start, stop=None):
+		"""
+		Returns slice of the rows of frames start to stop (exclusive), or of frame start only if stop is None
+		"""
+		if stop is None:
+			stop = start + 1
+		start = min(max(start, 0), self.frame_count)
+		stop = min(max(stop, start), self.frame_count)
+		return slice(int(self.offsets[start]), int(self.offsets[stop]))
+
+	def read_frames(self, start, stop=None):
+		"""
+		Returns map of column names to (memory mapped) arrays of the rows of frames start to stop (exclusive)
+		"""
+		rows = self.get_frame_rows(start, stop)
+		return dict((name, column[rows]) for name, column in self.columns.items())
+
+	def get_track_rows(self, track_id):
+		"""
+		Returns array of the rows of the track with track_id, in frame order
+		"""
+		if self.tracks is not None:
+			index = np.searchsorted(self.tracks[:,0], track_id)
+			if index == len(self.tracks) or self.tracks[index,0] != track_id:
+				return np.zeros(0, dtype=int)
+			first_row, last_row = self.tracks[index,1:3]
+		else:
+			first_row, last_row = 0, self.row_count - 1
+		#only the rows the track spans are scanned
+		return first_row + np.flatnonzero(self.columns['track_id'][first_row:last_row+1] == track_id)
+
+	def read_track(self, track_id):
+		"""
+		Returns map of column names to arrays of the rows of the track with track_id
+		"""
+		rows = self.get_track_rows(track_id)
+		return dict((name, np.asarray(column[rows])) for name, column in self.columns.items())
+
+	def get_track_ids(self):
+		"""
+		Returns sorted array of the ids of all tracks
+		"""
+		if self.tracks is not None:
+			return np.asarray(self.tracks[:,0])
+		return np.unique(self.columns['track_id'])
+
+	def get_ellipse_dict(self, frame_index):
+		"""
+		Returns map of ellipses to ids on a frame, as the tracking functions give them
+		"""
+		rows = self.read_frames(frame_index)
+		ellipses = array_to_ellipses(np.column_stack([rows[name] for name in ('cx','cy','major','minor','angle')]))
+		return dict(zip(ellipses, rows['track_id'].tolist()))
+
+def record_tracks(source, path, **kwargs):
+	"""
+	Tracks ellipses through source with ft.track_ellipses, streaming them to a track file rather than keeping them
+
+	The fit_error of every ellipse is stored when detection runs in this thread, in a ft.FrameContext (or a
+	context with fit_errors like it); ellipses detected in processes, and those a motion model predicts
+	rather than detects, are stored with nan
+
+	Args:
+		source: video, list of images or directory of images (see ft.iterate_frames)
+		path: directory to write the track file to
+		kwargs: other arguments of ft.track_ellipses
+	Returns:
+		TrackFile of the tracked ellipses
+	"""
+	if kwargs.get('processes', 0) == 0 and kwargs.get('context') is None:
+		kwargs['context'] = ft.FrameContext(profiler=kwargs.get('profiler'), pyramid_levels=kwargs.pop('pyramid_levels', 0))
+	fit_errors = getattr(kwargs.get('context'), 'fit_errors', None)
+	with TrackWriter(path) as writer:
+		consumer = lambda frame_index, frame, ellipse_dict: writer.append(frame_index, ellipse_dict, fit_errors)
+		for frame_index, ellipse_dict in ft.track_ellipses(source, consumer=consumer, **kwargs): pass
+	return TrackFile(path)
\ No newline at end of file
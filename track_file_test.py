@@ -0,0 +1,82 @@
+import unittest
+import shutil
+import tempfile
+import numpy as np
+import cv2
+import fingertip_tracking
+import offline_tracking
+import track_file
+
+class Track_File_Test(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.frames = []
+		for i in range(12):
+			frame = np.zeros((120,160,3), np.uint8)
+			frame[:] = (40,120,40)
+			cv2.ellipse(frame, ((30+2*i,40),(24,14),10*i), (0,0,255), -1)
+			if i < 8:
+				cv2.ellipse(frame, ((110-3*i,80+i),(18,26),0), (0,0,255), -1)
+			self.frames.append(frame)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_record_tracks_matches_track_ellipses(self):
+		expected_dicts = [d for i, d in fingertip_tracking.track_ellipses(self.frames)]
+		tracks = track_file.record_tracks(self.frames, self.directory)
+		self.assertEqual(12, tracks.frame_count)
+		self.assertEqual(20, len(tracks))
+		for i, expected_dict in enumerate(expected_dicts):
+			expected_dict = dict((e,t) for e,t in expected_dict.items() if e is not None)
+			self.assertEqual(expected_dict, tracks.get_ellipse_dict(i))
+
+	def test_read_frames_and_tracks(self):
+		tracks = track_file.record_tracks(self.frames, self.directory)
+		rows = tracks.read_frames(6, 10)
+		self.assertEqual([6,6,7,7,8,9], rows['frame'].tolist())
+		self.assertIsInstance(rows['cx'], np.memmap)
+		self.assertEqual([0,1], tracks.get_track_ids().tolist())
+		track = tracks.read_track(tracks.columns['track_id'][-1])
+		self.assertEqual(range(12), track['frame'].tolist())
+		self.assertEqual(0, len(tracks.read_track(5)['frame']))
+
+	def test_record_tracks_fit_errors(self):
+		tracks = track_file.record_tracks(self.frames, self.directory)
+		for frame_index in range(tracks.frame_count):
+			rows = tracks.read_frames(frame_index)
+			ellipses = fingertip_tracking.array_to_ellipses(np.column_stack([rows[name] for name in ('cx','cy','major','minor','angle')]))
+			fit_errors = {}
+			fingertip_tracking.select_ellipses(fingertip_tracking.get_contours_hsv(fingertip_tracking.get_red(self.frames[frame_index])),
+				fit_errors=fit_errors)
+			np.testing.assert_allclose([fit_errors[e] for e in ellipses], rows['fit_error'], rtol=1e-6)
+		#ellipses detected in processes have no fit_error
+		tracks = track_file.record_tracks(self.frames, self.directory + '/processes', processes=2)
+		self.assertTrue(np.all(np.isnan(tracks.columns['fit_error'])))
+
+	def test_read_unclosed_file(self):
+		writer = track_file.TrackWriter(self.directory)
+		writer.append(0, {((1.,2.),(3.,4.),5.): 0})
+		writer.append(3, {((1.5,2.),(3.,4.),5.): 0, ((9.,9.),(3.,4.),5.): 1}, {((9.,9.),(3.,4.),5.): .25})
+		tracks = track_file.TrackFile(self.directory)
+		self.assertEqual(4, tracks.frame_count)
+		self.assertEqual({}, tracks.get_ellipse_dict(2))
+		self.assertEqual([0,3], tracks.read_track(0)['frame'].tolist())
+		self.assertEqual([.25], tracks.read_track(1)['fit_error'].tolist())
+		self.assertRaises(ValueError, writer.append, 2, {})
+		writer.close()
+		tracks = track_file.TrackFile(self.directory)
+		self.assertEqual([0,1], tracks.tracks[:,0].tolist())
+		self.assertEqual([2,1], tracks.tracks[:,3].tolist())
+		self.assertEqual([0,3], tracks.read_track(0)['frame'].tolist())
+
+	def test_append_rows_offline_tracks(self):
+		detections, ids = offline_tracking.track_offline(self.frames, processes=0)
+		with track_file.TrackWriter(self.directory) as writer:
+			writer.append_rows(detections[:,offline_tracking.FRAME], ids, detections[:,1:], last_frame=len(self.frames) - 1)
+		tracks = track_file.TrackFile(self.directory)
+		for i, expected_dict in enumerate(offline_tracking.get_ellipse_dicts(detections, ids, len(self.frames))):
+			self.assertEqual(expected_dict, tracks.get_ellipse_dict(i))
+
+if __name__ == '__main__':
+	unittest.main()
\ No newline at end of file
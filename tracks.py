@@ -0,0 +1,258 @@
+import numpy as np
+import correspondence_tracking as ct
+from ellipse import ellipses_to_array, array_to_ellipses, ellipse_difference_matrix
+
+def match_ellipses(old, new, max_displacement=None, a=1, b=1, c=1):
+	"""
+	Matches two arrays of ellipses as ct.transition matches ellipses, but by row rather than by ellipse tuple
+
+	Args:
+		old: N x 5 array of ellipses (see ellipses_to_array)
+		new: M x 5 array of ellipses
+		max_displacement: optional maximum distance between the centers of matched ellipses (see
+			ct.get_gated_correspondence)
+		a, b, c: weights of ellipse_difference
+	Returns:
+		arrays of the rows of old and of new that are matched to each other
+	"""
+	#number new rows after old rows, so that rows of both arrays can be told apart
+	n = len(old)
+	both = np.vstack((old, new))
+	def matrix_function(indices1, indices2):
+		return ellipse_difference_matrix(both[indices1], both[indices2], a, b, c)
+	if max_displacement is None:
+		pairs = ct.get_best_correspondence(range(n), range(n, len(both)), None, matrix_function)
+	else:
+		pairs = ct.get_gated_correspondence(range(n), range(n, len(both)), None,
+			lambda i: both[i,:2], max_displacement, matrix_function)
+	matches = [(i,j-n) for i,j in pairs if i is not None and j is not None]
+	return np.array([i for i,j in matches], dtype=int), np.array([j for i,j in matches], dtype=int)
+
+#track states
+TENTATIVE = 0
+CONFIRMED = 1
+COASTING = 2
+
+class TrackStore(object):
+	"""
+	Persistent tracks of ellipses, stored as contiguous arrays with one row per track
+
+	Each track keeps its id, current ellipse parameters (center x, center y, major axis, minor axis, angle),
+	age and hit/miss counts in frames, the last frame it was seen in, its state and a bitmask of the frames
+	it was seen in. Ids are looked up in O(1) through a map from id to row, the arrays grow by doubling, and
+	retired tracks are removed in bulk by compact. Ids are never reused.
+
+	A new track is tentative until it has been seen in confirm_hits of the last confirm_window frames, and is
+	retired if that does not happen within its first confirm_window frames. A confirmed track that is missed
+	coasts on its last ellipse, still available for matching, and is retired after more than max_misses
+	misses in a row. The defaults confirm tracks at once and retire them on their first miss, as ct.transition
+	does.
+	"""
+	columns = ('ids', 'ellipses', 'ages', 'hits', 'misses', 'last_seen', 'alive', 'states', 'history')
+
+	def __init__(self, capacity=16, confirm_hits=1, confirm_window=1, max_misses=0):
+		"""
+		Args:
+			capacity: number of tracks to allocate room for
+			confirm_hits: number of frames a tentative track must be seen in to be confirmed
+			confirm_window: number of frames (at most 32) confirm_hits are counted over
+			max_misses: number of frames in a row a confirmed track may coast before it is retired
+		"""
+		if not 1 <= confirm_hits <= confirm_window <= 32:
+			raise ValueError("need 1 <= confirm_hits <= confirm_window <= 32")
+		self.confirm_hits = confirm_hits
+		self.confirm_window = confirm_window
+		self.max_misses = max_misses
+		self.window_mask = np.uint32(2**confirm_window - 1)
+
+		self.size = 0
+		self.next_id = 0
+		self.rows = {}
+		self.ids = np.zeros(0, int)
+		self.ellipses = np.zeros((0,5))
+		self.ages = np.zeros(0, int)
+		self.hits = np.zeros(0, int)
+		self.misses = np.zeros(0, int)
+		self.last_seen = np.zeros(0, int)
+		self.alive = np.zeros(0, bool)
+		self.states = np.zeros(0, np.int8)
+		self.history = np.zeros(0, np.uint32)
+		self.allocate(capacity)
+
+	def allocate(self, capacity):
+		"""
+		Moves the tracks into arrays with room for capacity tracks
+		"""
+		for name in self.columns:
+			array = getattr(self, name)
+			new_array = np.zeros((capacity,) + array.shape[1:], array.dtype)
+			new_array[:self.size] = array[:self.size]
+			setattr(self, name, new_array)
+
+	def __len__(self):
+		return int(np.count_nonzero(self.alive[:self.size]))
+
+	def add(self, ellipses, frame_index):
+		"""
+		Starts a new track for every ellipse
+
+		Args:
+			ellipses: list of ellipses or N x 5 array (see ellipses_to_array)
+			frame_index: frame the ellipses were seen in
+		Returns:
+			array of the ids of the new tracks
+		"""
+		ellipses = ellipses_to_array(ellipses)
+		count = len(ellipses)
+		if self.size + count > len(self.ids):
+			capacity = max(len(self.ids), 1)
+			while capacity < self.size + count:
+				capacity *= 2
+			self.allocate(capacity)
+
+		new = slice(self.size, self.size + count)
+		ids = np.arange(self.next_id, self.next_id + count)
+		self.ids[new] = ids
+		self.ellipses[new] = ellipses
+		self.ages[new] = 0
+		self.hits[new] = 1
+		self.misses[new] = 0
+		self.last_seen[new] = frame_index
+		self.alive[new] = True
+		self.states[new] = CONFIRMED if self.confirm_hits == 1 else TENTATIVE
+		self.history[new] = 1
+		self.rows.update(zip(ids.tolist(), range(self.size, self.size + count)))
+
+		self.size += count
+		self.next_id += count
+		return ids
+
+	def get_rows(self, ids):
+		"""
+		Returns array of the rows of the tracks with ids
+		"""
+		return np.array([self.rows[i] for i in ids], dtype=int)
+
+	def get_ellipse(self, track_id):
+		"""
+		Returns the current ellipse of the track with track_id
+		"""
+		cx, cy, major, minor, angle = self.ellipses[self.rows[track_id]].tolist()
+		return ((cx,cy),(major,minor),angle)
+
+	def set_ellipses(self, ids, ellipses):
+		"""
+		Replaces the current ellipses of the tracks with ids, e.g. by the predictions of a motion model
+		"""
+		self.ellipses[self.get_rows(ids)] = ellipses_to_array(ellipses)
+
+	def get_alive_rows(self, states=None):
+		"""
+		Returns array of the rows of the tracks that have not been retired, optionally only those in states
+		"""
+		alive = self.alive[:self.size]
+		if states is not None:
+			alive = alive & np.in1d(self.states[:self.size], states)
+		return np.flatnonzero(alive)
+
+	def get_window_hits(self, rows):
+		"""
+		Returns array of the number of frames of the last confirm_window the tracks in rows were seen in
+		"""
+		bits = np.unpackbits(self.history[rows].astype('>u4').view(np.uint8).reshape(-1,4), axis=1)
+		return bits.sum(axis=1)
+
+	def hit(self, rows, ellipses, frame_index):
+		"""
+		Records that the tracks in rows were seen as ellipses in frame frame_index
+		"""
+		self.ellipses[rows] = ellipses_to_array(ellipses)
+		self.hits[rows] += 1
+		self.misses[rows] = 0
+		self.last_seen[rows] = frame_index
+		self.history[rows] = ((self.history[rows] << 1) | 1) & self.window_mask
+		states = self.states[rows]
+		confirmed = (states == COASTING) | ((states == TENTATIVE) & (self.get_window_hits(rows) >= self.confirm_hits))
+		self.states[rows[confirmed]] = CONFIRMED
+
+	def miss(self, rows):
+		"""
+		Records that the tracks in rows were not seen in a frame; confirmed tracks start coasting
+		"""
+		self.misses[rows] += 1
+		self.history[rows] = (self.history[rows] << 1) & self.window_mask
+		self.states[rows[self.states[rows] == CONFIRMED]] = COASTING
+
+	def retire_expired(self, rows):
+		"""
+		Retires the tracks in rows that were not confirmed within confirm_window frames or coasted for more
+		than max_misses frames
+		"""
+		states = self.states[rows]
+		unconfirmed = (states == TENTATIVE) & (self.ages[rows] + 1 >= self.confirm_window)
+		lost = (states == COASTING) & (self.misses[rows] > self.max_misses)
+		self.retire(rows[unconfirmed | lost])
+
+	def retire(self, rows):
+		"""
+		Marks the tracks in rows as finished; they are removed by the next compact
+		"""
+		self.alive[rows] = False
+
+	def compact(self):
+		"""
+		Removes all retired tracks in one pass, keeping the remaining tracks in order
+		"""
+		keep = np.flatnonzero(self.alive[:self.size])
+		for name in self.columns:
+			array = getattr(self, name)
+			array[:len(keep)] = array[keep]
+		self.size = len(keep)
+		self.rows = dict(zip(self.ids[:self.size].tolist(), range(self.size)))
+
+	def step(self, ellipses, frame_index, max_displacement=None, a=1, b=1, c=1):
+		"""
+		Matches the ellipses of a new frame to the live tracks, as ct.transition does for ellipse-keyed maps
+
+		Matched tracks take on their new ellipse, tracks without a match are missed, and ellipses without
+		a match start new tracks. Every live track ages by one frame and is then retired if it expired (see
+		TrackStore). Retired tracks are compacted away once they outnumber the live ones. All bookkeeping is
+		done with array operations over the tracks.
+
+		Args:
+			ellipses: list of ellipses found on the new frame
+			frame_index: index of the new frame
+			max_displacement: optional maximum distance between the centers of matched ellipses (see
+				ct.get_gated_correspondence)
+			a, b, c: weights of ellipse_difference
+		Returns:
+			map of the ellipses to the ids of the confirmed tracks seen in this frame (see as_dict)
+		"""
+		if self.size > 2*len(self):
+			self.compact()
+		alive = self.get_alive_rows()
+		old = self.ellipses[alive]
+		new = ellipses_to_array(ellipses)
+		self.ages[alive] += 1
+
+		matched_old, matched_new = match_ellipses(old, new, max_displacement, a, b, c)
+		self.hit(alive[matched_old], new[matched_new], frame_index)
+		unmatched_old = np.setdiff1d(np.arange(len(old)), matched_old)
+		self.miss(alive[unmatched_old])
+		self.retire_expired(alive)
+		self.add(new[np.setdiff1d(np.arange(len(new)), matched_new)], frame_index)
+
+		return self.as_dict((CONFIRMED,), frame_index)
+
+	def as_dict(self, states=None, frame_index=None):
+		"""
+		Returns map of the current ellipse of every live track to its id, the format used by ct.transition
+
+		Args:
+			states: optional states of the tracks to include
+			frame_index: optional frame the included tracks must have been seen in
+		"""
+		rows = self.get_alive_rows(states)
+		if frame_index is not None:
+			rows = rows[self.last_seen[rows] == frame_index]
+		return dict(zip(array_to_ellipses(self.ellipses[rows]), self.ids[rows].tolist()))
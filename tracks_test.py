@@ -0,0 +1,139 @@
+import unittest
+import numpy as np
+import fingertip_tracking
+import motion_model
+import tracks
+
+class Tracks_Test(unittest.TestCase):
+	def setUp(self):
+		self.tracks = tracks.TrackStore(capacity=1)
+
+	def moving_ellipses(self, t, count=3):
+		return [((100.+5*t+40*i, 50.+i), (20.,12.), 30.) for i in range(count)]
+
+	def test_step_keeps_ids(self):
+		ids = []
+		for t in range(8):
+			ellipses = self.moving_ellipses(t)
+			current_dict = self.tracks.step(ellipses, t)
+			ids.append([current_dict[e] for e in ellipses])
+		self.assertEqual([[0,1,2]]*8, ids)
+		self.assertEqual([8,8,8], self.tracks.hits[:3].tolist())
+		self.assertEqual([7,7,7], self.tracks.last_seen[:3].tolist())
+
+	def test_add_grows_capacity(self):
+		ids = self.tracks.add(self.moving_ellipses(0, 5), 0)
+		self.assertEqual(range(5), ids.tolist())
+		self.assertEqual(8, len(self.tracks.ids))
+		self.assertEqual(5, len(self.tracks))
+		self.assertEqual(self.moving_ellipses(0, 5)[3], self.tracks.get_ellipse(3))
+
+	def test_lost_track_gets_new_id(self):
+		self.tracks.step(self.moving_ellipses(0), 0)
+		ellipses = self.moving_ellipses(1)
+		current_dict = self.tracks.step(ellipses[1:], 1)
+		self.assertEqual({ellipses[1]: 1, ellipses[2]: 2}, current_dict)
+		current_dict = self.tracks.step(ellipses, 2)
+		self.assertEqual({ellipses[0]: 3, ellipses[1]: 1, ellipses[2]: 2}, current_dict)
+
+	def test_compact_keeps_ids(self):
+		ellipses = self.moving_ellipses(0, 4)
+		self.tracks.add(ellipses, 0)
+		self.tracks.retire(self.tracks.get_rows([0,2]))
+		expected_dict = self.tracks.as_dict()
+		self.tracks.compact()
+		self.assertEqual(2, self.tracks.size)
+		self.assertEqual(expected_dict, self.tracks.as_dict())
+		self.assertEqual({ellipses[1]: 1, ellipses[3]: 3}, expected_dict)
+		self.assertEqual(ellipses[3], self.tracks.get_ellipse(3))
+
+	def test_step_gated_matches_ungated(self):
+		gated_tracks = tracks.TrackStore()
+		for t in range(5):
+			ellipses = self.moving_ellipses(t)
+			self.assertEqual(self.tracks.step(ellipses, t), gated_tracks.step(ellipses, t, max_displacement=20))
+
+	def test_tentative_track_confirmed_after_n_of_m(self):
+		lifecycle_tracks = tracks.TrackStore(confirm_hits=2, confirm_window=3)
+		ellipses = self.moving_ellipses(0, 1)
+		self.assertEqual({}, lifecycle_tracks.step(ellipses, 0))
+		self.assertEqual({}, lifecycle_tracks.step([], 1))
+		self.assertEqual(tracks.TENTATIVE, lifecycle_tracks.states[0])
+		ellipses = self.moving_ellipses(2, 1)
+		self.assertEqual({ellipses[0]: 0}, lifecycle_tracks.step(ellipses, 2))
+		self.assertEqual(tracks.CONFIRMED, lifecycle_tracks.states[0])
+
+	def test_tentative_track_retired_unconfirmed(self):
+		lifecycle_tracks = tracks.TrackStore(confirm_hits=2, confirm_window=2)
+		lifecycle_tracks.step(self.moving_ellipses(0, 1), 0)
+		lifecycle_tracks.step([], 1)
+		self.assertEqual(0, len(lifecycle_tracks))
+		ellipses = self.moving_ellipses(2, 1)
+		lifecycle_tracks.step(ellipses, 2)
+		self.assertEqual({ellipses[0]: 1}, lifecycle_tracks.as_dict())
+
+	def test_confirmed_track_coasts_then_retires(self):
+		lifecycle_tracks = tracks.TrackStore(max_misses=2)
+		lifecycle_tracks.step(self.moving_ellipses(0), 0)
+		ellipses = self.moving_ellipses(1)
+		self.assertEqual({ellipses[1]: 1, ellipses[2]: 2}, lifecycle_tracks.step(ellipses[1:], 1))
+		self.assertEqual([tracks.COASTING, tracks.CONFIRMED, tracks.CONFIRMED], lifecycle_tracks.states[:3].tolist())
+		ellipses = self.moving_ellipses(2)
+		self.assertEqual({ellipses[0]: 0, ellipses[1]: 1, ellipses[2]: 2}, lifecycle_tracks.step(ellipses, 2))
+		for t in range(3, 6):
+			lifecycle_tracks.step(self.moving_ellipses(t)[1:], t)
+		self.assertEqual([1,2], sorted(lifecycle_tracks.as_dict().values()))
+
+	def test_lifecycle_bookkeeping_many_tracks(self):
+		lifecycle_tracks = tracks.TrackStore(confirm_hits=2, confirm_window=3, max_misses=1)
+		rng = np.random.RandomState(0)
+		ellipses = [((float(x),float(y)), (20.,12.), 30.) for x,y in rng.uniform(0,4000,(300,2))]
+		for t in range(4):
+			seen = [e for i,e in enumerate(ellipses) if i % 3 != t % 3]
+			lifecycle_tracks.step(seen, t, max_displacement=20)
+		alive = lifecycle_tracks.get_alive_rows()
+		self.assertEqual(300, len(alive))
+		self.assertEqual(range(300), sorted(lifecycle_tracks.ids[alive].tolist()))
+		self.assertTrue(np.all(lifecycle_tracks.states[alive] != tracks.TENTATIVE))
+
+	def test_next_track_dict_coasts_through_dropout(self):
+		lifecycle_tracks = tracks.TrackStore(max_misses=2)
+		kalman_filter = motion_model.EllipseKalmanFilter()
+		ids = []
+		for t in range(8):
+			ellipses = self.moving_ellipses(t)
+			if t == 4:
+				ellipses = ellipses[1:]
+			current_dict = fingertip_tracking.next_track_dict(lifecycle_tracks, t, ellipses, kalman_filter)
+			ids.append(sorted(current_dict.values()))
+		self.assertEqual([[0,1,2]]*4 + [[1,2]] + [[0,1,2]]*3, ids)
+
+	def test_next_track_dict_keeps_motion_of_tentative_tracks(self):
+		#a track missed while still tentative keeps its velocity in the motion model
+		lifecycle_tracks = tracks.TrackStore(confirm_hits=3, confirm_window=4)
+		kalman_filter = motion_model.EllipseKalmanFilter()
+		for t in range(3):
+			ellipses = self.moving_ellipses(t, count=1) if t != 1 else []
+			fingertip_tracking.next_track_dict(lifecycle_tracks, t, ellipses, kalman_filter)
+			self.assertEqual([0], kalman_filter.ids.tolist())
+		self.assertEqual(tracks.TENTATIVE, lifecycle_tracks.states[0])
+		self.assertGreater(kalman_filter.velocities[0,0], 0)
+
+	def test_invalid_confirmation(self):
+		self.assertRaises(ValueError, tracks.TrackStore, confirm_hits=3, confirm_window=2)
+
+	def test_track_ellipses_matches_ellipse_dicts(self):
+		frames = [np.zeros((120,160,3), np.uint8) for t in range(6)]
+		for t, frame in enumerate(frames):
+			frame[:] = (40,120,40)
+			for center in [(30+4*t,40), (110-4*t,80)]:
+				fingertip_tracking.cv2.ellipse(frame, (center,(20,14),0), (0,0,255), -1)
+		expected_results = list(fingertip_tracking.track_ellipses(frames))
+		actual_results = list(fingertip_tracking.track_ellipses(frames, tracks=tracks.TrackStore()))
+		self.assertEqual(expected_results, actual_results)
+		actual_results = list(fingertip_tracking.track_ellipses(frames, motion_model=motion_model.EllipseKalmanFilter(),
+			tracks=tracks.TrackStore()))
+		self.assertEqual([sorted(d.values()) for i,d in expected_results], [sorted(d.values()) for i,d in actual_results])
+
+if __name__ == '__main__':
+	unittest.main()
\ No newline at end of file